@@ -0,0 +1,638 @@
+from collections import OrderedDict
+
+import numpy as np
+
+DETAIL_DURATION = 10
+
+def zoom_keys(hierarchy, duration):
+    """
+    Tiers drawn for a view of duration seconds, and the types only counted
+    under the deepest of them.  The lowest tier and every subannotation
+    tier are only drawn in views shorter than ``DETAIL_DURATION``.
+    """
+    keys = list(hierarchy.highest_to_lowest)
+    if duration < DETAIL_DURATION:
+        for k, v in sorted(hierarchy.subannotations.items()):
+            for s in v:
+                keys.append((k, s))
+        return keys, []
+    if len(keys) == 1:
+        return keys, []
+    return keys[:-1], [hierarchy.lowest]
+
+def _label(annotation):
+    try:
+        label = annotation.label
+    except AttributeError:
+        return ''
+    return '' if label is None else label
+
+class LabelTable(object):
+    """
+    Labels interned to integer ids, shared by every tier of a store so that
+    each distinct label is kept once
+    """
+    def __init__(self):
+        self.labels = ['']
+        self.ids = {'': 0}
+        self._array = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def intern(self, label):
+        try:
+            return self.ids[label]
+        except KeyError:
+            self.ids[label] = len(self.labels)
+            self.labels.append(label)
+            self._array = None
+            return self.ids[label]
+
+    def lookup(self, label_ids):
+        if self._array is None:
+            self._array = np.empty(len(self.labels), dtype = object)
+            self._array[:] = self.labels
+        return self._array[label_ids]
+
+def _find(annotations, annotation_id):
+    for a in annotations:
+        if a.id == annotation_id:
+            return a
+    return None
+
+def _column(values, dtype):
+    if dtype is not object:
+        return np.array(values, dtype = dtype)
+    column = np.empty(len(values), dtype = object)
+    for i, v in enumerate(values):
+        column[i] = v
+    return column
+
+class TierColumns(object):
+    """
+    One tier of an AnnotationStore as arrays sorted by begin time: ends,
+    interned label ids, channels, the row of each annotation's parent in the
+    tier above it (-1 for the highest tier), its position among its
+    parent's children and their number, and its id.  The running maximum of
+    the end times lets overlap queries binary search even when intervals
+    overlap (as subannotations may).
+    """
+    fields = ('begins', 'ends', 'label_ids', 'channels', 'parents', 'positions', 'counts', 'ids')
+    dtypes = (float, float, np.int32, np.int16, np.int32, np.int32, np.int32, object)
+
+    def __init__(self):
+        for f, dtype in zip(self.fields, self.dtypes):
+            setattr(self, f, np.zeros(0, dtype = dtype))
+        self.max_ends = np.zeros(0)
+        self._index = None
+
+    def __len__(self):
+        return self.begins.shape[0]
+
+    @property
+    def index(self):
+        """Row of each annotation id"""
+        if self._index is None:
+            self._index = dict(zip(self.ids.tolist(), range(len(self))))
+        return self._index
+
+    def update(self, rows = (), keep = None, parent_map = None):
+        """
+        Drop the rows not in ``keep`` (a boolean mask), map the parents of
+        the rest through ``parent_map`` (the new row of every previous row of
+        the parent tier, -1 for dropped ones, whose children are dropped
+        too), add rows (tuples of the fields, with parents as rows of the
+        updated parent tier) and sort again.  Returns the new row of every
+        previous row, -1 for dropped ones.
+        """
+        num_rows = len(self)
+        kept = np.arange(num_rows) if keep is None else np.flatnonzero(keep)
+        parents = self.parents[kept]
+        if parent_map is not None:
+            parents = parent_map[parents].astype(np.int32)
+            kept, parents = kept[parents >= 0], parents[parents >= 0]
+        columns = [parents if f == 'parents' else getattr(self, f)[kept] for f in self.fields]
+        if rows:
+            columns = [np.concatenate((c, _column(new, dtype)))
+                        for c, new, dtype in zip(columns, zip(*rows), self.dtypes)]
+        order = np.argsort(columns[0], kind = 'mergesort')
+        for f, c in zip(self.fields, columns):
+            setattr(self, f, c[order])
+        self.max_ends = np.maximum.accumulate(self.ends) if len(self) else np.zeros(0)
+        self._index = None
+        inverse = np.empty(len(order), dtype = np.int64)
+        inverse[order] = np.arange(len(order))
+        row_map = np.full(num_rows, -1, dtype = np.int64)
+        row_map[kept] = inverse[:len(kept)]
+        return row_map
+
+    def _candidates(self, begin, end, inclusive):
+        side = 'left' if inclusive else 'right'
+        start = np.searchsorted(self.max_ends, begin, side = side)
+        stop = np.searchsorted(self.begins, end, side = 'right' if inclusive else 'left')
+        return start, stop
+
+    def overlapping(self, begin, end, channel = None):
+        """Rows of the annotations overlapping begin to end"""
+        start, stop = self._candidates(begin, end, False)
+        mask = self.ends[start:stop] > begin
+        if channel is not None:
+            mask &= self.channels[start:stop] == channel
+        return np.arange(start, stop)[mask]
+
+    def at(self, time, channel = None):
+        """Row of the first annotation containing time, or None"""
+        start, stop = self._candidates(time, time, True)
+        mask = self.ends[start:stop] >= time
+        if channel is not None:
+            mask &= self.channels[start:stop] == channel
+        found = np.flatnonzero(mask)
+        if not len(found):
+            return None
+        return start + int(found[0])
+
+class AnnotationWindow(object):
+    """
+    Annotations of a discourse between begin and end fetched as columns:
+    for each tier key, a dict of 'begin', 'end', 'label', 'id', 'parent_id'
+    and 'channel' sequences, plus 'position' and 'count' among the parent's
+    children for subannotation tiers.  ``summaries`` holds, for types that
+    were only counted, the 'begin', 'end', 'id' and 'channel' of each
+    annotation of the deepest fetched tier and the 'count' of that type
+    under it.
+    """
+    def __init__(self, begin, end, tiers, summaries = None):
+        self.begin = begin
+        self.end = end
+        self.tiers = tiers
+        if summaries is None:
+            summaries = {}
+        self.summaries = summaries
+
+    def __len__(self):
+        return sum(len(v['id']) for v in self.tiers.values())
+
+class AnnotationStore(object):
+    """
+    Columnar copy of the annotations of a discourse, one TierColumns per
+    tier and subannotation tier, filled from annotation objects (``add``)
+    or from windows fetched as columns (``add_window``).  Drawing and
+    hit-testing only read the columns.  Annotation objects are
+    materialized by ``annotation`` when they are selected or edited, from
+    the highest annotations passed to ``add`` or else through ``loader``
+    (a function of a tier and an id), and ``sync`` writes edits to them
+    back to the columns.  ``summaries`` keeps, for tiers that were only
+    counted, a TierColumns of the annotations they were counted under with
+    the counts in place of the number of siblings.
+    """
+    def __init__(self, hierarchy, loader = None):
+        self.hierarchy = hierarchy
+        self.loader = loader
+        self.labels = LabelTable()
+        self.keys = list(hierarchy.highest_to_lowest)
+        for k, v in sorted(hierarchy.subannotations.items()):
+            for s in v:
+                self.keys.append((k, s))
+        self.tiers = {k: TierColumns() for k in self.keys}
+        self.summaries = {}
+        self.objects = {}
+        self.materialized = {}
+
+    def __len__(self):
+        return len(self.tiers[self.hierarchy.highest])
+
+    @property
+    def num_rows(self):
+        """Rows held across every tier, subannotation tier and summary"""
+        return sum(len(x) for x in self.tiers.values()) + \
+                sum(len(x) for x in self.summaries.values())
+
+    def parent_key(self, key):
+        if isinstance(key, tuple):
+            return key[0]
+        index = self.hierarchy.highest_to_lowest.index(key)
+        if index == 0:
+            return None
+        return self.hierarchy.highest_to_lowest[index - 1]
+
+    def _row(self, annotation, channel, parent_id, position = 0, count = 1):
+        return (annotation.begin, annotation.end, self.labels.intern(_label(annotation)),
+                channel, parent_id, position, count, annotation.id)
+
+    def _rows(self, annotations):
+        highest = self.hierarchy.highest
+        rows = {k: [] for k in self.keys}
+        for a in annotations:
+            channel = getattr(a, 'channel', 0)
+            elements = {highest: [a]}
+            rows[highest].append(self._row(a, channel, None))
+            parent_type = highest
+            for t in self.hierarchy.get_lower_types(highest):
+                elements[t] = getattr(a, t)
+                parents = elements[parent_type]
+                parent_begins = np.array([x.begin for x in parents], dtype = float)
+                for e in elements[t] if parents else []:
+                    parent = max(int(np.searchsorted(parent_begins, e.begin, side = 'right')) - 1, 0)
+                    rows[t].append(self._row(e, channel, parents[parent].id))
+                parent_type = t
+            for k in self.keys:
+                if not isinstance(k, tuple) or k[0] not in elements:
+                    continue
+                for e in elements[k[0]]:
+                    subs = getattr(e, k[1])
+                    rows[k].extend(self._row(sub, channel, e.id, i, len(subs))
+                                    for i, sub in enumerate(subs))
+        return rows
+
+    def _merge(self, rows, keep = None, changed = ()):
+        """
+        Add rows of each tier, skipping ids already there and rows whose
+        parent (given by id) is missing, drop the rows not in ``keep``
+        (boolean masks by tier) along with everything below them, and sort
+        the ``changed`` tiers again.  Returns whether any row moved or was
+        dropped, in which case rows taken from the store before are stale.
+        """
+        keep = keep or {}
+        row_maps = {}
+        for k in self.keys:
+            tier = self.tiers[k]
+            parent = self.parent_key(k)
+            parent_map = row_maps.get(parent)
+            new = rows.get(k, [])
+            if not new and k not in keep and parent_map is None and k not in changed:
+                continue
+            if k in keep:
+                seen = set(tier.ids[keep[k]].tolist())
+            else:
+                seen = tier.index
+            if parent is None:
+                new = [r[:4] + (-1,) + r[5:] for r in new if r[7] not in seen]
+            else:
+                lookup = self.tiers[parent].index
+                new = [r[:4] + (lookup[r[4]],) + r[5:] for r in new
+                        if r[7] not in seen and r[4] in lookup]
+            row_maps[k] = tier.update(new, keep.get(k), parent_map)
+        moved = any((m != np.arange(len(m))).any() for m in row_maps.values())
+        if keep:
+            highest = self.tiers[self.hierarchy.highest].index
+            self.objects = {k: v for k, v in self.objects.items() if k in highest}
+            self.materialized = {k: v for k, v in self.materialized.items()
+                                    if k[1] in self.tiers[k[0]].index}
+        return moved
+
+    def add(self, annotations):
+        """
+        Add annotations of the highest type, and everything below them,
+        skipping any that are already in the store
+        """
+        seen = self.tiers[self.hierarchy.highest].index
+        annotations = [x for x in annotations if x.id not in seen]
+        if not annotations:
+            return
+        for a in annotations:
+            self.objects[a.id] = a
+        self._merge(self._rows(annotations))
+
+    def add_window(self, window):
+        """Add the annotations of an AnnotationWindow"""
+        rows = {}
+        for k, columns in window.tiers.items():
+            if k not in self.tiers:
+                continue
+            num_rows = len(columns['id'])
+            labels = [self.labels.intern('' if x is None else x) for x in columns['label']]
+            rows[k] = list(zip(columns['begin'], columns['end'], labels, columns['channel'],
+                                columns['parent_id'], columns.get('position', [0] * num_rows),
+                                columns.get('count', [1] * num_rows), columns['id']))
+        self._merge(rows)
+        for k, columns in window.summaries.items():
+            tier = self.summaries.setdefault(k, TierColumns())
+            seen = tier.index
+            tier.update([(b, e, 0, channel, -1, 0, count, i) for b, e, channel, count, i
+                            in zip(columns['begin'], columns['end'], columns['channel'],
+                                    columns['count'], columns['id']) if i not in seen])
+
+    def keep(self, begin, end):
+        """
+        Drop the highest annotations outside begin to end, with everything
+        below them
+        """
+        highest = self.tiers[self.hierarchy.highest]
+        self._merge({}, keep = {self.hierarchy.highest: (highest.ends > begin) & (highest.begins < end)})
+        for tier in self.summaries.values():
+            tier.update(keep = (tier.ends > begin) & (tier.begins < end))
+
+    def root(self, key, row):
+        """Row of the highest annotation above a row of a tier"""
+        while key != self.hierarchy.highest:
+            row = self.tiers[key].parents[row]
+            key = self.parent_key(key)
+        return row
+
+    def annotation(self, key, row):
+        """Annotation object of a row of a tier"""
+        tier = self.tiers[key]
+        annotation_id = tier.ids[row]
+        annotation = self.materialized.get((key, annotation_id))
+        if annotation is not None:
+            return annotation
+        highest = self.hierarchy.highest
+        if key == highest:
+            annotation = self.objects.get(annotation_id)
+        elif isinstance(key, tuple):
+            parent = self.annotation(key[0], tier.parents[row])
+            if parent is not None:
+                annotation = _find(getattr(parent, key[1]), annotation_id)
+        else:
+            root = self.objects.get(self.tiers[highest].ids[self.root(key, row)])
+            if root is not None:
+                annotation = _find(getattr(root, key), annotation_id)
+        if annotation is None and self.loader is not None and not isinstance(key, tuple):
+            annotation = self.loader(key, annotation_id)
+        if annotation is not None:
+            self.materialized[key, annotation_id] = annotation
+        return annotation
+
+    def sync(self):
+        """
+        Write the times and labels of the materialized annotations, and the
+        subannotations of those that have them, back to the columns after
+        they have been edited.  Returns whether that moved or dropped any
+        rows.
+        """
+        rows = {}
+        keep = {}
+        changed = set()
+        for (key, annotation_id), annotation in self.materialized.items():
+            tier = self.tiers[key]
+            row = tier.index.get(annotation_id)
+            if row is None:
+                continue
+            tier.begins[row] = annotation.begin
+            tier.ends[row] = annotation.end
+            tier.label_ids[row] = self.labels.intern(_label(annotation))
+            changed.add(key)
+            if isinstance(key, tuple):
+                continue
+            for s in self.hierarchy.subannotations.get(key, []):
+                k = key, s
+                mask = keep.setdefault(k, np.ones(len(self.tiers[k]), dtype = bool))
+                mask &= self.tiers[k].parents != row
+                subs = getattr(annotation, s)
+                rows.setdefault(k, []).extend(self._row(sub, tier.channels[row], annotation_id, i, len(subs))
+                                            for i, sub in enumerate(subs))
+        return self._merge(rows, keep, changed)
+
+    def window(self, key, begin, end, channel = 0):
+        """
+        Begins, ends, labels, positions among their parent's children,
+        numbers of siblings and rows of the annotations of a tier that
+        overlap begin to end
+        """
+        tier = self.tiers[key]
+        rows = tier.overlapping(begin, end, channel)
+        return (tier.begins[rows], tier.ends[rows], self.labels.lookup(tier.label_ids[rows]),
+                tier.positions[rows], tier.counts[rows], rows)
+
+    def summary(self, key, begin, end, channel = 0):
+        """
+        Begins, ends and counts of a counted tier under the annotations
+        overlapping begin to end, or None if it has not been counted
+        """
+        if key not in self.summaries:
+            return None
+        tier = self.summaries[key]
+        rows = tier.overlapping(begin, end, channel)
+        return tier.begins[rows], tier.ends[rows], tier.counts[rows]
+
+class IndexedDiscourseModel(object):
+    """
+    Wraps the discourse inspector returned by ``inspect_discourse`` with an
+    AnnotationStore of the annotations it has loaded.  The store is built
+    the first time it is needed and extended with each window merged by
+    ``add_preceding`` or ``add_following``, either as annotation objects or
+    as an AnnotationWindow; ``refresh`` writes edits back to it.  Windows
+    fetched for a zoomed out view leave out the detail tiers (see
+    ``zoom_keys``), so the ranges over which those are loaded are tracked in
+    ``detail_ranges``.  ``evict`` keeps the number of rows loaded across all
+    tiers (see ``AnnotationStore.num_rows``) under ``max_rows``.  Everything
+    else is delegated to the inspector.
+
+    The corpus context the inspector queries through, if given, belongs to
+    the model and is closed by ``close`` once the model is dropped.
+    """
+    def __init__(self, discourse_model, hierarchy, max_rows = 50000, loader = None,
+                context = None):
+        self.discourse_model = discourse_model
+        self.hierarchy = hierarchy
+        self.max_rows = max_rows
+        self.loader = loader
+        self.context = context
+        self.detail_ranges = []
+        self._store = None
+
+    def __getattr__(self, name):
+        return getattr(self.discourse_model, name)
+
+    def close(self):
+        if self.context is None:
+            return
+        context, self.context = self.context, None
+        try:
+            context.__exit__(None, None, None)
+        except Exception:
+            pass
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = AnnotationStore(self.hierarchy, self.loader)
+            self._store.add(self.discourse_model.cache)
+            self._add_detail(self.discourse_model.cache)
+        return self._store
+
+    def detail_keys(self):
+        drawn, _ = zoom_keys(self.hierarchy, np.inf)
+        return [k for k in self.store.keys if k not in drawn]
+
+    def _add_detail(self, begin, end = None):
+        """
+        Mark the detail tiers as loaded between begin and end, or over the
+        range of a list of annotation objects
+        """
+        if end is None:
+            if not begin:
+                return
+            begin, end = min(x.begin for x in begin), max(x.end for x in begin)
+        ranges = sorted(self.detail_ranges + [(begin, end)])
+        merged = [ranges[0]]
+        for b, e in ranges[1:]:
+            if b <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+            else:
+                merged.append((b, e))
+        self.detail_ranges = merged
+
+    def uncovered_detail(self, begin, end):
+        """
+        Smallest range within begin to end that holds every time at which
+        the detail tiers are not loaded, or None if they are loaded over all
+        of it
+        """
+        for b, e in self.detail_ranges:
+            if b <= begin < e:
+                begin = e
+        for b, e in reversed(self.detail_ranges):
+            if b < end <= e:
+                end = b
+        if end <= begin:
+            return None
+        return begin, end
+
+    def refresh(self):
+        """Sync edits to the store; returns whether its rows moved"""
+        if self._store is None:
+            return False
+        return self._store.sync()
+
+    def evict(self, begin, end):
+        """
+        Drop the loaded annotations that end before begin or start after end
+        once the store holds more than ``max_rows`` rows, narrowing the
+        cached range of the inspector to what is left so that the dropped
+        windows are fetched again if the view returns to them.  Returns
+        whether anything was dropped.
+        """
+        store = self.store
+        if store.num_rows <= self.max_rows:
+            return False
+        highest = store.tiers[self.hierarchy.highest]
+        kept = (highest.ends > begin) & (highest.begins < end)
+        if not kept.any() or kept.all():
+            return False
+        self.discourse_model.cache = [x for x in self.discourse_model.cache
+                                        if x.end > begin and x.begin < end]
+        self.discourse_model.cached_begin = max(self.cached_begin, highest.begins[kept].min())
+        self.discourse_model.cached_end = min(self.cached_end, highest.ends[kept].max())
+        self.discourse_model.fully_cached = False
+        store.keep(begin, end)
+        self.detail_ranges = [(max(b, self.cached_begin), min(e, self.cached_end))
+                                for b, e in self.detail_ranges
+                                if e > self.cached_begin and b < self.cached_end]
+        return True
+
+    def add_window(self, window):
+        """
+        Merge an AnnotationWindow into the store, extend the cached range
+        of the inspector over it if it holds the highest tier, and the
+        detail ranges if it holds the detail tiers
+        """
+        self.store.add_window(window)
+        model = self.discourse_model
+        begin = max(window.begin, 0)
+        end = min(window.end, model.max_time)
+        if all(k in window.tiers for k in self.detail_keys()):
+            self._add_detail(begin, end)
+        if self.hierarchy.highest not in window.tiers:
+            return
+        if model.cached_begin is None or begin < model.cached_begin:
+            model.cached_begin = begin
+        if model.cached_end is None or end > model.cached_end:
+            model.cached_end = end
+        if model.cached_to_begin and model.cached_to_end:
+            model.fully_cached = True
+
+    def replace_window(self, window):
+        """
+        Drop all loaded annotations and load an AnnotationWindow in their
+        place, for a view that jumped far from the cached range
+        """
+        model = self.discourse_model
+        self.store.keep(window.begin, window.end)
+        model.cache = []
+        model.cached_begin = None
+        model.cached_end = None
+        model.fully_cached = False
+        self.detail_ranges = []
+        self.add_window(window)
+
+    def add_preceding(self, results):
+        if isinstance(results, AnnotationWindow):
+            self.add_window(results)
+            return
+        self.discourse_model.add_preceding(results)
+        if self._store is not None:
+            self._store.add(results)
+            self._add_detail(results)
+
+    def add_following(self, results):
+        if isinstance(results, AnnotationWindow):
+            self.add_window(results)
+            return
+        self.discourse_model.add_following(results)
+        if self._store is not None:
+            self._store.add(results)
+            self._add_detail(results)
+
+    def annotations(self, begin = None, end = None, channel = 0):
+        if begin is None:
+            begin = -np.inf
+        if end is None:
+            end = np.inf
+        store = self.store
+        rows = store.tiers[self.hierarchy.highest].overlapping(begin, end, channel)
+        return [store.annotation(self.hierarchy.highest, i) for i in rows]
+
+    def find_annotation(self, key, time, channel = 0):
+        store = self.store
+        if key not in store.tiers:
+            return None
+        row = store.tiers[key].at(time, channel)
+        if row is None:
+            return None
+        return store.annotation(key, row)
+
+def covers(discourse_model, begin, end):
+    """
+    Whether the annotations loaded into a discourse inspector cover begin to
+    end
+    """
+    return (discourse_model.cached_to_begin or discourse_model.cached_begin <= begin) and \
+            (discourse_model.cached_to_end or end <= discourse_model.cached_end)
+
+class DiscourseCache(object):
+    """
+    Least recently used cache of the discourse models (and the audio
+    loaded for them) that have been viewed, keyed by corpus and discourse
+    name, so that going back to a discourse within the range it has loaded
+    does not query it again.  Models are closed when they are evicted.
+    """
+    def __init__(self, max_discourses = 4):
+        self.max_discourses = max_discourses
+        self.discourses = OrderedDict()
+
+    def clear(self):
+        for discourse_model, audio in self.discourses.values():
+            discourse_model.close()
+        self.discourses = OrderedDict()
+
+    def put(self, corpus_name, discourse_model, audio = None):
+        key = (corpus_name, discourse_model.name)
+        previous = self.discourses.pop(key, None)
+        if previous is not None and previous[0] is not discourse_model:
+            previous[0].close()
+        self.discourses[key] = (discourse_model, audio)
+        while len(self.discourses) > self.max_discourses:
+            key, (evicted, audio) = self.discourses.popitem(last = False)
+            evicted.close()
+
+    def get(self, corpus_name, name, begin, end):
+        key = (corpus_name, name)
+        if key not in self.discourses:
+            return None
+        discourse_model, audio = self.discourses[key]
+        if not covers(discourse_model, begin, end):
+            return None
+        self.discourses.move_to_end(key)
+        return discourse_model, audio
@@ -0,0 +1,166 @@
+from functools import partial
+
+import numpy as np
+
+from .pool import get_context_pool
+
+from .discourse import AnnotationWindow, IndexedDiscourseModel, zoom_keys
+
+def speaker_channel(c, discourse, speaker, channels):
+    """Channel of a discourse that a speaker is recorded on, memoized in channels"""
+    if speaker not in channels:
+        channels[speaker] = 0
+        if speaker is not None:
+            for x in c.census[speaker].discourses:
+                if x.discourse.name == discourse and x.channel is not None:
+                    channels[speaker] = x.channel
+    return channels[speaker]
+
+def _subannotation_columns(results, s, tier):
+    columns = {'begin': [], 'end': [], 'label': [], 'id': [], 'parent_id': [],
+                'channel': [], 'position': [], 'count': []}
+    for x, parent_id, channel in zip(results, tier['id'], tier['channel']):
+        subs = [y for y in zip(x[s + '_begin'] or [], x[s + '_end'] or [],
+                                x[s + '_label'] or [], x[s + '_id'] or []) if y[3] is not None]
+        for i, (begin, end, label, sub_id) in enumerate(subs):
+            columns['begin'].append(begin)
+            columns['end'].append(end)
+            columns['label'].append(label)
+            columns['id'].append(sub_id)
+            columns['parent_id'].append(parent_id)
+            columns['channel'].append(channel)
+            columns['position'].append(i)
+            columns['count'].append(len(subs))
+    return columns
+
+def annotation_window(c, discourse, begin, end, keys = None, counted = ()):
+    """
+    Fetch the annotations of the tiers of a discourse that overlap begin to
+    end as an AnnotationWindow.  Each tier is one query projecting only the
+    begin, end, label, id, parent id and speaker of its annotations (and the
+    same of their subannotations), rather than the highest annotations with
+    every lower type preloaded as nodes.
+
+    Only the tiers in ``keys`` are fetched (all of them if None).  For each
+    type in ``counted``, the number of annotations of that type under each
+    annotation of the deepest fetched tier is fetched in their place.
+    """
+    hierarchy = c.hierarchy
+    if keys is None:
+        keys, _ = zoom_keys(hierarchy, 0)
+    channels = {}
+    tiers = {}
+    summaries = {}
+    parent = None
+    deepest = None
+    for t in hierarchy.highest_to_lowest:
+        subannotations = [s for s in hierarchy.subannotations.get(t, []) if (t, s) in keys]
+        if t in keys:
+            deepest = t
+        if t not in keys and not subannotations:
+            parent = t
+            continue
+        a = getattr(c, t)
+        columns = [a.begin.column_name('begin'), a.end.column_name('end'),
+                    a.label.column_name('label'), a.id.column_name('id'),
+                    a.speaker.name.column_name('speaker')]
+        if parent is not None:
+            columns.append(getattr(a, parent).id.column_name('parent_id'))
+        for s in subannotations:
+            sub = getattr(a, s)
+            columns.extend([sub.begin.column_name(s + '_begin'), sub.end.column_name(s + '_end'),
+                            sub.label.column_name(s + '_label'), sub.id.column_name(s + '_id')])
+        if t == deepest:
+            columns.extend(getattr(a, x).count.column_name(x + '_count') for x in counted)
+        results = _window_query(c, a, discourse, begin, end, columns)
+        tier = _tier_columns(c, discourse, results, parent is not None, channels)
+        if t in keys:
+            tiers[t] = tier
+        for s in subannotations:
+            tiers[t, s] = _subannotation_columns(results, s, tier)
+        if t == deepest:
+            for x in counted:
+                summaries[x] = {'begin': tier['begin'], 'end': tier['end'], 'id': tier['id'],
+                                'channel': tier['channel'],
+                                'count': np.array([r[x + '_count'] for r in results], dtype = int)}
+        parent = t
+    return AnnotationWindow(begin, end, tiers, summaries)
+
+def _window_query(c, a, discourse, begin, end, columns):
+    q = c.query_graph(a)
+    q = q.filter(a.discourse.name == discourse)
+    q = q.filter(a.begin < end)
+    q = q.filter(a.end > begin)
+    q = q.columns(*columns)
+    q = q.order_by(a.begin)
+    return [x for x in q.all()]
+
+def _tier_columns(c, discourse, results, has_parent, channels):
+    return {'begin': np.array([x['begin'] for x in results], dtype = float),
+            'end': np.array([x['end'] for x in results], dtype = float),
+            'label': [x['label'] for x in results],
+            'id': [x['id'] for x in results],
+            'parent_id': [x['parent_id'] if has_parent else None for x in results],
+            'channel': np.array([speaker_channel(c, discourse, x['speaker'], channels)
+                                    for x in results], dtype = int)}
+
+def load_annotation(c, a_type, annotation_id):
+    """
+    Fetch one annotation, with its subannotations, when it is selected or
+    edited in a view filled from columns
+    """
+    a = getattr(c, a_type)
+    q = c.query_graph(a)
+    q = q.filter(a.id == annotation_id)
+    preloads = [getattr(a, s) for s in c.hierarchy.subannotations.get(a_type, [])]
+    if preloads:
+        q = q.preload(*preloads)
+    results = [x for x in q.all()]
+    if not results:
+        return None
+    return results[0]
+
+def _track_columns(track):
+    if track is None or len(track) == 0:
+        return np.zeros((0, 2))
+    return np.asarray(track, dtype = float).reshape(-1, 2)
+
+def track_window(c, discourse, begin, end, channel = 0):
+    """
+    Pitch track and formant tracks (by formant) of a discourse between begin
+    and end, as Nx2 arrays of times and values, fetched once for a window
+    around the view and sliced for each view with ``track_slice``
+    """
+    inspector = c.inspect_discourse(discourse, begin, begin)
+    pitch = _track_columns(inspector.pitch_from_begin(begin = begin, end = end, channel = channel))
+    pitch[:, 0] += begin
+    formants = inspector.formants_from_begin(begin = begin, end = end, channel = channel)
+    if formants is not None:
+        formants = {k: _track_columns(v) for k, v in formants.items()}
+        for track in formants.values():
+            track[:, 0] += begin
+    return pitch, formants
+
+def inspect_window(c, config, discourse, begin, end, columnar = True):
+    """
+    Discourse model of a discourse with the annotations between begin and
+    end loaded, either fetched as columns (only the tiers drawn at the zoom
+    of a view of that range) or, if not columnar, as the preloaded
+    annotation objects of ``inspect_discourse``.
+
+    The inspector, and the annotations it loads later, keep using c after
+    the caller is done with it, so c (if pooled) is detached from the pool
+    rather than handed to other threads, and belongs to the model, whose
+    ``close`` closes it.
+    """
+    get_context_pool().detach(config, c)
+    loader = partial(load_annotation, c)
+    if not columnar:
+        return IndexedDiscourseModel(c.inspect_discourse(discourse, begin, end), c.hierarchy,
+                                    loader = loader, context = c)
+    # The inspector is opened on an empty range, and the window fetched as columns
+    discourse_model = IndexedDiscourseModel(c.inspect_discourse(discourse, begin, begin),
+                                    c.hierarchy, loader = loader, context = c)
+    keys, counted = zoom_keys(c.hierarchy, end - begin)
+    discourse_model.add_window(annotation_window(c, discourse, begin, end, keys, counted))
+    return discourse_model
@@ -28,6 +28,8 @@ from .helper import get_system_font_height
 
 from .progress import ProgressWidget
 
+from .pool import corpus_context, get_context_pool
+
 from .workers import (AcousticAnalysisWorker, ImportCorpusWorker,
                     PauseEncodingWorker, UtteranceEncodingWorker,
                     SpeechRateWorker, UtterancePositionWorker,
@@ -59,6 +61,7 @@ class LeftPane(Pane):
         self.queryWidget.needsShrinking.connect(self.growLower)
         self.viewWidget.needsShrinking.connect(self.growUpper)
         self.queryWidget.viewRequested.connect(self.changeDiscourse)
+        self.queryWidget.prefetchRequested.connect(self.viewWidget.prefetchContexts)
 
         self.splitter = CollapsibleWidgetPair(QtCore.Qt.Vertical, self.queryWidget, self.viewWidget, collapsible = 0)
 
@@ -181,6 +184,9 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.queryWorker = QueryWorker()
         self.queryWorker.dataReady.connect(self.leftPane.queryWidget.updateResults)
+        self.queryWorker.pageReady.connect(self.leftPane.queryWidget.addResultsPage)
+        self.queryWorker.finishedCancelling.connect(self.leftPane.queryWidget.finishResults)
+        self.queryWorker.errorEncountered.connect(self.leftPane.queryWidget.finishResults)
         self.queryWorker.errorEncountered.connect(self.showError)
         self.queryWorker.errorEncountered.connect(self.leftPane.queryWidget.queryForm.finishQuery)
         self.queryWorker.dataReady.connect(self.leftPane.queryWidget.queryForm.finishQuery)
@@ -259,6 +265,7 @@ class MainWindow(QtWidgets.QMainWindow):
         kwargs = {}
         kwargs['config'] = self.corpusConfig
         kwargs['profile'] = query_profile
+        kwargs['streaming'] = True
 
         self.queryWorker.setParams(kwargs)
         self.progressWidget.createProgressBar('query', self.queryWorker)
@@ -320,7 +327,7 @@ class MainWindow(QtWidgets.QMainWindow):
             if not c_name:
                 c_name = 'No corpus selected'
             else:
-                with CorpusContext(self.corpusConfig) as c:
+                with corpus_context(self.corpusConfig) as c:
                     self.pausesAct.setEnabled(True)
                     self.encodeHierarchicalPropertiesAct.setEnabled(True)
                     self.enrichLexiconAct.setEnabled(True)
@@ -369,6 +376,7 @@ class MainWindow(QtWidgets.QMainWindow):
         if self.corpusConfig is not None:
             with open(sct_config_pickle_path, 'wb') as f:
                 pickle.dump(self.corpusConfig, f)
+        get_context_pool().close_all()
         super(MainWindow, self).closeEvent(event)
 
     def createActions(self):
@@ -18,15 +18,31 @@ def make_safe(data):
 class QueryResultsModel(QtCore.QAbstractTableModel):
     SortRole = 999
     def __init__(self, results, parent = None):
-        if len(results) > 0:
-            self.columns = [x for x in results[0].properties if x not in ['id']] + ['discourse', 'speaker']
-        else:
-            self.columns = ['label', 'begin', 'end', 'discourse', 'speaker']
+        self.columns = self.columns_from_results(results)
         self.rows = results
         QtCore.QAbstractTableModel.__init__(self, parent)
 
         self.destroyed.connect(self.reset)
 
+    def columns_from_results(self, results):
+        if len(results) > 0:
+            return [x for x in results[0].properties if x not in ['id']] + ['discourse', 'speaker']
+        return ['label', 'begin', 'end', 'discourse', 'speaker']
+
+    def addRows(self, results):
+        if not results:
+            return
+        if not self.rows:
+            self.beginResetModel()
+            self.columns = self.columns_from_results(results)
+            self.rows.extend(results)
+            self.endResetModel()
+            return
+        first = len(self.rows)
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(results) - 1)
+        self.rows.extend(results)
+        self.endInsertRows()
+
     def rowCount(self, parent = None):
         return len(self.rows)
 
@@ -1,3 +1,5 @@
+from functools import partial
+
 import numpy as np
 
 max_sig = 1
@@ -28,155 +30,231 @@ def get_histogram_mesh_data(data, bins=100, color='k', orientation='h'):
     tris[1::2] = tri_2 + offsets
     return (rr, tris)
 
-def generate_boundaries(annotations, hierarchy, min_time, max_time):
-    num_types = len(hierarchy.keys())
-    lowest = hierarchy.lowest
-    size = max_sig / (num_types)
-    line_outputs = {x: [] for x in hierarchy.keys()}
-    text_pos = {x: [] for x in hierarchy.keys()}
-    text_labels = {x: [] for x in hierarchy.keys()}
+class VertexMap(object):
+    """
+    Rows of the annotations drawn by consecutive groups of
+    ``vertices_per_annotation`` line vertices of a tier.  The first half of
+    each group draws the begin boundary and the second half the end
+    boundary.  Annotation objects are only materialized (by calling
+    ``materialize`` with a row) when one is asked for.
+    """
+    def __init__(self, rows, vertices_per_annotation, materialize = None):
+        self.rows = rows
+        self.vertices_per_annotation = vertices_per_annotation
+        self.materialize = materialize
+
+    def __len__(self):
+        return len(self.rows)
+
+    def row(self, index):
+        if index < 0 or index // self.vertices_per_annotation >= len(self.rows):
+            return None
+        return int(self.rows[index // self.vertices_per_annotation])
+
+    def annotation(self, index):
+        row = self.row(index)
+        if row is None or self.materialize is None:
+            return None
+        return self.materialize(row)
+
+    def is_begin(self, index):
+        return index % self.vertices_per_annotation < self.vertices_per_annotation // 2
+
+    def boundary_vertices(self, index):
+        """
+        Range of the vertices drawing the same boundary as vertex index
+        """
+        half = self.vertices_per_annotation // 2
+        start = index - index % self.vertices_per_annotation
+        if not self.is_begin(index):
+            start += half
+        return start, start + half
+
+def tier_keys(hierarchy):
     subannotation_keys = []
     for k,v in hierarchy.subannotations.items():
         for s in v:
-            line_outputs[k,s] = []
-            text_pos[k,s] = []
-            text_labels[k,s] = []
             subannotation_keys.append((k,s))
     subannotation_keys.sort()
+    return list(hierarchy.highest_to_lowest), subannotation_keys
+
+def tier_geometry(begins, ends, vert_min, vert_max):
+    num = begins.shape[0]
+    lines = np.empty((num, 4, 2), dtype = np.float32)
+    lines[:, 0:2, 0] = begins[:, None]
+    lines[:, 2:4, 0] = ends[:, None]
+    lines[:, 0::2, 1] = vert_min
+    lines[:, 1::2, 1] = vert_max
+    text_pos = np.empty((num, 2), dtype = np.float32)
+    text_pos[:, 0] = (ends - begins) / 2 + begins
+    text_pos[:, 1] = (vert_max - vert_min) / 2 + vert_min
+    return lines.reshape(-1, 2), text_pos
+
+def subannotation_geometry(begins, ends, positions, counts, ind, sub_size, min_time, max_time):
+    vis_mid = (max_time - min_time) /2 + min_time
+    rel_sub_size = sub_size / np.maximum(counts, 1)
+    vert_min = 0 - sub_size * (ind + 1) + rel_sub_size * positions
+    vert_max = vert_min + rel_sub_size
+    num = begins.shape[0]
+    lines = np.empty((num, 6, 2), dtype = np.float32)
+    lines[:, 0:3, 0] = begins[:, None]
+    lines[:, 3:6, 0] = ends[:, None]
+    lines[:, :, 1] = vert_min[:, None]
+    lines[:, 1, 1] = vert_max
+    lines[:, 5, 1] = vert_max
+    midpoints = ((ends - begins) / 2) + begins
+    midpoints[(midpoints > max_time) | (midpoints < min_time)] = vis_mid
+    text_pos = np.empty((num, 2), dtype = np.float32)
+    text_pos[:, 0] = midpoints
+    text_pos[:, 1] = (vert_max - vert_min) / 2 + vert_min
+    return lines.reshape(-1, 2), text_pos
+
+def generate_boundaries(store, hierarchy, min_time, max_time, channel = 0):
+    """
+    Generate line vertices and label positions for each tier (and each
+    subannotation tier) of the annotations in an AnnotationStore that
+    overlap min_time to max_time, as float32 arrays, along with a VertexMap
+    of the rows drawn by each group of vertices.  Text outputs are labels,
+    label positions and annotation durations (for culling labels that do
+    not fit).
+    """
+    num_types = len(hierarchy.keys())
+    lowest = hierarchy.lowest
+    size = max_sig / (num_types)
+    keys, subannotation_keys = tier_keys(hierarchy)
 
     try:
         sub_size = max_sig/len(subannotation_keys)
     except ZeroDivisionError:
         sub_size = max_sig
-    subannotation_keys = {s: i for i, s in enumerate(subannotation_keys)}
-    cur = 0
-    main_vert_min = max_sig - size
-    main_vert_max = max_sig
-    main_vert_mid = (main_vert_max - main_vert_min)/2 + main_vert_min
-
-    vis_mid = (max_time - min_time) /2 + min_time
-
-    for a in annotations:
-        #if a.end < min_time:
-        #    continue
-        #if a.begin > max_time:
-        #    continue
-        end = a.end
-        begin = a.begin
-        midpoint = ((end - begin) / 2) + begin
-        #if midpoint > max_time or midpoint < min_time:
-        #    midpoint = vis_mid
-        text = a.label
-        if text is None:
-            text = ''
-        text_labels[a._type].append(text)
-        text_pos[a._type].append((midpoint, main_vert_mid))
-
-        line_outputs[a._type].append([begin,main_vert_min])
-        line_outputs[a._type].append([begin,main_vert_max])
-        line_outputs[a._type].append([end,main_vert_min])
-        line_outputs[a._type].append([end,main_vert_max])
-        if a._type in hierarchy.subannotations:
-            for stype in hierarchy.subannotations[a._type]:
-                subs = getattr(a, stype)
-                ind = subannotation_keys[a._type,stype]
-                lines, text_poses, texts = generate_subannotation_lines(subs,
-                                                ind, sub_size, min_time, max_time)
-                line_outputs[a._type, stype].extend(lines)
-                text_pos[a._type, stype].extend(text_poses)
-                text_labels[a._type, stype].extend(texts)
-
-        for i, t in enumerate(hierarchy.get_lower_types(a._type)):
-            elements = getattr(a, t)
-            i += 1
-            if t == lowest:
-                vert_min = 0
-                vert_max = size
-            else:
-                vert_min = max_sig - size * (i+1)
-                vert_max = vert_min + size
-            vert_mid = (vert_max - vert_min)/2 + vert_min
-            for e in elements:
-                end = e.end
-                begin = e.begin
-                if end < min_time:
-                    continue
-                if begin > max_time:
-                    continue
-                midpoint = ((end - begin) /2) + begin
-                #if (midpoint > max_time or midpoint < min_time) and (begin < min_time and end > max_time):
-                #    midpoint = vis_mid
-                text = e.label
-                if text is None:
-                    text = ''
-                text_labels[t].append(text)
-                text_pos[t].append((midpoint, vert_mid))
-
-                line_outputs[t].append([begin,vert_min])
-                line_outputs[t].append([begin,vert_max])
-                line_outputs[t].append([end,vert_min])
-                line_outputs[t].append([end,vert_max])
-                if t in hierarchy.subannotations:
-                    for stype in hierarchy.subannotations[t]:
-                        subs = getattr(e, stype)
-                        ind = subannotation_keys[t,stype]
-                        lines, text_poses, texts = generate_subannotation_lines(subs,
-                                                ind, sub_size, min_time, max_time)
-                        line_outputs[t, stype].extend(lines)
-                        text_pos[t, stype].extend(text_poses)
-                        text_labels[t, stype].extend(texts)
 
+    line_outputs = {}
     text_outputs = {}
-    for t in hierarchy.highest_to_lowest:
-        line_outputs[t] = np.array(line_outputs[t])
-        text_outputs[t] = (text_labels[t], np.array(text_pos[t]))
-    for k in subannotation_keys.keys():
-        line_outputs[k] = np.array(line_outputs[k])
-        text_outputs[k] = (text_labels[k], np.array(text_pos[k]))
+    annotation_outputs = {}
+    for i, t in enumerate(keys):
+        begins, ends, labels, _, _, rows = store.window(t, min_time, max_time, channel)
+        if i == 0:
+            vert_min = max_sig - size
+            vert_max = max_sig
+        elif t == lowest:
+            vert_min = 0
+            vert_max = size
+        else:
+            vert_min = max_sig - size * (i+1)
+            vert_max = vert_min + size
+        lines, text_pos = tier_geometry(begins, ends, vert_min, vert_max)
+        line_outputs[t] = lines
+        text_outputs[t] = (labels.tolist(), text_pos, (ends - begins).astype(np.float32))
+        annotation_outputs[t] = VertexMap(rows, 4, partial(store.annotation, t))
+
+    for ind, k in enumerate(subannotation_keys):
+        begins, ends, labels, positions, counts, rows = store.window(k, min_time, max_time, channel)
+        lines, text_pos = subannotation_geometry(begins, ends, positions, counts,
+                                ind, sub_size, min_time, max_time)
+        line_outputs[k] = lines
+        text_outputs[k] = (labels.tolist(), text_pos, (ends - begins).astype(np.float32))
+        annotation_outputs[k] = VertexMap(rows, 6, partial(store.annotation, k))
 
-    return line_outputs, text_outputs
+    return line_outputs, text_outputs, annotation_outputs
 
 
 def rescale(value, oldmax, newmax):
     return value * newmax/oldmax
 
-def generate_subannotation_lines(subs, ind, sub_size, min_time, max_time):
-    vis_mid = (max_time - min_time) /2 + min_time
-    output = []
-    text_output = []
-    text_labels = []
-    if len(subs) > 1:
-        rel_sub_size = sub_size / len(subs)
-    else:
-        rel_sub_size = sub_size
-    for i,s in enumerate(subs):
-        sub_vert_min = 0 - sub_size * (ind + 1) + rel_sub_size * i
-        sub_vert_max = sub_vert_min + rel_sub_size
-        sub_vert_mid = (sub_vert_max - sub_vert_min)/2 + sub_vert_min
-        end = s.end
-        begin = s.begin
-        if end < min_time:
-            continue
-        if begin > max_time:
-            break
-        midpoint = ((end - begin) / 2) + begin
-        if midpoint > max_time or midpoint < min_time:
-            midpoint = vis_mid
-        text = s.label
-        if text is None:
-            text = ''
-        text_output.append((midpoint, sub_vert_mid))
-        try:
-            text = s.label
-        except AttributeError:
-            text = None
-        if text is None:
-            text = ''
-        text_labels.append(text)
-        output.append([begin,sub_vert_min])
-        output.append([begin,sub_vert_max])
-        output.append([begin, sub_vert_min])
-        output.append([end, sub_vert_min])
-        output.append([end,sub_vert_min])
-        output.append([end,sub_vert_max])
-    return output, text_output, text_labels
+class BoundaryIndex(object):
+    """
+    Times of the vertical boundary segments among a tier's line vertices,
+    sorted so that the boundary nearest to a time can be found with a
+    binary search
+    """
+    def __init__(self, pos, vertex_map = None):
+        pos = np.asarray(pos)
+        starts = np.arange(0, pos.shape[0] - 1, 2)
+        starts = starts[pos[starts, 0] == pos[starts + 1, 0]]
+        times = pos[starts, 0]
+        order = np.argsort(times, kind = 'mergesort')
+        self.times = times[order]
+        self.indices = starts[order]
+        self.vertex_map = vertex_map
+
+    def annotation(self, index):
+        if self.vertex_map is None:
+            return None
+        return self.vertex_map.annotation(index)
+
+    def nearest(self, time, radius):
+        """
+        Vertex index of the boundary closest to time (the first in vertex
+        order if several share its time) and the annotation it belongs to,
+        or -1 and None if there is none within radius
+        """
+        if not len(self.times):
+            return -1, None
+        i = np.searchsorted(self.times, time)
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(self.times)]
+        best = min(candidates, key = lambda j: abs(self.times[j] - time))
+        if abs(self.times[best] - time) >= radius:
+            return -1, None
+        best = np.searchsorted(self.times, self.times[best], side = 'left')
+        index = int(self.indices[best])
+        return index, self.annotation(index)
+
+def track_array(track, max_points = None):
+    """
+    Times and values of an acoustic track (pairs of time and value) as an
+    Nx2 float array, keeping every nth point when there are more than
+    max_points
+    """
+    if track is None:
+        return np.zeros((0, 2))
+    track = np.asarray(track, dtype = float)
+    if track.ndim != 2 or track.shape[0] == 0:
+        return np.zeros((0, 2))
+    if max_points is not None and track.shape[0] > max_points:
+        step = int(np.ceil(track.shape[0] / max_points))
+        track = track[::step]
+    return track
+
+def track_slice(track, begin, end):
+    """
+    Points of a track (Nx2 array of sorted times and values) between begin
+    and end, with times from begin
+    """
+    if track is None:
+        return None
+    first, last = np.searchsorted(track[:, 0], (begin, end), side = 'left')
+    track = track[first:last].copy()
+    track[:, 0] -= begin
+    return track
+
+def voiced_segments(track, xscale, yscale, xoffset = 0):
+    """
+    Line segments (pairs of vertices) between consecutive points of a track
+    that both have values above zero, scaled (and shifted by xoffset) to
+    plot coordinates
+    """
+    voiced = track[:, 1] > 0
+    pairs = voiced[1:] & voiced[:-1]
+    starts = track[:-1][pairs]
+    ends = track[1:][pairs]
+    segments = np.empty((starts.shape[0] * 2, 2), dtype = np.float32)
+    segments[0::2] = starts
+    segments[1::2] = ends
+    segments[:, 0] *= xscale
+    segments[:, 0] += xoffset
+    segments[:, 1] *= yscale
+    return segments
+
+def voiced_points(track, xscale, yscale, xoffset = 0):
+    """
+    Points of a track whose value and previous value are above zero, scaled
+    (and shifted by xoffset) to plot coordinates
+    """
+    voiced = track[:, 1] > 0
+    keep = np.zeros(track.shape[0], dtype = bool)
+    keep[1:] = voiced[1:] & voiced[:-1]
+    points = track[keep].astype(np.float32)
+    points[:, 0] *= xscale
+    points[:, 0] += xoffset
+    points[:, 1] *= yscale
+    return points
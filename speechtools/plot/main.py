@@ -72,8 +72,13 @@ class SpectralWidget(vp.Fig):
     def update_sampling_rate(self, sr):
         self[0:2, 0].set_sampling_rate(sr)
 
-    def update_signal(self, data):
-        self[0:2, 0].set_signal(data)
+    def update_spectrogram(self, image, sr = None, hop = None, n_fft = None, num_frames = 1,
+                            offset = 0):
+        self[0:2, 0].set_spectrogram(image, sr, hop, n_fft, num_frames, offset)
+
+    def get_windowing(self):
+        spec = self[0:2, 0].spec
+        return spec.window_length, spec._window
 
     def update_pitch(self, pitch):
         self[0:2, 0].set_pitch(pitch)
@@ -116,8 +121,8 @@ class AnnotationWidget(vp.Fig):
     def update_signal(self, data):
         self[0:2, 0].set_signal(data)
 
-    def update_annotations(self, annotations):
-        self[0:2, 0].set_annotations(annotations)
+    def update_annotations(self, annotations, channel = 0):
+        self[0:2, 0].set_annotations(annotations, channel)
 
     def get_play_time(self):
         return self[0:2, 0].play_time_line.pos[0][0]
@@ -159,6 +164,12 @@ class AnnotationWidget(vp.Fig):
     def update_selected_boundary(self, new_time, key, ind):
         self[0:2, 0].line_visuals[key].update_boundary(ind, new_time)
 
+    def get_boundary_annotation(self, key, ind):
+        return self[0:2, 0].boundary_annotation(key, ind)
+
+    def commit_boundary(self, key, ind):
+        self[0:2, 0].commit_boundary(key, ind)
+
     def update_selection_time(self, time):
         self[0:2, 0].set_selection_time(time)
 
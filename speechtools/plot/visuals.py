@@ -1,19 +1,21 @@
 import time
 from functools import partial
+from collections import OrderedDict
 
 import numpy as np
 import scipy
-from scipy.signal import gaussian
-from librosa.core.spectrum import stft
 
 from vispy import scene, visuals, gloo
 
 from vispy.geometry import Rect
+from vispy.visuals.transforms import STTransform
 
 from vispy.visuals.visual import Visual
-from vispy.visuals.shaders import Function
 from vispy.visuals import collections
-from vispy.color import Color, ColorArray, get_colormap
+from vispy.color import Color, ColorArray
+
+
+from .helper import BoundaryIndex
 
 class WaveformLineVisual(visuals.LineVisual):
     def __init__(self):
@@ -30,29 +32,95 @@ class WaveformLineVisual(visuals.LineVisual):
             self.update()
 
 
-class SCTLineVisual(visuals.LineVisual):
-    def __init__(self, *args, **kwargs):
-        kwargs.update(width = 40)
-        visuals.LineVisual.__init__(self, *args, **kwargs)
+class SCTLineVisual(Visual):
+    """
+    Boundary lines of an annotation tier, drawn as separate segments.
+
+    The visual owns its position and color buffers, so moving a boundary or
+    highlighting one only uploads the vertices that changed (see
+    ``update_boundary`` and ``update_markers``) rather than the whole tier.
+    """
+    VERTEX_SHADER = """
+    attribute vec2 a_position;
+    attribute vec4 a_color;
+    varying vec4 v_color;
+
+    void main() {
+        gl_Position = $transform(vec4(a_position, 0., 1.));
+        v_color = a_color;
+    }
+    """
+
+    FRAGMENT_SHADER = """
+    varying vec4 v_color;
+
+    void main() {
+        gl_FragColor = v_color;
+    }
+    """
+
+    def __init__(self, pos = None, color = 'b', width = 40, connect = 'segments'):
+        Visual.__init__(self, vcode = self.VERTEX_SHADER, fcode = self.FRAGMENT_SHADER)
         self.unfreeze()
-        try:
-            colormap = get_colormap(self._color)
-            color = Function(colormap.glsl_map)
-        except KeyError:
-            color = Color(self._color).rgba
-        self.non_selected_color = color
+        self._pos_vbo = gloo.VertexBuffer(np.zeros((0, 2), dtype = np.float32))
+        self._color_vbo = gloo.VertexBuffer(np.zeros((0, 4), dtype = np.float32))
+        self.shared_program['a_position'] = self._pos_vbo
+        self.shared_program['a_color'] = self._color_vbo
+        self._draw_mode = 'lines'
+        self.set_gl_state('translucent', depth_test = False)
+        self._width = width
+        self._pos = None
+        self._color = None
+        self._stale = set()
+        self.non_selected_color = Color(color).rgba
+        self.vertex_map = None
+        self._boundary_index = None
+        self._highlighted = -1
         self.freeze()
+        self.set_data(pos)
 
-    def set_data(self, data):
+    @property
+    def pos(self):
+        return self._pos
+
+    def set_data(self, data, vertex_map = None):
+        self.vertex_map = vertex_map
+        self._boundary_index = None
+        self._highlighted = -1
         if data is not None:
-            color = np.array([self.non_selected_color for x in range(len(data))])
-            scene.visuals.Line.set_data(self, pos = data, color = color)
+            self._pos = np.ascontiguousarray(data, dtype = np.float32)
+            self._color = np.empty((len(self._pos), 4), dtype = np.float32)
+            self._color[:] = self.non_selected_color
         else:
-            color = None
-            self._bounds = None
-            self._changed['pos'] = True
             self._pos = None
-            self.update()
+            self._color = None
+        self._stale = {'pos', 'color'}
+        self.update()
+
+    def _prepare_transforms(self, view):
+        view.view_program.vert['transform'] = view.get_transform()
+
+    def _prepare_draw(self, view):
+        if self._pos is None or not len(self._pos):
+            return False
+        if 'pos' in self._stale:
+            self._pos_vbo.set_data(self._pos)
+        if 'color' in self._stale:
+            self._color_vbo.set_data(self._color)
+        self._stale = set()
+        width = self.transforms.pixel_scale * self._width
+        self.update_gl_state(line_width = max(width, 1.))
+
+    def _compute_bounds(self, axis, view):
+        if self._pos is None or not len(self._pos) or axis > 1:
+            return None
+        return self._pos[:, axis].min(), self._pos[:, axis].max()
+
+    @property
+    def boundary_index(self):
+        if self._boundary_index is None and self.pos is not None:
+            self._boundary_index = BoundaryIndex(self.pos, self.vertex_map)
+        return self._boundary_index
 
     #Adapted from the vispy line_draw example
     def contains_vert(self, pos):
@@ -77,43 +145,59 @@ class SCTLineVisual(visuals.LineVisual):
         radius_time = event.source.transform_pos_to_time([radius]) - \
                     event.source.transform_pos_to_time([0])
         pos_scene = event.source.transform_pos_to_time(event.pos)
+        index, annotation = self.hit_test(pos_scene, radius_time)
+        if index == -1:
+            return None, -1
+        return self.pos[index], index
 
-        index = -1
-        for p in self.pos:
-            index += 1
-            if index % 2 == 0:
-                if p[0] != self.pos[index+1][0]:
-                    continue
-            else:
-                if p[0] != self.pos[index-1][0]:
-                    continue
-            if np.linalg.norm(pos_scene - p[0]) < radius_time:
-                # point found, return point and its index
-                return p, index
-        # no point found, return None
-        return None, -1
-
-    def update_boundary(self, selected_index, new_time):
-        if 0 <= selected_index < len(self.pos):
-            p = self.pos
-            p[selected_index][0] = new_time
-            p[selected_index + 1][0] = new_time
-            if selected_index % 6 == 0:
-                p[selected_index+2][0] = new_time
-            else:
-                p[selected_index - 1][0] = new_time
+    def hit_test(self, time, radius_time):
+        """
+        Vertex index of the boundary nearest to time within radius_time and
+        the annotation it belongs to, or -1 and None
+        """
+        if self.boundary_index is None:
+            return -1, None
+        return self.boundary_index.nearest(time, radius_time)
 
-            scene.visuals.Line.set_data(self, pos = p)
+    def _upload_range(self, attribute, start, stop):
+        """
+        Send rows start to stop of the position or color buffer to the GPU,
+        unless the whole buffer is due to be uploaded anyway
+        """
+        if attribute in self._stale:
+            return
+        data = self._pos if attribute == 'pos' else self._color
+        vbo = self._pos_vbo if attribute == 'pos' else self._color_vbo
+        start = max(start, 0)
+        stop = min(stop, len(data))
+        if stop > start:
+            vbo.set_subdata(data[start:stop], offset = start)
+        self.update()
 
+    def update_boundary(self, selected_index, new_time):
+        if self.pos is None or self.vertex_map is None or \
+                not 0 <= selected_index < len(self.pos):
+            return
+        start, stop = self.vertex_map.boundary_vertices(selected_index)
+        self.pos[start:stop, 0] = new_time
+        self._boundary_index = None
+        self._upload_range('pos', start, stop)
 
     def update_markers(self, selected_index=-1, highlight_color=(1, 1, 0, 1)):
         """ update marker colors, and highlight a marker with a given color """
-        c = np.array([self.non_selected_color for x in range(len(self.pos))])
-        if 0 <= selected_index < len(self.pos):
-            c[selected_index] = highlight_color
-            c[selected_index + 1] = highlight_color
-
-        scene.visuals.Line.set_data(self, color = c)
+        if self.pos is None or selected_index == self._highlighted:
+            return
+        c = self._color
+        previous = self._highlighted
+        if 0 <= previous < len(c) - 1:
+            c[previous:previous + 2] = self.non_selected_color
+            self._upload_range('color', previous, previous + 2)
+        if 0 <= selected_index < len(c) - 1:
+            c[selected_index:selected_index + 2] = highlight_color
+            self._upload_range('color', selected_index, selected_index + 2)
+            self._highlighted = selected_index
+        else:
+            self._highlighted = -1
 
 class LineCollectionVisual(visuals.visual.BaseVisual, collections.agg_segment_collection.AggSegmentCollection):
     pass
@@ -206,7 +290,6 @@ class PlayLineVisual(visuals.LineVisual):
 
 class SCTSpectrogramVisual(visuals.ImageVisual):
     def __init__(self, window_length = 0.005, step = 0.001):
-        self._signal = None
         self.window_length = window_length
         self.step = step
         self._window = 'hann'
@@ -215,9 +298,10 @@ class SCTSpectrogramVisual(visuals.ImageVisual):
         self._clim='auto'
         self._dynamic_range = 70
         self._sr = None
+        self._hop = None
+        self._offset = 0
         self.min_time = 0
         self.max_time = None
-        self._win_len = None
 
         self._n_fft = None
 
@@ -230,18 +314,26 @@ class SCTSpectrogramVisual(visuals.ImageVisual):
 
     def set_sampling_rate(self, sr):
         self._sr = sr
-        if sr is not None:
-            self._win_len = int(self.window_length * self._sr)
-        else:
-            self._win_len = None
 
-    def set_signal(self, data):
-        self._signal = data
-        if data is None:
-            self._n_fft = None
-        else:
-            self._n_fft = 256
-        self._do_spec()
+    def set_spectrogram(self, image, sr = None, hop = None, n_fft = None, num_frames = 1,
+                        offset = 0):
+        """
+        Show a spectrogram image of frequency bins by frames, computed with
+        the given hop and FFT size, where the view begins ``offset`` frames
+        into the image.  Without an image, a blank one of ``num_frames``
+        frames keeps the scales of the view.
+        """
+        if sr is not None:
+            self._sr = sr
+        self._hop = hop
+        self._n_fft = n_fft
+        self._offset = offset
+        if image is None:
+            if n_fft is None:
+                image = np.array([[0.5]])
+            else:
+                image = np.zeros((n_fft // 2 + 1, max(num_frames, 1)))
+        self.set_data(image)
 
     @property
     def yscale(self):
@@ -251,10 +343,15 @@ class SCTSpectrogramVisual(visuals.ImageVisual):
 
     @property
     def xscale(self):
-        if self._signal is None or len(self._signal) == 0 :
+        if self._hop is None or self._sr is None:
             return 1
-        num_steps = self._data.shape[1]
-        return num_steps /(len(self._signal) /self._sr)
+        return self._sr / float(self._hop)
+
+    @property
+    def xoffset(self):
+        if self._hop is None or self._sr is None:
+            return 0
+        return self._offset
 
     def ymax(self):
         if self._n_fft is not None:
@@ -272,35 +369,6 @@ class SCTSpectrogramVisual(visuals.ImageVisual):
     def xmin(self):
         return 0
 
-    def _do_spec(self):
-        if self._signal is None or len(self._signal) == 0:
-            self.set_data(np.array([[0.5]]))
-            return
-        #if len(self._signal) / self._sr > 30:
-        num_steps = 1000
-        if len(self._signal) < num_steps:
-            num_steps = len(self._signal)
-        step_samp = int(len(self._signal)/ num_steps)
-
-        #if step_samp < 28:
-        #    step_samp = 28
-        #    step = step_samp / self._sr
-        #self._n_fft = 512
-        #window = partial(gaussian, std = 250/12)
-        if self._window == 'gaussian':
-            window = partial(gaussian, std = 0.45*(self._win_len)/2)
-        else:
-            window = None
-        #import matplotlib.pyplot as plt
-        #plt.plot(window(250))
-        #plt.show()
-        data = stft(self._signal, self._n_fft, step_samp, center = True, win_length = self._win_len, window = window)
-
-        data = np.abs(data)
-        data = 20 * np.log10(data) if self._color_scale == 'log' else data
-
-        self.set_data(data)
-
     def set_data(self, image):
         """Set the data
         Parameters
@@ -408,25 +476,43 @@ class SelectionRect(scene.Rectangle):
         self.visible = True
 
 class ScalingText(scene.visuals.Text):
+    """
+    Annotation labels whose font size follows the zoom level.
+
+    ``update_level_of_detail`` sets the font size (in buckets of
+    ``size_step`` points) for the current pixels per second, hides labels
+    whose annotations are narrower than their glyphs, and reports the tier
+    as dense when fewer than ``min_visible`` of its labels would fit.  The
+    font size is a uniform of the text visual, so the text is only set
+    again when the set of visible labels changes, not on every zoom or pan.
+    The laid out glyph run of each label string is cached across labels
+    and tiers; runs do not depend on the size bucket, so one run serves
+    them all.
+    """
+    glyph_runs = OrderedDict()
+    max_glyph_runs = 20000
 
     def __init__(self, *args, **kwargs):
         self.minpps = 10
         self.maxpps = 3000
         self.min_font_size = 1
         self.max_font_size = 18
+        self.size_step = 0.5
+        self.char_width = 0.8
+        self.min_visible = 0.5
+        self.labels = []
+        self.label_pos = None
+        self.label_widths = None
+        self.lod_state = None
+        self.lod_indices = None
+        self.lod_pps = None
         super(ScalingText, self).__init__(*args, **kwargs)
 
     def set_lowest(self):
         self.maxpps = 5000
         self.max_font_size = 16
 
-    def _prepare_draw(self, view):
-        if len(self.text) == 0:
-            return False
-        seconds = view.canvas[0:2,0].view.camera.rect.width
-        pixels = view.canvas.physical_size[0]
-        pps = pixels / seconds
-
+    def font_size_for(self, pps):
         if pps < self.minpps:
             font_size = self.min_font_size
         elif pps > self.maxpps:
@@ -434,19 +520,142 @@ class ScalingText(scene.visuals.Text):
         else:
             per = (pps - self.minpps) / (self.maxpps - self.minpps)
             font_size = self.min_font_size + (self.max_font_size - self.min_font_size) * per
-        self.font_size = font_size
-        super(ScalingText, self)._prepare_draw(view)
+        return max(round(font_size / self.size_step) * self.size_step, self.min_font_size)
 
-    def set_data(self, text, pos):
+    def update_level_of_detail(self, pps):
+        """
+        Show the labels that fit at pps pixels per second.  Returns True if
+        the tier is too dense to label, in which case no labels are shown.
+        """
+        self.lod_pps = pps
+        font_size = self.font_size_for(pps)
+        if not self.labels:
+            return False
+        if self.label_widths is None:
+            visible = np.ones(len(self.labels), dtype = bool)
+        else:
+            lengths = np.array([len(x) for x in self.labels])
+            extents = lengths * font_size * self.char_width
+            visible = self.label_widths * pps >= extents
+        dense = visible.mean() < self.min_visible
+        if dense:
+            visible[:] = False
+        if font_size != self.font_size:
+            self.font_size = font_size
+        state = visible.tobytes()
+        if state != self.lod_state:
+            self.lod_state = state
+            self.lod_indices = np.nonzero(visible)[0]
+            self.text = None
+            if len(self.lod_indices):
+                self.pos = self.label_pos[self.lod_indices]
+                self.text = [self.labels[i] for i in self.lod_indices]
+        return dense
+
+    def _glyph_key(self, label):
+        return (self._font, self._anchors, self._line_height, label)
+
+    def _prepare_draw(self, view):
+        if len(self.text) == 0:
+            return False
+        if self._vertices is not None:
+            return super(ScalingText, self)._prepare_draw(view)
+        text = [self.text] if isinstance(self.text, str) else self.text
+        runs = ScalingText.glyph_runs
+        keys = [self._glyph_key(t) for t in text]
+        if not all(k in runs for k in keys):
+            result = super(ScalingText, self)._prepare_draw(view)
+            start = 0
+            for t, k in zip(text, keys):
+                runs[k] = self._vertices_data[start:start + 4 * len(t)]
+                start += 4 * len(t)
+            while len(runs) > ScalingText.max_glyph_runs:
+                runs.popitem(last = False)
+            return result
+        for k in keys:
+            runs.move_to_end(k)
+        n_char = sum(len(t) for t in text)
+        self._vertices_data = np.concatenate([runs[k] for k in keys])
+        self._vertices = gloo.VertexBuffer(self._vertices_data)
+        idx = (np.array([0, 1, 2, 0, 2, 3], np.uint32) +
+               np.arange(0, 4 * n_char, 4, dtype = np.uint32)[:, np.newaxis])
+        self._index_buffer = gloo.IndexBuffer(idx.ravel())
+        self.shared_program.bind(self._vertices)
+        return super(ScalingText, self)._prepare_draw(view)
+
+    def move_label(self, index, time):
+        """
+        Move the label of annotation index (in the data last set) to a new
+        time, culling again at the current level of detail
+        """
+        if self.label_pos is None:
+            return
+        self.label_pos = self.label_pos.copy()
+        self.label_pos[index, 0] = time
+        self._place_labels()
+
+    def _place_labels(self):
+        # Labels that stay visible only need their positions updated
+        if self.lod_state is None:
+            self.pos = self.label_pos
+            return
+        state = self.lod_state
+        self.update_level_of_detail(self.lod_pps)
+        if self.lod_state == state and len(self.lod_indices):
+            self.pos = self.label_pos[self.lod_indices]
 
-        self.text = None
-        if pos is None:
-            pos = [0,0]
-        self.pos = pos
-        self.text = text
+    def set_data(self, text, pos = None, widths = None):
+        """
+        Set the labels and their positions.  When the labels are the same
+        as those already set, as when panning within a window, the text is
+        kept and only the positions are updated until the level of detail
+        is next culled.
+        """
+        if text is None or pos is None:
+            self.text = None
+            self.lod_state = None
+            self.labels = []
+            self.label_pos = None
+            self.label_widths = None
+            self.pos = [0,0]
+            return
+        same = len(self.labels) > 0 and list(text) == list(self.labels)
+        self.labels = text
+        self.label_pos = np.atleast_2d(pos)
+        self.label_widths = None if widths is None else np.asarray(widths)
+        if not same:
+            self.text = None
+            self.lod_state = None
+            self.pos = pos
+            self.text = text
+        elif self.lod_state is None:
+            self.pos = self.label_pos
+        elif len(self.lod_indices):
+            self.pos = self.label_pos[self.lod_indices]
 
 #ScalingText = scene.visuals.create_visual_node(ScalingTextVisual)
 
+class DensityBarVisual(visuals.ImageVisual):
+    """
+    Strip drawn in place of the labels of a tier that is too dense to label,
+    shaded by the number of annotations centred in each of ``bins`` columns
+    of the view, or by the sum of their weights
+    """
+    def __init__(self, bins = 256):
+        self.bins = bins
+        super(DensityBarVisual, self).__init__(np.ones((1, bins), dtype = np.float32),
+                cmap = 'grays', clim = (0, 1))
+
+    def set_density(self, midpoints, min_time, max_time, vert_min, vert_max, weights = None):
+        counts, _ = np.histogram(midpoints, bins = self.bins, range = (min_time, max_time),
+                                weights = weights)
+        density = counts / max(counts.max(), 1)
+        self.set_data((1 - density[None, :]).astype(np.float32))
+        self.transform = STTransform(scale = ((max_time - min_time) / self.bins, vert_max - vert_min),
+                                    translate = (min_time, vert_min))
+
+DensityBar = scene.visuals.create_visual_node(DensityBarVisual)
+
 class SCTAnnotationVisual(visuals.visual.CompoundVisual):
     def __init__(self, data = None, hierarchy = None):
         self._rect = visuals.RectangleVisual(border_color = 'b', border_width = 2)
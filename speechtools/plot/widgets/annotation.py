@@ -9,9 +9,12 @@ from vispy.visuals.text.text import FontManager
 
 from .base import SelectablePlotWidget, PlotWidget
 
-from ..visuals import SCTLinePlot, ScalingText, SCTAnnotation, SelectionLine, TierRectangle, WaveformPlot
+from ..visuals import (SCTLinePlot, ScalingText, SCTAnnotation, SelectionLine, TierRectangle,
+                        WaveformPlot, DensityBar)
 
-from ..helper import generate_boundaries
+from ..helper import generate_boundaries, max_sig
+
+from ...discourse import zoom_keys
 
 class AnnotationPlotWidget(SelectablePlotWidget):
 
@@ -26,6 +29,8 @@ class AnnotationPlotWidget(SelectablePlotWidget):
         self.max_time = None
         self.line_visuals = {}
         self.box_visuals = {}
+        self.density_visuals = {}
+        self.channel = 0
         self.font_manager = FontManager()
         self.breakline = SCTLinePlot(None, width = 1, color = 'k')
         self.waveform = WaveformPlot()
@@ -69,6 +74,8 @@ class AnnotationPlotWidget(SelectablePlotWidget):
                 v.parent = None
             for k,v in self.line_visuals.items():
                 v.parent = None
+            for k,v in self.density_visuals.items():
+                v.parent = None
             self.num_types = len(self.hierarchy.keys())
             keys = []
             for k, v in sorted(self.hierarchy.subannotations.items()):
@@ -76,6 +83,7 @@ class AnnotationPlotWidget(SelectablePlotWidget):
                     keys.append((k,s))
             self.annotation_visuals = {}
             self.line_visuals = {}
+            self.density_visuals = {}
             cycle = ['b', 'r']
             for i, k in enumerate(self.hierarchy.highest_to_lowest):
                 c = cycle[i % len(cycle)]
@@ -83,8 +91,11 @@ class AnnotationPlotWidget(SelectablePlotWidget):
                 if k == self.hierarchy.lowest:
                     self.annotation_visuals[k].set_lowest()
                 self.line_visuals[k] = SCTLinePlot(connect = 'segments', color = c)
+                self.density_visuals[k] = DensityBar()
+                self.density_visuals[k].visible = False
                 #self.box_visuals[k] = TierRectangle(i, self.num_types, len(keys))
                 #self.view.add(self.box_visuals[k])
+                self.view.add(self.density_visuals[k])
                 self.view.add(self.annotation_visuals[k])
                 self.view.add(self.line_visuals[k])
             ind = len(self.hierarchy.highest_to_lowest)
@@ -93,53 +104,122 @@ class AnnotationPlotWidget(SelectablePlotWidget):
                 self.annotation_visuals[k] = ScalingText(face = 'OpenSans', font_manager = self.font_manager)
                 self.annotation_visuals[k].set_lowest()
                 self.line_visuals[k] = SCTLinePlot(connect = 'segments', color = c)
+                self.density_visuals[k] = DensityBar()
+                self.density_visuals[k].visible = False
                 #self.box_visuals[k] = TierRectangle(ind, self.num_types, len(keys))
                 #self.view.add(self.box_visuals[k])
+                self.view.add(self.density_visuals[k])
                 self.view.add(self.annotation_visuals[k])
                 self.view.add(self.line_visuals[k])
                 ind += 1
         except AttributeError:
             pass
-    def set_annotations(self, data):
-        #Assume that data is the highest level of the hierarchy
+    def pixels_per_second(self):
+        try:
+            pixels = self.canvas.physical_size[0]
+        except AttributeError:
+            return None
+        return pixels / (self.max_time - self.min_time)
+
+    def show_tier(self, key, lines, vertex_map, labels, pos, widths, pps):
+        self.line_visuals[key].set_data(lines, vertex_map)
+        self.line_visuals[key].visible = True
+        text = self.annotation_visuals[key]
+        text.set_data(labels, pos = pos, widths = widths)
+        text.visible = True
+        dense = pps is not None and text.update_level_of_detail(pps)
+        if dense:
+            vert_min, vert_max = lines[:, 1].min(), lines[:, 1].max()
+            third = (vert_max - vert_min) / 3
+            self.density_visuals[key].set_density(pos[:, 0], self.min_time, self.max_time,
+                                        vert_min + third, vert_max - third)
+        self.density_visuals[key].visible = dense
+
+    def show_summary(self, key, store, channel = 0):
+        """
+        Shade the row of a tier that is too dense to draw by how many of its
+        annotations fall under each of the annotations above it, from the
+        counts fetched in its place
+        """
+        summary = store.summary(key, self.min_time, self.max_time, channel)
+        if summary is None or not len(summary[0]):
+            return
+        begins, ends, counts = summary
+        size = max_sig / self.num_types
+        self.density_visuals[key].set_density((begins + ends) / 2, self.min_time, self.max_time,
+                                        0, size, weights = counts)
+        self.density_visuals[key].visible = True
+
+    def hide_tier(self, key):
+        self.line_visuals[key].visible = False
+        self.line_visuals[key].set_data(None)
+        self.annotation_visuals[key].visible = False
+        self.annotation_visuals[key].set_data(None, None)
+        self.density_visuals[key].visible = False
+
+    def set_annotations(self, data, channel = 0):
+        #Assume that data is an AnnotationStore for the hierarchy
         self.annotations = data
+        self.channel = channel
         if data is None:
             if self.hierarchy is not None:
                 for k in self.hierarchy.keys():
-                    self.line_visuals[k].visible = False
-                    self.line_visuals[k].set_data(None)
-                    self.annotation_visuals[k].visible = False
-                    self.annotation_visuals[k].set_data(None, None)
+                    self.hide_tier(k)
                 for k,v in self.hierarchy.subannotations.items():
                     for s in v:
-                        self.line_visuals[k, s].visible = False
-                        self.line_visuals[k, s].set_data(None)
-                        self.annotation_visuals[k, s].visible = False
-                        self.annotation_visuals[k, s].set_data(None, None)
+                        self.hide_tier((k, s))
             return
         if self.hierarchy is not None:
-            line_data, text_data = generate_boundaries(data, self.hierarchy, self.min_time, self.max_time)
+            line_data, text_data, annotation_data = generate_boundaries(data, self.hierarchy,
+                                        self.min_time, self.max_time, channel)
+            pps = self.pixels_per_second()
+            drawn, counted = zoom_keys(self.hierarchy, self.max_time - self.min_time)
             for k in self.hierarchy.keys():
-                if text_data[k][0] and (self.max_time - self.min_time < 10 or k != self.hierarchy.lowest):
-                        self.line_visuals[k].set_data(line_data[k])
-                        self.line_visuals[k].visible = True
-                        self.annotation_visuals[k].set_data(text_data[k][0], pos = text_data[k][1])
-                        self.annotation_visuals[k].visible = True
+                if text_data[k][0] and k in drawn:
+                    self.show_tier(k, line_data[k], annotation_data[k], *text_data[k], pps = pps)
                 else:
                     self.line_visuals[k].set_data(None)
                     self.annotation_visuals[k].set_data(None, None)
+                    self.density_visuals[k].visible = False
+                    if k in counted:
+                        self.show_summary(k, data, channel)
             for k, v in self.hierarchy.subannotations.items():
                 for s in v:
-                    if text_data[k, s][0] and self.max_time - self.min_time < 10:
-                        self.line_visuals[k, s].set_data(line_data[k, s])
-                        self.line_visuals[k, s].visible = True
-                        self.annotation_visuals[k, s].set_data(text_data[k, s][0], pos = text_data[k, s][1])
-                        self.annotation_visuals[k, s].visible = True
+                    if text_data[k, s][0] and (k, s) in drawn:
+                        self.show_tier((k, s), line_data[k, s], annotation_data[k, s],
+                                    *text_data[k, s], pps = pps)
                     else:
-                        self.line_visuals[k, s].visible = False
-                        self.line_visuals[k, s].set_data(None)
-                        self.annotation_visuals[k, s].visible = False
-                        self.annotation_visuals[k, s].set_data(None, None)
+                        self.hide_tier((k, s))
+
+    def boundary_annotation(self, key, index):
+        """
+        The annotation whose boundary is drawn by vertex index of a tier, and
+        whether it is the begin boundary
+        """
+        vertex_map = self.line_visuals[key].vertex_map
+        if vertex_map is None:
+            return None, False
+        return vertex_map.annotation(index), vertex_map.is_begin(index)
+
+    def commit_boundary(self, key, index):
+        """
+        Update the geometry affected by a boundary that was dragged to a new
+        time and saved: the label position and width of its annotation
+        """
+        vertex_map = self.line_visuals[key].vertex_map
+        annotation = vertex_map.annotation(index)
+        if annotation is None:
+            return
+        text = self.annotation_visuals[key]
+        label = index // vertex_map.vertices_per_annotation
+        if text.label_pos is not None and label < len(text.label_pos):
+            midpoint = (annotation.end - annotation.begin) / 2 + annotation.begin
+            if isinstance(key, tuple) and not self.min_time <= midpoint <= self.max_time:
+                midpoint = (self.max_time - self.min_time) / 2 + self.min_time
+            if text.label_widths is not None:
+                text.label_widths = text.label_widths.copy()
+                text.label_widths[label] = annotation.end - annotation.begin
+            text.move_label(label, midpoint)
 
     def rank_key_by_relevance(self, key):
         ranking = []
@@ -6,6 +6,8 @@ from ..visuals import Spectrogram, SCTLinePlot, scene
 
 from ..axis import ScaledTicker
 
+from ..helper import track_array, voiced_segments, voiced_points
+
 class SpectralPlotWidget(SelectablePlotWidget):
     def __init__(self, *args, **kwargs):
         super(SpectralPlotWidget, self).__init__(*args, **kwargs)
@@ -33,61 +35,45 @@ class SpectralPlotWidget(SelectablePlotWidget):
         self.view.add(self.play_time_line)
         self.play_time_line.visible = True
 
+    def max_track_points(self):
+        return max(int(self.view.size[0]) * 2, 1000)
+
     def set_pitch(self, pitch):
-        if pitch is None or not len(pitch):
+        factor = 125 / 600
+        track = track_array(pitch, self.max_track_points())
+        data = voiced_segments(track, self.spec.xscale, factor, self.spec.xoffset)
+        if not len(data):
             self.pitchplot._bounds = None
             self.pitchplot._changed['pos'] = True
             self.pitchplot._pos = None
             self.pitchplot.update()
         else:
-            factor = 125 / 600
-            data = []
-            for i,(t, p) in enumerate(pitch):
-                if p <= 0:
-                    continue
-                if i <= 0:
-                    continue
-                if pitch[i-1][1] <= 0:
-                    continue
-                p = p * factor
-                t = t * self.spec.xscale
-                prev_p = pitch[i-1]
-                prev_p = [prev_p[0] * self.spec.xscale, prev_p[1] * factor]
-                data.append(prev_p)
-                data.append([t, p])
-            data = np.array(data)
             self.pitchplot.set_data(pos = data)
 
     def set_formants(self, formants):
         for k,v in self.formantplots.items():
-            if formants is None or k not in formants or not formants[k]:
+            data = None
+            if formants is not None and k in formants:
+                track = track_array(formants[k], self.max_track_points())
+                data = voiced_points(track, self.spec.xscale, 1 / self.spec.yscale,
+                                    self.spec.xoffset)
+            if data is None or not len(data):
                 self.formantplots[k]._bounds = None
                 self.formantplots[k]._changed['pos'] = True
                 self.formantplots[k]._pos = None
                 self.formantplots[k].update()
             else:
-                data = []
-                for i,(t, f) in enumerate(formants[k]):
-                    if f <= 0:
-                        continue
-                    if i <= 0:
-                        continue
-                    if formants[k][i-1][1] <= 0:
-                        continue
-                    t = t * self.spec.xscale
-                    f = f / self.spec.yscale
-                    data.append([t, f])
-                data = np.array(data)
                 self.formantplots[k].set_data(pos = data)
 
 
     def set_sampling_rate(self, sr):
         self.spec.set_sampling_rate(sr)
 
-    def set_signal(self, data):
+    def set_spectrogram(self, image, sr = None, hop = None, n_fft = None, num_frames = 1,
+                        offset = 0):
         if not self.show_spec:
             self.spec.visible = False
-        self.spec.set_signal(data)
+        self.spec.set_spectrogram(image, sr, hop, n_fft, num_frames, offset)
         self.view.camera.rect = (0, 0, self.spec.xmax(), self.spec.ymax())
         self.yaxis.axis.ticker.scale = self.spec.yscale
         #self.xaxis.axis.ticker.scale = 1/ self.spec.xscale
@@ -0,0 +1,162 @@
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from polyglotdb import CorpusContext
+
+def config_key(config):
+    return (config.corpus_name, config.graph_host, config.graph_port,
+            getattr(config, 'graph_user', None))
+
+class ContextPool(object):
+    """
+    Keeps opened CorpusContexts alive between uses, per corpus config.
+
+    Contexts idle for longer than ``keep_alive`` seconds are closed, contexts
+    idle for longer than ``check_interval`` seconds are checked against the
+    graph server before being handed out, and at most ``max_size`` contexts
+    are open per config at once (further acquires wait for a release).
+    Contexts that objects outliving their use keep hold of (such as
+    discourse inspectors) are ``detach``ed from the pool instead of being
+    handed out again.
+    """
+    def __init__(self, max_size = 6, keep_alive = 300, check_interval = 30):
+        self.max_size = max_size
+        self.keep_alive = keep_alive
+        self.check_interval = check_interval
+        self.idle = {}
+        self.num_open = {}
+        self.generations = {}
+        self.context_generations = weakref.WeakKeyDictionary()
+        self.detached = weakref.WeakSet()
+        self._condition = threading.Condition()
+
+    def acquire(self, config):
+        key = config_key(config)
+        context = None
+        with self._condition:
+            while True:
+                self._expire(key)
+                idle = self.idle.setdefault(key, [])
+                if idle:
+                    context, last_used = idle.pop()
+                    break
+                if self.num_open.get(key, 0) < self.max_size:
+                    self.num_open[key] = self.num_open.get(key, 0) + 1
+                    break
+                self._condition.wait()
+        if context is not None:
+            if time.time() - last_used < self.check_interval or self.is_healthy(context):
+                return context
+            self._close(key, context, keep_slot = True)
+        try:
+            context = CorpusContext(config)
+            context.__enter__()
+        except:
+            with self._condition:
+                self.num_open[key] -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self.context_generations[context] = self.generations.get(key, 0)
+        return context
+
+    def release(self, config, context, discard = False):
+        key = config_key(config)
+        with self._condition:
+            if context in self.detached:
+                self.detached.discard(context)
+                if discard:
+                    self._close(key, context, keep_slot = True)
+                return
+            stale = self.context_generations.get(context) != self.generations.get(key, 0)
+            if discard or stale:
+                self._close(key, context)
+            else:
+                self.idle.setdefault(key, []).append((context, time.time()))
+            self._condition.notify()
+
+    def detach(self, config, context):
+        """
+        Give a context acquired from the pool over to the caller for good.
+        It is not reused when released and no longer counts towards
+        ``max_size``; its new owner has to close it (see
+        ``IndexedDiscourseModel.close``).
+        """
+        key = config_key(config)
+        with self._condition:
+            if context in self.detached or context not in self.context_generations:
+                return
+            self.detached.add(context)
+            self.context_generations.pop(context, None)
+            self.num_open[key] -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def context(self, config):
+        c = self.acquire(config)
+        try:
+            yield c
+        except:
+            self.release(config, c, discard = True)
+            raise
+        else:
+            self.release(config, c)
+
+    def is_healthy(self, context):
+        try:
+            context.execute_cypher('RETURN 1')
+        except Exception:
+            return False
+        return True
+
+    def invalidate(self, config = None):
+        """
+        Close idle contexts and mark those in use as stale, so that later
+        acquires load the current hierarchy.  Called after anything that
+        changes the hierarchy of a corpus.
+        """
+        with self._condition:
+            if config is None:
+                keys = list(self.num_open.keys())
+            else:
+                keys = [config_key(config)]
+            for key in keys:
+                self.generations[key] = self.generations.get(key, 0) + 1
+                for context, last_used in self.idle.get(key, []):
+                    self._close(key, context)
+                self.idle[key] = []
+            self._condition.notify_all()
+
+    def close_all(self):
+        self.invalidate()
+
+    def _expire(self, key):
+        now = time.time()
+        idle = self.idle.setdefault(key, [])
+        for context, last_used in list(idle):
+            if now - last_used > self.keep_alive:
+                idle.remove((context, last_used))
+                self._close(key, context)
+
+    def _close(self, key, context, keep_slot = False):
+        with self._condition:
+            self.context_generations.pop(context, None)
+            if not keep_slot:
+                self.num_open[key] -= 1
+        try:
+            context.__exit__(None, None, None)
+        except Exception:
+            pass
+
+_pool = None
+
+def get_context_pool():
+    global _pool
+    if _pool is None:
+        _pool = ContextPool()
+    return _pool
+
+def corpus_context(config):
+    return get_context_pool().context(config)
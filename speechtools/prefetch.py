@@ -0,0 +1,295 @@
+import time
+from collections import OrderedDict
+
+from PyQt5 import QtCore
+
+from .discourse import DETAIL_DURATION, zoom_keys
+from .workers import AnnotationCacheWorker, ContextPrefetchWorker
+
+class WindowPrefetcher(QtCore.QObject):
+    """
+    Fetches annotation windows on either side of the cached range of a
+    discourse ahead of the viewport.
+
+    Only one window is in flight at a time; views reported while it is
+    being fetched only update the pan direction and velocity, and the next
+    window is planned from the latest view once it arrives, so requests for
+    views that have already been panned past are never sent.  The window
+    size grows with the distance the view is expected to travel during one
+    fetch, based on the measured fetch latency.
+
+    Windows only hold the tiers drawn at the zoom of the view they are
+    fetched for.  While the view is zoomed in far enough to draw the lower
+    tiers, a second worker fills them in over the cached range around the
+    view where they are missing.
+
+    When the view jumps more than a window away from the cached range, the
+    gap is not fetched; a fresh window around the view is fetched instead,
+    and replaces the cached range when it arrives.
+    """
+    precedingReady = QtCore.pyqtSignal(object)
+    followingReady = QtCore.pyqtSignal(object)
+    replaceReady = QtCore.pyqtSignal(object)
+    detailReady = QtCore.pyqtSignal(object)
+    errorEncountered = QtCore.pyqtSignal(object)
+
+    def __init__(self, cache_window = 5, max_window = 120, parent = None):
+        super(WindowPrefetcher, self).__init__(parent)
+        self.cache_window = cache_window
+        self.max_window = max_window
+        self.config = None
+        self.discourse_model = None
+        self.view_begin = None
+        self.view_end = None
+        self.view_time = None
+        self.velocity = 0
+        self.latency = 0.5
+        self.smoothing = 0.3
+        self.in_flight = None
+        self.detail_in_flight = None
+
+        self.worker = AnnotationCacheWorker()
+        self.worker.dataReady.connect(self.windowFetched)
+        self.worker.errorEncountered.connect(self.fetchFailed)
+
+        self.detail_worker = AnnotationCacheWorker()
+        self.detail_worker.dataReady.connect(self.detailFetched)
+        self.detail_worker.errorEncountered.connect(self.detailFailed)
+
+    def set_discourse(self, discourse_model, config):
+        self.worker.stop()
+        self.detail_worker.stop()
+        self.discourse_model = discourse_model
+        self.config = config
+        self.view_begin = None
+        self.view_end = None
+        self.view_time = None
+        self.velocity = 0
+        self.in_flight = None
+        self.detail_in_flight = None
+
+    def update_view(self, begin, end):
+        now = time.time()
+        if self.view_begin is not None and now > self.view_time:
+            center = (begin + end) / 2
+            last_center = (self.view_begin + self.view_end) / 2
+            velocity = (center - last_center) / (now - self.view_time)
+            self.velocity = self.smoothing * velocity + (1 - self.smoothing) * self.velocity
+        self.view_begin = begin
+        self.view_end = end
+        self.view_time = now
+        if self.in_flight is None:
+            self.request()
+        if self.detail_in_flight is None:
+            self.request_detail()
+
+    def margin(self):
+        return max(self.cache_window, abs(self.velocity) * self.latency * 2)
+
+    def window_size(self):
+        span = self.view_end - self.view_begin
+        size = span + abs(self.velocity) * self.latency * 4
+        return min(max(size, 2 * self.cache_window), self.max_window)
+
+    def reach(self):
+        """
+        Furthest a planned window can extend past the view, so that windows
+        are not evicted as soon as they arrive
+        """
+        if self.view_begin is None:
+            return 2 * self.cache_window
+        return self.margin() + self.window_size()
+
+    def plan(self):
+        model = self.discourse_model
+        if model is None or self.view_begin is None:
+            return None
+        margin = self.margin()
+        window = self.window_size()
+        if self.view_begin > model.cached_end + window or \
+                self.view_end < model.cached_begin - window:
+            return (max(self.view_begin - window, 0), self.view_end + window, 'replace')
+        requests = []
+        if not model.cached_to_end and self.view_end > model.cached_end - margin:
+            end = max(model.cached_end, self.view_end) + window
+            requests.append((model.cached_end, end, 'following'))
+        if not model.cached_to_begin and self.view_begin < model.cached_begin + margin:
+            begin = max(min(model.cached_begin, self.view_begin) - window, 0)
+            requests.append((begin, model.cached_begin, 'preceding'))
+        if not requests:
+            return None
+        if self.velocity < 0:
+            requests.reverse()
+        return requests[0]
+
+    def request(self):
+        planned = self.plan()
+        if planned is None:
+            return
+        begin, end, direction = planned
+        keys, counted = zoom_keys(self.discourse_model.hierarchy, self.view_end - self.view_begin)
+        self.in_flight = (self.discourse_model.name, begin, end, direction, time.time())
+        kwargs = {'config': self.config,
+                    'begin': begin,
+                    'end': end,
+                    'discourse': self.discourse_model.name,
+                    'keys': keys,
+                    'counted': counted}
+        self.worker.setParams(kwargs)
+        self.worker.start()
+
+    def windowFetched(self, data):
+        results, discourse, begin, end = data
+        if self.in_flight is None or self.in_flight[:3] != (discourse, begin, end):
+            return
+        direction, requested = self.in_flight[3:]
+        latency = time.time() - requested
+        self.latency = self.smoothing * latency + (1 - self.smoothing) * self.latency
+        self.in_flight = None
+        model = self.discourse_model
+        # Windows that no longer adjoin the cached range (after an eviction)
+        # are dropped and planned again
+        if direction == 'replace':
+            if begin < self.view_end and self.view_begin < end:
+                self.replaceReady.emit(results)
+        elif direction == 'preceding' and end == model.cached_begin:
+            self.precedingReady.emit(results)
+        elif direction == 'following' and begin == model.cached_end:
+            self.followingReady.emit(results)
+        if self.in_flight is None:
+            self.request()
+        if self.detail_in_flight is None:
+            self.request_detail()
+
+    def fetchFailed(self, e):
+        self.in_flight = None
+        self.errorEncountered.emit(e)
+
+    def plan_detail(self):
+        model = self.discourse_model
+        if model is None or self.view_begin is None:
+            return None
+        if self.view_end - self.view_begin >= DETAIL_DURATION:
+            return None
+        keys = model.detail_keys()
+        if not keys:
+            return None
+        begin = max(self.view_begin - self.cache_window, model.cached_begin)
+        end = min(self.view_end + self.cache_window, model.cached_end)
+        if end <= begin:
+            return None
+        uncovered = model.uncovered_detail(begin, end)
+        if uncovered is None:
+            return None
+        return uncovered + (keys,)
+
+    def request_detail(self):
+        planned = self.plan_detail()
+        if planned is None:
+            return
+        begin, end, keys = planned
+        self.detail_in_flight = (self.discourse_model.name, begin, end)
+        self.detail_worker.setParams({'config': self.config,
+                                    'begin': begin,
+                                    'end': end,
+                                    'discourse': self.discourse_model.name,
+                                    'keys': keys})
+        self.detail_worker.start()
+
+    def detailFetched(self, data):
+        results, discourse, begin, end = data
+        if self.detail_in_flight != (discourse, begin, end):
+            return
+        self.detail_in_flight = None
+        model = self.discourse_model
+        # Detail outside the cached range (after an eviction) would have no
+        # parents to attach to
+        if model.cached_begin <= begin and end <= model.cached_end:
+            self.detailReady.emit(results)
+        if self.detail_in_flight is None:
+            self.request_detail()
+
+    def detailFailed(self, e):
+        self.detail_in_flight = None
+        self.errorEncountered.emit(e)
+
+class ContextPrefetcher(QtCore.QObject):
+    """
+    Loads the discourse models and audio windows of the query results that
+    are likely to be viewed next, so that stepping through results does not
+    wait for a query.
+
+    ``request`` replaces the list of wanted contexts, most likely first;
+    they are fetched one at a time in the background and kept in a least
+    recently used cache of ``max_contexts`` entries, from which ``take``
+    removes the context for a view if it is there.  Models evicted from the
+    cache are closed; those taken belong to the caller.  A context that
+    fails to fetch is dropped from the wanted list, and the error is
+    emitted for logging rather than shown, as nothing is waiting on it.
+    """
+    errorEncountered = QtCore.pyqtSignal(object)
+
+    def __init__(self, max_contexts = 8, parent = None):
+        super(ContextPrefetcher, self).__init__(parent)
+        self.max_contexts = max_contexts
+        self.config = None
+        self.wanted = []
+        self.contexts = OrderedDict()
+        self.in_flight = None
+
+        self.worker = ContextPrefetchWorker()
+        self.worker.dataReady.connect(self.contextFetched)
+        self.worker.errorEncountered.connect(self.fetchFailed)
+
+    def set_config(self, config):
+        self.worker.stop()
+        self.config = config
+        self.wanted = []
+        for discourse_model, audio in self.contexts.values():
+            discourse_model.close()
+        self.contexts = OrderedDict()
+        self.in_flight = None
+
+    def request(self, wanted):
+        self.wanted = [tuple(x) for x in wanted]
+        if self.in_flight is None:
+            self.fetch_next()
+
+    def take(self, discourse, begin, end):
+        return self.contexts.pop((discourse, begin, end), None)
+
+    def fetch_next(self):
+        if self.config is None:
+            return
+        for key in self.wanted:
+            if key in self.contexts:
+                self.contexts.move_to_end(key)
+                continue
+            discourse, begin, end = key
+            self.in_flight = key
+            self.worker.setParams({'config': self.config,
+                                    'discourse': discourse,
+                                    'begin': begin,
+                                    'end': end})
+            self.worker.start()
+            return
+
+    def contextFetched(self, data):
+        discourse, begin, end, discourse_model, audio = data
+        key = (discourse, begin, end)
+        if key != self.in_flight:
+            discourse_model.close()
+            return
+        self.in_flight = None
+        self.contexts[key] = (discourse_model, audio)
+        while len(self.contexts) > self.max_contexts:
+            key, (evicted, audio) = self.contexts.popitem(last = False)
+            evicted.close()
+        self.fetch_next()
+
+    def fetchFailed(self, e):
+        if self.in_flight in self.wanted:
+            self.wanted.remove(self.in_flight)
+        self.in_flight = None
+        self.errorEncountered.emit(e)
+        self.fetch_next()
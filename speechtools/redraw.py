@@ -0,0 +1,43 @@
+import time
+
+from PyQt5 import QtCore
+
+SIGNAL = 'signal'
+SPECTROGRAM = 'spectrogram'
+ANNOTATIONS = 'annotations'
+TRACKS = 'tracks'
+CURSORS = 'cursors'
+
+class RedrawScheduler(QtCore.QObject):
+    """
+    Collects the layers marked dirty and passes them to ``callback`` at most
+    once per ``interval`` milliseconds (one display frame by default), so a
+    burst of view changes costs a single redraw.
+    """
+    def __init__(self, callback, interval = 16, parent = None):
+        super(RedrawScheduler, self).__init__(parent)
+        self.callback = callback
+        self.interval = interval
+        self.dirty = set()
+        self.last_flush = 0
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+
+    def mark(self, *layers):
+        self.dirty.update(layers)
+        if self.timer.isActive():
+            return
+        elapsed = (time.time() - self.last_flush) * 1000
+        self.timer.start(max(int(self.interval - elapsed), 0))
+
+    def cancel(self):
+        self.timer.stop()
+        self.dirty = set()
+
+    def flush(self):
+        self.timer.stop()
+        layers, self.dirty = self.dirty, set()
+        self.last_flush = time.time()
+        if layers:
+            self.callback(layers)
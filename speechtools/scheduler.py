@@ -0,0 +1,126 @@
+import itertools
+import threading
+
+from PyQt5 import QtCore
+
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+
+class Job(QtCore.QRunnable):
+    def __init__(self, scheduler, worker, kwargs, priority, order):
+        super(Job, self).__init__()
+        self.setAutoDelete(False)
+        self.scheduler = scheduler
+        self.worker = worker
+        self.kwargs = kwargs
+        self.priority = priority
+        self.order = order
+        self.stopped = False
+        self.done = False
+
+    def stop(self):
+        self.stopped = True
+
+    def stopCheck(self):
+        return self.stopped
+
+    def run(self):
+        try:
+            self.worker.run()
+        finally:
+            self.scheduler.release(self)
+
+class JobScheduler(object):
+    """
+    Runs worker jobs on a bounded thread pool.
+
+    Jobs are started in order of priority class and then submission.  One
+    thread is kept free for interactive jobs so that viewport fetches never
+    wait behind long encodings, background jobs run one at a time, and a
+    worker never runs more than one job at once (further jobs are queued,
+    or replace the pending ones for workers that supersede).
+    """
+    def __init__(self, max_threads = 4, reserved_interactive = 1, max_background = 1):
+        self.max_threads = max_threads
+        self.reserved_interactive = reserved_interactive
+        self.max_background = max_background
+        self.pool = QtCore.QThreadPool()
+        self.pool.setMaxThreadCount(max_threads)
+        self.pending = []
+        self.running = []
+        self._counter = itertools.count()
+        self._lock = threading.RLock()
+
+    def submit(self, worker, kwargs):
+        with self._lock:
+            if worker.supersede:
+                self.pending = [x for x in self.pending if x.worker is not worker]
+            job = Job(self, worker, kwargs, worker.priority, next(self._counter))
+            self.pending.append(job)
+            self.pending.sort(key = lambda x: (x.priority, x.order))
+            self._dispatch()
+        return job
+
+    def cancel(self, worker):
+        with self._lock:
+            dropped = [x for x in self.pending if x.worker is worker]
+            self.pending = [x for x in self.pending if x.worker is not worker]
+            for j in self.running:
+                if j.worker is worker:
+                    j.stop()
+        return len(dropped)
+
+    def is_idle(self, worker):
+        with self._lock:
+            if any(x.worker is worker for x in self.pending):
+                return False
+            return all(x.done for x in self.running if x.worker is worker)
+
+    def is_running(self, worker):
+        with self._lock:
+            return any(x.worker is worker for x in self.running)
+
+    def release(self, job):
+        with self._lock:
+            job.done = True
+            self.running.remove(job)
+            if job.worker.job is job:
+                job.worker.job = None
+            self._dispatch()
+
+    def _can_start(self, job):
+        if len(self.running) >= self.max_threads:
+            return False
+        if any(x.worker is job.worker for x in self.running):
+            return False
+        if job.priority == INTERACTIVE:
+            return True
+        if len(self.running) >= self.max_threads - self.reserved_interactive:
+            return False
+        if job.priority == BACKGROUND:
+            num_background = len([x for x in self.running if x.priority == BACKGROUND])
+            if num_background >= self.max_background:
+                return False
+        return True
+
+    def _dispatch(self):
+        for job in list(self.pending):
+            if not self._can_start(job):
+                continue
+            self.pending.remove(job)
+            self.running.append(job)
+            job.worker.job = job
+            job.worker.kwargs = job.kwargs
+            self.pool.start(job, self.max_threads - job.priority)
+
+    def wait(self, msecs = -1):
+        return self.pool.waitForDone(msecs)
+
+_scheduler = None
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = JobScheduler()
+    return _scheduler
@@ -0,0 +1,189 @@
+import threading
+from collections import OrderedDict
+from functools import partial
+
+import numpy as np
+from scipy.signal.windows import gaussian
+from librosa.core.spectrum import stft
+
+from .waveform import load_samples, sample_scale
+
+def nearest_power_of_two(value):
+    return 2 ** int(np.round(np.log2(max(value, 1))))
+
+class SpectrogramView(object):
+    """
+    Parameters of a spectrogram for a time range of one channel of a sound
+    file.  The hop is rounded to a power of two samples so that views of
+    nearby ranges and zooms share tiles.
+    """
+    def __init__(self, path, channel, begin, end, sr, num_steps = 1000,
+                n_fft = 256, window_length = 0.005, window = 'hann', hop = None):
+        self.path = path
+        self.channel = channel
+        self.begin = begin
+        self.end = end
+        self.sr = sr
+        self.num_steps = num_steps
+        self.n_fft = n_fft
+        self.window_length = window_length
+        self.window = window
+        if hop is None:
+            hop = nearest_power_of_two((end - begin) * sr / num_steps)
+        self.hop = hop
+
+    @classmethod
+    def for_canvas(cls, path, channel, begin, end, sr, size,
+                    window_length = 0.005, window = 'hann', max_fft = 2048):
+        """
+        View with about one frame per horizontal pixel and one frequency bin
+        per vertical pixel of a canvas of the given physical size.  Both are
+        rounded to powers of two, so small changes in size or DPI reuse the
+        same tiles.
+        """
+        width, height = size
+        n_fft = nearest_power_of_two(2 * (height - 1))
+        n_fft = max(min(n_fft, max_fft), 2 ** int(np.ceil(np.log2(max(window_length * sr, 2)))))
+        return cls(path, channel, begin, end, sr, num_steps = max(width, 1), n_fft = n_fft,
+                    window_length = window_length, window = window)
+
+    @property
+    def win_len(self):
+        return min(int(self.window_length * self.sr), self.n_fft)
+
+    @property
+    def first_frame(self):
+        return max(int(np.floor(self.begin * self.sr / self.hop)), 0)
+
+    @property
+    def last_frame(self):
+        return int(np.ceil(self.end * self.sr / self.hop))
+
+    @property
+    def frame_offset(self):
+        """
+        Position of the view begin in the image, in frames.  Frame ``i`` is
+        centred on sample ``i * hop`` and drawn over ``i - first_frame`` to
+        ``i - first_frame + 1``, so times from the begin are drawn at
+        ``time * sr / hop + frame_offset``.
+        """
+        return self.begin * self.sr / self.hop - self.first_frame + 0.5
+
+    def coarse(self, factor = 4):
+        return SpectrogramView(self.path, self.channel, self.begin, self.end, self.sr,
+                    self.num_steps, self.n_fft, self.window_length, self.window,
+                    hop = self.hop * factor)
+
+    def tile_key(self, index):
+        return (self.path, self.channel, self.window, self.win_len,
+                    self.n_fft, self.hop, index)
+
+    def same_range(self, other):
+        return other is not None and (self.path, self.channel, self.begin, self.end) == \
+                (other.path, other.channel, other.begin, other.end)
+
+class SpectrogramTiles(object):
+    """
+    Spectrograms computed in tiles of ``frames_per_tile`` frames, with frame
+    ``i`` of every tile set centred on sample ``i * hop``, so tiles for the
+    same parameters can be stitched together for any view.  Tiles are kept
+    in a least recently used cache of at most ``max_bytes``; computing them
+    is safe from worker threads.
+    """
+    def __init__(self, max_bytes = 256 * 1024 * 1024, frames_per_tile = 256,
+                preemphasis = 0.97):
+        self.max_bytes = max_bytes
+        self.frames_per_tile = frames_per_tile
+        self.preemphasis = preemphasis
+        self.tiles = OrderedDict()
+        self.num_bytes = 0
+        self.sources = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self.tiles = OrderedDict()
+            self.num_bytes = 0
+            self.sources = {}
+
+    def source(self, path):
+        # Samples are loaded outside the lock, so other threads can keep
+        # reading tiles; if two threads load a path, the first one stored wins
+        with self._lock:
+            source = self.sources.get(path)
+        if source is not None:
+            return source
+        sr, samples = load_samples(path)
+        with self._lock:
+            return self.sources.setdefault(path, (sr, samples, sample_scale(samples.dtype)))
+
+    def tile_indices(self, view):
+        first = view.first_frame // self.frames_per_tile
+        last = max(view.last_frame - 1, view.first_frame) // self.frames_per_tile
+        return range(first, last + 1)
+
+    def get(self, key):
+        with self._lock:
+            tile = self.tiles.pop(key, None)
+            if tile is not None:
+                self.tiles[key] = tile
+            return tile
+
+    def put(self, key, tile):
+        with self._lock:
+            if key in self.tiles:
+                return
+            self.tiles[key] = tile
+            self.num_bytes += tile.nbytes
+            while self.num_bytes > self.max_bytes and len(self.tiles) > 1:
+                k, v = self.tiles.popitem(last = False)
+                self.num_bytes -= v.nbytes
+
+    def is_cached(self, view):
+        with self._lock:
+            return all(view.tile_key(i) in self.tiles for i in self.tile_indices(view))
+
+    def compute_tile(self, view, index):
+        sr, samples, scale = self.source(view.path)
+        hop = view.hop
+        n_fft = view.n_fft
+        num_frames = self.frames_per_tile
+        begin = index * num_frames * hop - n_fft // 2
+        length = (num_frames - 1) * hop + n_fft
+        # One extra sample before the tile for the pre-emphasis filter
+        segment = np.zeros(length + 1, dtype = np.float32)
+        start = max(begin - 1, 0)
+        stop = min(begin + length, samples.shape[0])
+        if stop > start:
+            offset = start - (begin - 1)
+            segment[offset:offset + stop - start] = samples[start:stop, view.channel]
+        segment *= scale
+        segment = segment[1:] - self.preemphasis * segment[:-1]
+        if view.window == 'gaussian':
+            window = partial(gaussian, std = 0.45 * view.win_len / 2)
+        else:
+            window = view.window
+        data = stft(segment, n_fft = n_fft, hop_length = hop, win_length = view.win_len,
+                    window = window, center = False)
+        data = 20 * np.log10(np.abs(data) + 1e-10)
+        return data[:, :num_frames].astype(np.float32)
+
+    def image(self, view, compute = True, stop_check = None):
+        """
+        Stitch the tiles for a view into one image of frequency bins by
+        frames.  Missing tiles are computed unless ``compute`` is False, in
+        which case (or if stopped) None is returned.
+        """
+        tiles = []
+        for index in self.tile_indices(view):
+            key = view.tile_key(index)
+            tile = self.get(key)
+            if tile is None:
+                if not compute or (stop_check is not None and stop_check()):
+                    return None
+                tile = self.compute_tile(view, index)
+                self.put(key, tile)
+            tiles.append(tile)
+        offset = self.tile_indices(view)[0] * self.frames_per_tile
+        image = np.concatenate(tiles, axis = 1)
+        return image[:, view.first_frame - offset:view.last_frame - offset]
@@ -0,0 +1,193 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .waveform import load_samples, sample_scale
+
+class StreamingSoundFile(object):
+    """
+    Sliding window over a sound file for the discourse view, in place of
+    loading a new ``LongSoundFile`` for every window.
+
+    Samples are read from a memory map of the file and decoded to float32
+    in blocks of ``block_size`` samples, which are kept in a ring of at most
+    ``max_bytes`` so that moving the window only reads the blocks it has
+    not seen; ``evict`` drops the blocks far from the view.  ``fill``
+    assembles the window around a view, reading ahead in the pan direction;
+    it is safe to call from a worker thread, as the window is swapped in
+    whole, under the same lock ``evict`` holds while it trims the window.  The ``visible_*`` methods return views of the current window
+    without copying, and never read from the file: samples outside the
+    window come back as silence until a fill lands.
+    """
+    def __init__(self, path, block_size = 2 ** 16, max_bytes = 64 * 1024 * 1024,
+                cache_window = 5, read_ahead = 2, preemphasis = 0.97):
+        self.path = path
+        self.sr, self.samples = load_samples(path)
+        self.scale = sample_scale(self.samples.dtype)
+        self.num_samples, self.num_channels = self.samples.shape
+        self.duration = self.num_samples / self.sr
+        self.block_size = block_size
+        self.max_blocks = max(max_bytes // (block_size * self.num_channels * 4), 1)
+        self.cache_window = cache_window
+        self.read_ahead = read_ahead
+        self.preemphasis = preemphasis
+        self.blocks = OrderedDict()
+        self._lock = threading.Lock()
+        self._window = (0, np.zeros((self.num_channels, 0), dtype = np.float32), {})
+
+    @property
+    def cached_begin(self):
+        return self._window[0] / self.sr
+
+    @property
+    def cached_end(self):
+        start, data, _ = self._window
+        return (start + data.shape[1]) / self.sr
+
+    def covers(self, begin, end):
+        return self.cached_begin <= max(begin, 0) and \
+                min(end, self.duration) <= self.cached_end
+
+    def block(self, index):
+        with self._lock:
+            block = self.blocks.pop(index, None)
+            if block is None:
+                begin = index * self.block_size
+                block = np.array(self.samples[begin:begin + self.block_size].T,
+                                dtype = np.float32)
+                block *= self.scale
+            self.blocks[index] = block
+            while len(self.blocks) > self.max_blocks:
+                self.blocks.popitem(last = False)
+            return block
+
+    def margins(self, begin, end, direction = 0):
+        """
+        Seconds that ``fill`` reads before and after a view of begin to end:
+        ``cache_window`` on either side, plus ``read_ahead`` times the view
+        duration further on in the direction of panning (the sign of
+        ``direction``)
+        """
+        ahead = (end - begin) * self.read_ahead
+        return (self.cache_window + (ahead if direction < 0 else 0),
+                self.cache_window + (ahead if direction > 0 else 0))
+
+    def reach(self, begin, end):
+        """Widest range ``fill`` can cache for a view of begin to end, panning either way"""
+        ahead = (end - begin) * self.read_ahead
+        return begin - self.cache_window - ahead, end + self.cache_window + ahead
+
+    def fill(self, begin, end, direction = 0):
+        """
+        Make the window cover begin to end with the margins given by
+        ``margins`` for the direction of panning
+        """
+        before, after = self.margins(begin, end, direction)
+        begin -= before
+        end += after
+        first = max(int(begin * self.sr), 0) // self.block_size
+        last = min(int(np.ceil(end * self.sr)), self.num_samples)
+        last = max(int(np.ceil(last / self.block_size)), first + 1)
+        data = np.concatenate([self.block(i) for i in range(first, last)], axis = 1)
+        with self._lock:
+            self._window = (first * self.block_size, data, {})
+        return self
+
+    def evict(self, begin, end):
+        """
+        Drop the decoded blocks outside begin to end, and trim the window to
+        them if at least one block of it lies outside.  The trimmed window
+        is a view of the old one, so nothing is copied; its memory is
+        released when the next ``fill`` replaces it.  Returns whether the
+        window changed.
+        """
+        first = max(int(begin * self.sr), 0) // self.block_size
+        last = max(int(np.ceil(end * self.sr / self.block_size)), first + 1)
+        with self._lock:
+            for index in [x for x in self.blocks if not first <= x < last]:
+                del self.blocks[index]
+            start, data, _ = self._window
+            window_first = start // self.block_size
+            window_last = window_first + int(np.ceil(data.shape[1] / self.block_size))
+            if first <= window_first and window_last <= last:
+                return False
+            first, last = max(first, window_first), min(last, window_last)
+            if last <= first:
+                self._window = (0, np.zeros((self.num_channels, 0), dtype = np.float32), {})
+            else:
+                data = data[:, (first - window_first) * self.block_size:(last - window_first) * self.block_size]
+                self._window = (first * self.block_size, data, {})
+            return True
+
+    def _range(self, begin, end):
+        """
+        Samples of the window between begin and end, and how many samples
+        of the range lie before and after the window.  Nothing is read
+        here, so drawing never waits on the disk; ranges the window does
+        not cover are left to ``fill`` in a worker.
+        """
+        start, data, derived = self._window
+        first = max(int(begin * self.sr), 0)
+        last = min(max(int(end * self.sr), first), self.num_samples)
+        begin = min(max(first - start, 0), data.shape[1])
+        end = min(max(last - start, begin), data.shape[1])
+        before = max(min(start + begin, last) - first, 0)
+        after = last - first - before - (end - begin)
+        return begin, end, data, derived, before, after
+
+    def _padded(self, samples, before, after):
+        """Samples with silence in place of those not loaded"""
+        if not before and not after:
+            return samples
+        widths = [(0, 0)] * (samples.ndim - 1) + [(before, after)]
+        return np.pad(samples, widths, mode = 'constant')
+
+    def visible_signal(self, begin, end, channel = 0):
+        begin, end, data, _, before, after = self._range(begin, end)
+        return self._padded(data[channel, begin:end], before, after)
+
+    def clip(self, begin, end):
+        """
+        All channels between begin and end, as a channels by samples array.
+        Unlike the ``visible_*`` methods, blocks outside the window are read
+        in, as a clip is played in full.
+        """
+        first = max(int(begin * self.sr), 0)
+        last = min(max(int(end * self.sr), first), self.num_samples)
+        if not self.covers(first / self.sr, last / self.sr):
+            if last == first:
+                return np.zeros((self.num_channels, 0), dtype = np.float32)
+            blocks = range(first // self.block_size, (last - 1) // self.block_size + 1)
+            data = np.concatenate([self.block(i) for i in blocks], axis = 1)
+            offset = blocks[0] * self.block_size
+            return data[:, first - offset:last - offset]
+        begin, end, data, _, _, _ = self._range(begin, end)
+        return data[:, begin:end]
+
+    def visible_preemph_signal(self, begin, end, channel = 0):
+        begin, end, data, derived, before, after = self._range(begin, end)
+        if 'preemph' not in derived:
+            preemph = np.empty_like(data)
+            if data.shape[1]:
+                preemph[:, 0] = data[:, 0]
+                preemph[:, 1:] = data[:, 1:] - self.preemphasis * data[:, :-1]
+            derived['preemph'] = preemph
+        return self._padded(derived['preemph'][channel, begin:end], before, after)
+
+    def downsampled_step(self, sr):
+        return max(int(self.sr // sr), 1)
+
+    def downsampled_rate(self, sr):
+        """Actual sampling rate of the signals returned for a target rate"""
+        return self.sr / self.downsampled_step(sr)
+
+    def visible_downsampled(self, begin, end, channel, sr):
+        begin, end, data, _, before, after = self._range(begin, end)
+        return self._padded(data[channel, begin:end], before, after)[::self.downsampled_step(sr)]
+
+    def visible_downsampled_1000(self, begin, end, channel = 0):
+        return self.visible_downsampled(begin, end, channel, 1000)
+
+    def visible_downsampled_100(self, begin, end, channel = 0):
+        return self.visible_downsampled(begin, end, channel, 100)
@@ -4,6 +4,7 @@ from PyQt5 import QtGui, QtCore, QtWidgets
 
 class ResultsView(QtWidgets.QTableView):
     viewRequested = QtCore.pyqtSignal(str, float, float)
+    prefetchRequested = QtCore.pyqtSignal(object)
     def __init__(self, parent = None):
         super(ResultsView, self).__init__(parent)
         self.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
@@ -18,6 +19,9 @@ class ResultsView(QtWidgets.QTableView):
 
         self.clip = QtWidgets.QApplication.clipboard()
 
+        self.num_following = 3
+        self.num_preceding = 1
+
         self.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Interactive)
 
     def keyPressEvent(self, e):
@@ -52,10 +56,47 @@ class ResultsView(QtWidgets.QTableView):
             self.model().sourceModel().markRowAsAnnotated(index.row(), value)
 
     def requestView(self, index):
+        row = index.row()
         index = self.model().mapToSource(index)
         times = self.model().sourceModel().times(index)
         discourse = self.model().sourceModel().discourse(index)
         self.viewRequested.emit(discourse, *times)
+        self.prefetchRequested.emit(self.neighbours(row))
+
+    def neighbours(self, row):
+        """
+        Discourse, begin and end of the results around a view row that are
+        likely to be viewed next, nearest (and following before preceding)
+        first
+        """
+        rows = []
+        for i in range(1, max(self.num_following, self.num_preceding) + 1):
+            if i <= self.num_following and row + i < self.model().rowCount():
+                rows.append(row + i)
+            if i <= self.num_preceding and row - i >= 0:
+                rows.append(row - i)
+        return [x[1:] for r in rows for x in self.clips(r)[:1]]
+
+    def clips(self, start = 0):
+        """
+        Source row, discourse, begin and end of each result from the view
+        row start onwards, in the order shown
+        """
+        proxy = self.model()
+        source = proxy.sourceModel()
+        clips = []
+        for row in range(start, proxy.rowCount()):
+            index = proxy.mapToSource(proxy.index(row, 0))
+            clips.append((index.row(), source.discourse(index)) + tuple(source.times(index)))
+        return clips
+
+    def selectSourceRow(self, row):
+        index = self.model().mapFromSource(self.model().sourceModel().index(row, 0))
+        if not index.isValid():
+            return
+        self.selectionModel().select(index,
+                QtCore.QItemSelectionModel.ClearAndSelect | QtCore.QItemSelectionModel.Rows)
+        self.scrollTo(index)
 
     def showMenu(self, pos):
         menu = QtWidgets.QMenu()
@@ -0,0 +1,290 @@
+import os
+import json
+import hashlib
+import threading
+
+import numpy as np
+import librosa
+from scipy.io import wavfile
+
+from polyglotdb.config import BASE_DIR
+
+AUDIO_CACHE_DIR = os.path.join(BASE_DIR, 'audio_cache')
+
+AUDIO_CACHE_BYTES = 4 * 1024 ** 3
+
+def cache_key(path):
+    stat = os.stat(path)
+    key = '{}:{}:{}'.format(os.path.abspath(path), stat.st_mtime, stat.st_size)
+    return hashlib.sha1(key.encode('utf8')).hexdigest()
+
+class DecodedAudioCache(object):
+    """
+    Decoded samples of sound files that cannot be memory mapped as wav files
+    (FLAC, MP3 and so on), stored as float32 arrays in the audio cache under
+    the same key as the envelope pyramids, so that each file is decoded
+    once.  The least recently used files are deleted once the cache holds
+    more than ``max_bytes`` of decoded audio (the ``audio_cache_bytes`` of
+    the corpus config, see ``configure_decoded_cache``).
+    """
+    def __init__(self, cache_dir = AUDIO_CACHE_DIR, max_bytes = AUDIO_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def paths(self, sound_path):
+        base = os.path.join(self.cache_dir, cache_key(sound_path) + '.decoded')
+        return base + '.npy', base + '.json'
+
+    def get(self, sound_path):
+        data_path, meta_path = self.paths(sound_path)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            data = np.load(data_path, mmap_mode = 'r')
+        except (OSError, ValueError):
+            return None
+        # Mark as recently used
+        os.utime(data_path)
+        return meta['sr'], data
+
+    def put(self, sound_path):
+        os.makedirs(self.cache_dir, exist_ok = True)
+        data_path, meta_path = self.paths(sound_path)
+        data, sr = librosa.load(sound_path, sr = None, mono = False)
+        data = np.atleast_2d(data).T.astype(np.float32)
+        temp_path = data_path + '.tmp.npy'
+        np.save(temp_path, data)
+        os.replace(temp_path, data_path)
+        with open(meta_path, 'w') as f:
+            json.dump({'sr': int(sr)}, f)
+        self.evict(keep = data_path)
+        return self.get(sound_path)
+
+    def load(self, sound_path):
+        """
+        Sampling rate and memory mapped samples by channels array of a sound
+        file, decoding it into the cache if it is not there yet
+        """
+        with self._lock:
+            cached = self.get(sound_path)
+            if cached is None:
+                cached = self.put(sound_path)
+            return cached
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self.evict()
+
+    def entries(self):
+        entries = []
+        if not os.path.exists(self.cache_dir):
+            return entries
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.decoded.npy'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self, keep = None):
+        entries = self.entries()
+        total = sum(x[1] for x in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                os.remove(path[:-len('.npy')] + '.json')
+            except OSError:
+                # Still mapped by a reader on some platforms
+                continue
+            total -= size
+
+_decoded_cache = None
+
+def get_decoded_cache():
+    global _decoded_cache
+    if _decoded_cache is None:
+        _decoded_cache = DecodedAudioCache()
+    return _decoded_cache
+
+def configure_decoded_cache(config):
+    """Size the decoded audio cache from a corpus config"""
+    get_decoded_cache().set_max_bytes(getattr(config, 'audio_cache_bytes', AUDIO_CACHE_BYTES))
+
+def load_samples(path, cache = None):
+    """
+    Load the samples of a sound file as a samples by channels array, memory
+    mapped for wav files (see ``sample_scale`` for integer formats) and from
+    the decoded audio cache for other formats
+    """
+    try:
+        sr, data = wavfile.read(path, mmap = True)
+    except ValueError:
+        if cache is None:
+            cache = get_decoded_cache()
+        sr, data = cache.load(path)
+    if data.ndim == 1:
+        data = data[:, None]
+    return sr, data
+
+def load_clip(path, begin, end, sr = None, cache = None):
+    """
+    Samples of a sound file between begin and end mixed down to one float32
+    channel, resampled (linearly) to sr if given.  Returns the sampling rate
+    and the samples.
+    """
+    file_sr, samples = load_samples(path, cache)
+    first = min(max(int(begin * file_sr), 0), samples.shape[0])
+    last = min(max(int(end * file_sr), first), samples.shape[0])
+    clip = np.asarray(samples[first:last], dtype = np.float32).mean(axis = 1)
+    clip *= sample_scale(samples.dtype)
+    if sr is None or sr == file_sr:
+        return file_sr, clip
+    num_samples = int(round(clip.shape[0] * sr / file_sr))
+    times = np.arange(num_samples) / sr
+    clip = np.interp(times, np.arange(clip.shape[0]) / file_sr, clip).astype(np.float32)
+    return sr, clip
+
+def sample_scale(dtype):
+    if np.issubdtype(dtype, np.integer):
+        return 1 / np.iinfo(dtype).max
+    return 1
+
+def level_sizes(num_samples, base_size):
+    sizes = [max(int(np.ceil(num_samples / base_size)), 1)]
+    while sizes[-1] > 1:
+        sizes.append(int(np.ceil(sizes[-1] / 2)))
+    return sizes
+
+def _pad_edge(data, length):
+    if data.shape[0] == length:
+        return data
+    pad = [(0, length - data.shape[0])] + [(0, 0)] * (data.ndim - 1)
+    return np.pad(data, pad, mode = 'edge')
+
+class WaveformPyramid(object):
+    """
+    Min/max envelopes of a sound file at power-of-two resolutions, stored
+    in a single memory-mapped file in the audio cache.  Level 0 has one
+    min/max pair per ``base_size`` samples and every level above it halves
+    the level below, so any zoom can be drawn from the level closest to
+    the screen resolution without touching the samples.
+    """
+    def __init__(self, sound_path, sr, num_samples, num_channels, base_size, data):
+        self.sound_path = sound_path
+        self.sr = sr
+        self.num_samples = num_samples
+        self.num_channels = num_channels
+        self.base_size = base_size
+        self.data = data
+        self.sizes = level_sizes(num_samples, base_size)
+        self.offsets = np.concatenate(([0], np.cumsum(self.sizes)[:-1]))
+
+    @staticmethod
+    def paths(sound_path, cache_dir):
+        base = os.path.join(cache_dir, cache_key(sound_path) + '.envelope')
+        return base + '.npy', base + '.json'
+
+    @classmethod
+    def load(cls, sound_path, cache_dir = AUDIO_CACHE_DIR):
+        data_path, meta_path = cls.paths(sound_path, cache_dir)
+        if not os.path.exists(meta_path) or not os.path.exists(data_path):
+            return None
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        data = np.load(data_path, mmap_mode = 'r')
+        return cls(sound_path, meta['sr'], meta['num_samples'],
+                    meta['num_channels'], meta['base_size'], data)
+
+    @classmethod
+    def build(cls, sound_path, cache_dir = AUDIO_CACHE_DIR, base_size = 64,
+                block_size = 2 ** 22, stop_check = None):
+        """
+        Compute the pyramid for a sound file block by block and write it to
+        the cache.  Returns None if stopped before finishing.
+        """
+        os.makedirs(cache_dir, exist_ok = True)
+        data_path, meta_path = cls.paths(sound_path, cache_dir)
+        sr, samples = load_samples(sound_path)
+        num_samples, num_channels = samples.shape
+        scale = sample_scale(samples.dtype)
+        sizes = level_sizes(num_samples, base_size)
+        temp_path = data_path + '.tmp.npy'
+        envelope = np.lib.format.open_memmap(temp_path, mode = 'w+', dtype = np.float32,
+                                    shape = (sum(sizes), num_channels, 2))
+        block_size -= block_size % base_size
+        for begin in range(0, num_samples, block_size):
+            if stop_check is not None and stop_check():
+                del envelope
+                os.remove(temp_path)
+                return None
+            block = np.asarray(samples[begin:begin + block_size], dtype = np.float32) * scale
+            num_bins = int(np.ceil(block.shape[0] / base_size))
+            block = _pad_edge(block, num_bins * base_size).reshape(num_bins, base_size, num_channels)
+            first = begin // base_size
+            envelope[first:first + num_bins, :, 0] = block.min(axis = 1)
+            envelope[first:first + num_bins, :, 1] = block.max(axis = 1)
+        offset = 0
+        for size, next_size in zip(sizes[:-1], sizes[1:]):
+            level = _pad_edge(envelope[offset:offset + size], next_size * 2)
+            level = level.reshape(next_size, 2, num_channels, 2)
+            offset += size
+            envelope[offset:offset + next_size, :, 0] = level[:, :, :, 0].min(axis = 1)
+            envelope[offset:offset + next_size, :, 1] = level[:, :, :, 1].max(axis = 1)
+        envelope.flush()
+        del envelope
+        os.replace(temp_path, data_path)
+        with open(meta_path, 'w') as f:
+            json.dump({'sr': int(sr), 'num_samples': int(num_samples),
+                        'num_channels': int(num_channels),
+                        'base_size': base_size}, f)
+        return cls.load(sound_path, cache_dir)
+
+    @classmethod
+    def load_or_build(cls, sound_path, cache_dir = AUDIO_CACHE_DIR, stop_check = None):
+        pyramid = cls.load(sound_path, cache_dir)
+        if pyramid is None:
+            pyramid = cls.build(sound_path, cache_dir, stop_check = stop_check)
+        return pyramid
+
+    def level_for(self, begin, end, num_pixels, points_per_pixel = 2):
+        """
+        Level whose bins are closest to (but not wider than) the number of
+        samples per pair of points, or None if raw samples are finer than
+        level 0 needs to be
+        """
+        samples_per_bin = (end - begin) * self.sr * 2 / (num_pixels * points_per_pixel)
+        if samples_per_bin < self.base_size:
+            return None
+        level = int(np.log2(samples_per_bin / self.base_size))
+        return min(level, len(self.sizes) - 1)
+
+    def envelope(self, begin, end, channel, num_pixels, points_per_pixel = 2):
+        """
+        Time and amplitude points alternating between the minimum and maximum
+        of each bin between begin and end, or None when the view is short
+        enough to draw the samples themselves
+        """
+        level = self.level_for(begin, end, num_pixels, points_per_pixel)
+        if level is None:
+            return None
+        bin_size = self.base_size * 2 ** level
+        first = max(int(begin * self.sr // bin_size), 0)
+        last = min(int(np.ceil(end * self.sr / bin_size)), self.sizes[level])
+        if last <= first:
+            return None
+        offset = self.offsets[level]
+        env = self.data[offset + first:offset + last, channel]
+        times = (np.arange(first, last) * bin_size + bin_size / 2) / self.sr
+        output = np.empty((env.shape[0] * 2, 2), dtype = np.float32)
+        output[0::2, 0] = times
+        output[1::2, 0] = times
+        output[0::2, 1] = env[:, 0]
+        output[1::2, 1] = env[:, 1]
+        return output
@@ -1,27 +1,336 @@
+from collections import deque
+
+import numpy as np
 
 from PyQt5 import QtGui, QtCore, QtWidgets, QtMultimedia
 
-class MediaPlayer(QtMultimedia.QMediaPlayer):
-    def __init__(self):
-        super(MediaPlayer, self).__init__()
-        self.max_time = None
-        self.min_time = None
-        self.setNotifyInterval(1)
-        self.positionChanged.connect(self.checkStop)
-
-    def setMaxTime(self, max_time):
-        self.max_time = max_time * 1000
-
-    def setMinTime(self, min_time):
-        self.min_time = min_time * 1000
-
-    def checkStop(self, position):
-        #print(self.mediaStatus())
-        #print(position, self.max_time)
-        if self.state() == QtMultimedia.QMediaPlayer.PlayingState:
-            if self.min_time is not None:
-                if position < self.min_time:
-                    self.setPosition(self.min_time)
-            if self.max_time is not None:
-                if position > self.max_time:
-                    self.stop()
+from ..workers import ClipWorker
+
+def to_pcm(samples):
+    """
+    Interleaved little-endian 16 bit PCM bytes of a channels by samples
+    array of float samples
+    """
+    pcm = np.clip(samples.T, -1, 1) * 32767
+    return pcm.astype('<i2').tobytes()
+
+def make_output(sr, num_channels, buffer_duration, parent = None):
+    """16 bit PCM audio output with a buffer of buffer_duration seconds"""
+    audio_format = QtMultimedia.QAudioFormat()
+    audio_format.setSampleRate(sr)
+    audio_format.setChannelCount(num_channels)
+    audio_format.setSampleSize(16)
+    audio_format.setCodec('audio/pcm')
+    audio_format.setByteOrder(QtMultimedia.QAudioFormat.LittleEndian)
+    audio_format.setSampleType(QtMultimedia.QAudioFormat.SignedInt)
+    output = QtMultimedia.QAudioOutput(audio_format, parent)
+    output.setBufferSize(int(sr * num_channels * 2 * buffer_duration))
+    return output
+
+class ClipDevice(QtCore.QIODevice):
+    """
+    Read-only device over the PCM bytes of one clip for a pull-mode audio
+    output, which runs dry exactly at the end of the clip.  It is opened
+    unbuffered so that ``offset`` counts the bytes handed to the output,
+    and can be seeked to replay part of the clip.
+    """
+    def __init__(self, data, parent = None):
+        super(ClipDevice, self).__init__(parent)
+        self.data = data
+        self.offset = 0
+        self.open(QtCore.QIODevice.ReadOnly | QtCore.QIODevice.Unbuffered)
+
+    def readData(self, maxlen):
+        chunk = self.data[self.offset:self.offset + maxlen]
+        self.offset += len(chunk)
+        return chunk
+
+    def writeData(self, data):
+        return -1
+
+    def seek(self, pos):
+        if not 0 <= pos <= len(self.data):
+            return False
+        self.offset = pos
+        return super(ClipDevice, self).seek(pos)
+
+    def size(self):
+        return len(self.data)
+
+    def bytesAvailable(self):
+        return len(self.data) - self.offset
+
+class AudioPlayer(QtCore.QObject):
+    """
+    Plays a time range of a sound file through a pull-mode audio output.
+
+    The clip is cut from the samples the view already holds (see
+    ``StreamingSoundFile.clip``), so nothing is reopened or decoded to start
+    playing, and it ends on the last sample of the range rather than when a
+    position poll notices it has gone past.  The output is kept while the
+    sampling rate and number of channels stay the same, and the play
+    position is reported every ``frame_interval`` milliseconds from the
+    bytes the output has consumed.
+    """
+    positionChanged = QtCore.pyqtSignal(object)
+    stateChanged = QtCore.pyqtSignal(object)
+    error = QtCore.pyqtSignal(object)
+
+    def __init__(self, frame_interval = 16, buffer_duration = 0.05, parent = None):
+        super(AudioPlayer, self).__init__(parent)
+        self.buffer_duration = buffer_duration
+        self.output = None
+        self.output_format = None
+        self.device = None
+        self.begin = 0
+        self.sr = None
+        self.bytes_per_frame = 2
+        self.clock = QtCore.QTimer(self)
+        self.clock.setInterval(frame_interval)
+        self.clock.timeout.connect(self.updatePosition)
+
+    def state(self):
+        if self.output is None or self.device is None:
+            return QtMultimedia.QAudio.StoppedState
+        state = self.output.state()
+        if state == QtMultimedia.QAudio.IdleState:
+            return QtMultimedia.QAudio.StoppedState
+        return state
+
+    def outputFor(self, sr, num_channels):
+        if self.output is not None and self.output_format == (sr, num_channels):
+            return self.output
+        if self.output is not None:
+            self.output.stop()
+            self.output.deleteLater()
+        self.output = make_output(sr, num_channels, self.buffer_duration, self)
+        self.output.stateChanged.connect(self.handleState)
+        self.output_format = (sr, num_channels)
+        return self.output
+
+    def play(self, audio, begin, end):
+        """
+        Play the samples of an audio source (a ``StreamingSoundFile``)
+        between begin and end
+        """
+        self.stop()
+        begin = max(begin, 0)
+        clip = audio.clip(begin, end)
+        if clip.shape[1] == 0:
+            return
+        output = self.outputFor(audio.sr, clip.shape[0])
+        self.sr = audio.sr
+        self.begin = int(begin * audio.sr) / audio.sr
+        self.bytes_per_frame = 2 * clip.shape[0]
+        self.device = ClipDevice(to_pcm(clip), self)
+        output.start(self.device)
+        self.clock.start()
+
+    def pause(self):
+        if self.state() == QtMultimedia.QAudio.ActiveState:
+            self.output.suspend()
+            self.clock.stop()
+            self.updatePosition()
+
+    def resume(self):
+        if self.state() == QtMultimedia.QAudio.SuspendedState:
+            self.output.resume()
+            self.clock.start()
+
+    def stop(self):
+        self.clock.stop()
+        if self.output is not None and self.device is not None:
+            self.output.stop()
+        self.device = None
+
+    def position(self):
+        if self.device is None:
+            return None
+        queued = self.output.bufferSize() - self.output.bytesFree()
+        frames = max(self.device.offset - queued, 0) // self.bytes_per_frame
+        return self.begin + frames / self.sr
+
+    def updatePosition(self):
+        position = self.position()
+        if position is not None:
+            self.positionChanged.emit(position)
+
+    def handleState(self, state):
+        if state == QtMultimedia.QAudio.IdleState:
+            # The clip has been played out; stopping emits the stopped state
+            self.stop()
+            return
+        if state == QtMultimedia.QAudio.StoppedState:
+            self.clock.stop()
+            self.device = None
+            if self.output.error() not in (QtMultimedia.QAudio.NoError,
+                                        QtMultimedia.QAudio.UnderrunError):
+                self.error.emit('Audio output error: {}'.format(self.output.error()))
+        self.stateChanged.emit(state)
+
+class QueueDevice(QtCore.QIODevice):
+    """
+    Read-only device that plays queued clips back to back, with no gap
+    between them, for a pull-mode audio output.  The byte offset at which
+    each clip starts is recorded so that the player can tell which clip is
+    being heard.
+    """
+    def __init__(self, parent = None):
+        super(QueueDevice, self).__init__(parent)
+        self.clips = deque()
+        self.starts = deque()
+        self.current = b''
+        self.current_offset = 0
+        self.offset = 0
+        self.open(QtCore.QIODevice.ReadOnly)
+
+    def append(self, key, data):
+        self.clips.append((key, data))
+        self.readyRead.emit()
+
+    def queued(self):
+        return len(self.clips)
+
+    def readData(self, maxlen):
+        chunks = []
+        remaining = maxlen
+        while remaining > 0:
+            if self.current_offset >= len(self.current):
+                if not self.clips:
+                    break
+                key, self.current = self.clips.popleft()
+                self.current_offset = 0
+                self.starts.append((self.offset + maxlen - remaining, key))
+            chunk = self.current[self.current_offset:self.current_offset + remaining]
+            self.current_offset += len(chunk)
+            remaining -= len(chunk)
+            chunks.append(chunk)
+        self.offset += maxlen - remaining
+        return b''.join(chunks)
+
+    def writeData(self, data):
+        return -1
+
+    def bytesAvailable(self):
+        available = len(self.current) - self.current_offset + sum(len(x[1]) for x in self.clips)
+        return available + super(QueueDevice, self).bytesAvailable()
+
+    def isSequential(self):
+        return True
+
+class ClipQueuePlayer(QtCore.QObject):
+    """
+    Plays the audio of a list of query results one after another.
+
+    Clips are loaded ``prefetch`` at a time by a ClipWorker while earlier
+    ones play, and queued on a single mono output, so consecutive results
+    play without gaps (clips from files with a different sampling rate are
+    resampled to that of the first).  ``clipStarted`` is emitted with the
+    key of each clip as it becomes audible.
+    """
+    clipStarted = QtCore.pyqtSignal(object)
+    stateChanged = QtCore.pyqtSignal(object)
+    error = QtCore.pyqtSignal(object)
+
+    def __init__(self, prefetch = 3, frame_interval = 16, buffer_duration = 0.1, parent = None):
+        super(ClipQueuePlayer, self).__init__(parent)
+        self.prefetch = prefetch
+        self.buffer_duration = buffer_duration
+        self.config = None
+        self.padding = 0
+        self.pending = deque()
+        self.sound_files = {}
+        self.sr = None
+        self.output = None
+        self.output_sr = None
+        self.device = None
+        self.worker = ClipWorker()
+        self.worker.dataReady.connect(self.addClips)
+        self.worker.errorEncountered.connect(self.error.emit)
+        self.clock = QtCore.QTimer(self)
+        self.clock.setInterval(frame_interval)
+        self.clock.timeout.connect(self.updatePosition)
+
+    def isPlaying(self):
+        return self.device is not None
+
+    def play(self, clips, config, padding = 0):
+        """
+        Play clips, a list of (key, discourse, begin, end) tuples, with
+        padding seconds of audio before and after each
+        """
+        self.stop()
+        if config != self.config:
+            self.sound_files = {}
+        self.config = config
+        self.padding = padding
+        self.pending = deque(clips)
+        self.sr = None
+        self.device = QueueDevice(self)
+        self.request()
+
+    def request(self):
+        if self.device is None or not self.pending or not self.worker.finished:
+            return
+        num_clips = self.prefetch - self.device.queued()
+        if num_clips <= 0:
+            return
+        batch = [self.pending.popleft() for _ in range(min(num_clips, len(self.pending)))]
+        self.worker.setParams({'config': self.config, 'clips': batch, 'padding': self.padding,
+                            'sr': self.sr, 'sound_files': self.sound_files})
+        self.worker.start()
+
+    def addClips(self, clips):
+        if self.device is None:
+            return
+        for key, sr, samples in clips:
+            if self.sr is None:
+                self.sr = sr
+            if self.output is None or self.output_sr != sr:
+                if self.output is not None:
+                    self.output.deleteLater()
+                self.output = make_output(sr, 1, self.buffer_duration, self)
+                self.output.stateChanged.connect(self.handleState)
+                self.output_sr = sr
+            self.device.append(key, to_pcm(samples[None, :]))
+        if self.output is not None and self.output.state() == QtMultimedia.QAudio.StoppedState:
+            self.output.start(self.device)
+            self.clock.start()
+        self.request()
+        if self.output is None and not self.pending and self.worker.finished:
+            # Nothing could be loaded
+            self.stop()
+
+    def stop(self):
+        self.clock.stop()
+        self.pending = deque()
+        self.worker.stop()
+        device, self.device = self.device, None
+        if device is None:
+            return
+        if self.output is not None and self.output.state() != QtMultimedia.QAudio.StoppedState:
+            # Emits the stopped state through handleState
+            self.output.stop()
+        else:
+            self.stateChanged.emit(QtMultimedia.QAudio.StoppedState)
+
+    def updatePosition(self):
+        if self.device is None:
+            return
+        queued = self.output.bufferSize() - self.output.bytesFree()
+        played = self.device.offset - queued
+        while self.device.starts and self.device.starts[0][0] <= played:
+            self.clipStarted.emit(self.device.starts.popleft()[1])
+        self.request()
+
+    def handleState(self, state):
+        if state == QtMultimedia.QAudio.IdleState:
+            # Either the queue has run dry waiting for clips, or it is done
+            if self.device is not None and not self.pending and \
+                    self.worker.finished and not self.device.queued():
+                self.stop()
+            return
+        if state == QtMultimedia.QAudio.StoppedState and self.output.error() not in (
+                QtMultimedia.QAudio.NoError, QtMultimedia.QAudio.UnderrunError):
+            self.error.emit('Audio output error: {}'.format(self.output.error()))
+        self.stateChanged.emit(state)
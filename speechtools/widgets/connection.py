@@ -11,6 +11,10 @@ from polyglotdb import CorpusContext
 
 from ..workers import AudioFinderWorker, AudioCheckerWorker
 
+from ..pool import get_context_pool
+
+from ..waveform import AUDIO_CACHE_BYTES
+
 class CorporaList(QtWidgets.QGroupBox):
     selectionChanged = QtCore.pyqtSignal(object)
     cancelImporter = QtCore.pyqtSignal()
@@ -162,11 +166,16 @@ class ConnectWidget(QtWidgets.QWidget):
         if config is not None:
             self.passwordEdit.setText(config.graph_password)
         self.passwordEdit.setEchoMode(QtWidgets.QLineEdit.Password)
+        self.audioCacheEdit = QtWidgets.QSpinBox()
+        self.audioCacheEdit.setRange(1, 1024)
+        self.audioCacheEdit.setSuffix(' GB')
+        self.audioCacheEdit.setValue(getattr(config, 'audio_cache_bytes', AUDIO_CACHE_BYTES) // 1024 ** 3)
 
         self.formlayout.addRow('IP address (or localhost)', self.hostEdit)
         self.formlayout.addRow('Port', self.portEdit)
         self.formlayout.addRow('Username (optional)', self.userEdit)
         self.formlayout.addRow('Password (optional)', self.passwordEdit)
+        self.formlayout.addRow('Decoded audio cache', self.audioCacheEdit)
 
         connectButton = QtWidgets.QPushButton('Connect')
         connectButton.clicked.connect(self.connectToServer)
@@ -245,6 +254,7 @@ class ConnectWidget(QtWidgets.QWidget):
             current_corpus = ''
         config = CorpusConfig(current_corpus, graph_host = host, graph_port = port,
                         graph_user = user, graph_password = password)
+        config.audio_cache_bytes = self.audioCacheEdit.value() * 1024 ** 3
         self.corporaList.clear()
         try:
             corpora = get_corpora_list(config)
@@ -253,6 +263,7 @@ class ConnectWidget(QtWidgets.QWidget):
                 with CorpusContext(config) as c:
                     c.hierarchy = c.generate_hierarchy()
                     c.save_variables()
+                get_context_pool().invalidate(config)
             self.corporaList.select(current_corpus)
         except (ConnectionError, AuthorizationError, NetworkAddressError) as e:
             self.configChanged.emit(None)
@@ -275,6 +286,7 @@ class ConnectWidget(QtWidgets.QWidget):
                 pass
             c.hierarchy = h
             c.save_variables()
+        get_context_pool().invalidate(config)
 
     def changeConfig(self, name):
         host = self.hostEdit.text()
@@ -283,6 +295,7 @@ class ConnectWidget(QtWidgets.QWidget):
         password = self.passwordEdit.text()
         config = CorpusConfig(name, graph_host = host, graph_port = port,
                         graph_user = user, graph_password = password)
+        config.audio_cache_bytes = self.audioCacheEdit.value() * 1024 ** 3
         self.configChanged.emit(config)
 
     def enableFindAudio(self, all_found):
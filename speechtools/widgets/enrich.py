@@ -3,7 +3,7 @@ from collections import OrderedDict
 
 from PyQt5 import QtGui, QtCore, QtWidgets
 
-from polyglotdb import CorpusContext
+from ..pool import corpus_context
 
 from .base import RadioSelectWidget
 
@@ -280,7 +280,7 @@ class AnnotationTypeSelect(QtWidgets.QComboBox):
 class EncodeHierarchicalPropertiesDialog(BaseDialog):
     def __init__(self, config, parent):
         super(EncodeHierarchicalPropertiesDialog, self).__init__(parent)
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             hierarchy = c.hierarchy
         layout = QtWidgets.QFormLayout()
 
@@ -1,7 +1,7 @@
 
 from PyQt5 import QtGui, QtCore, QtWidgets
 
-from polyglotdb import CorpusContext
+from ..pool import corpus_context
 
 class PhoneSubsetSelectWidget(QtWidgets.QWidget):
     def __init__(self, config, parent = None):
@@ -9,7 +9,7 @@ class PhoneSubsetSelectWidget(QtWidgets.QWidget):
 
         layout = QtWidgets.QHBoxLayout()
         self.subsetSelect = QtWidgets.QComboBox()
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             try:
                 for s in c.hierarchy.subset_types[c.phone_name]:
                     self.subsetSelect.addItem(s)
@@ -32,7 +32,7 @@ class PhoneSelectWidget(QtWidgets.QWidget):
         self.selectWidget = QtWidgets.QListWidget()
         self.selectWidget.setSelectionMode(QtWidgets.QAbstractItemView.MultiSelection)
 
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             for p in c.lexicon.phones():
                 self.selectWidget.addItem(p)
         layout.addWidget(self.selectWidget)
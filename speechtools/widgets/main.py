@@ -11,7 +11,13 @@ from .base import DataListWidget, CollapsibleWidgetPair, DetailedMessageBox, Col
 
 from .selectable_audio import SelectableAudioWidget
 
-from polyglotdb import CorpusContext
+from ..pool import corpus_context
+
+from ..prefetch import ContextPrefetcher
+
+from ..discourse import DiscourseCache, covers
+
+from ..waveform import configure_decoded_cache
 
 from polyglotdb.exceptions import GraphQueryError
 
@@ -46,7 +52,7 @@ class DiscourseWidget(QtWidgets.QWidget):
         if self.config is None or self.config.corpus_name == '':
             return
         try:
-            with CorpusContext(self.config) as c:
+            with corpus_context(self.config) as c:
                 for d in sorted(c.discourses):
                     self.discourseList.addItem(d)
         except GraphQueryError:
@@ -86,20 +92,40 @@ class ViewWidget(CollapsibleTabWidget):
         self.worker.errorEncountered.connect(self.showError)
         self.worker.connectionIssues.connect(self.connectionIssues.emit)
 
+        self.contextPrefetcher = ContextPrefetcher(parent = self)
+        # Prefetches are speculative, so their failures are only logged
+        self.contextPrefetcher.errorEncountered.connect(self.logPrefetchError)
+        self.discourseCache = DiscourseCache()
+
 
     def showError(self, e):
         reply = DetailedMessageBox()
         reply.setDetailedText(str(e))
         ret = reply.exec_()
 
+    def logPrefetchError(self, e):
+        print('Prefetching a discourse failed: {}'.format(e))
+
     def changeDiscourse(self, discourse, begin = None, end = None):
         if discourse:
-            self.changingDiscourse.emit()
             kwargs = {}
             if begin is None:
                 begin = 0
             if end is None:
                 end = 30
+            current = self.discourseWidget.discourse_model
+            if current is not None and current.name == discourse and covers(current, begin, end):
+                self.discourseWidget.moveView(begin, end)
+                return
+            self.stashDiscourse()
+            self.changingDiscourse.emit()
+            context = self.discourseCache.get(getattr(self.config, 'corpus_name', None), discourse, begin, end)
+            if context is None:
+                context = self.contextPrefetcher.take(discourse, begin, end)
+            if context is not None:
+                discourse_model, audio = context
+                self.discourseWidget.updateDiscourseModel((discourse_model, begin, end), audio)
+                return
             kwargs['config'] = self.config
             kwargs['discourse'] = discourse
             kwargs['begin'] = begin
@@ -108,14 +134,29 @@ class ViewWidget(CollapsibleTabWidget):
             self.worker.setParams(kwargs)
             self.worker.start()
 
+    def stashDiscourse(self):
+        """Keep the discourse being viewed in the cache before leaving it"""
+        current = self.discourseWidget.discourse_model
+        if current is None or self.config is None:
+            return
+        self.discourseCache.put(self.config.corpus_name, current, self.discourseWidget.audio)
+
+    def prefetchContexts(self, contexts):
+        self.contextPrefetcher.request(contexts)
+
     def updateConfig(self, config):
+        # The discourse being viewed is closed along with the cached ones
+        self.stashDiscourse()
         self.config = config
+        self.contextPrefetcher.set_config(config)
+        self.discourseCache.clear()
         self.changingDiscourse.emit()
         self.discourseWidget.config = config
         if self.config is None:
             return
+        configure_decoded_cache(self.config)
         if self.config.corpus_name:
-            with CorpusContext(self.config) as c:
+            with corpus_context(self.config) as c:
                 if c.hierarchy != self.discourseWidget.hierarchy:
                     self.discourseWidget.updateHierachy(c.hierarchy)
 
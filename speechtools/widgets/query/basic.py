@@ -1,7 +1,7 @@
 import sys
 from PyQt5 import QtGui, QtCore, QtWidgets
 
-from polyglotdb import CorpusContext
+from ...pool import corpus_context
 
 from polyglotdb.graph.func import Sum, Count
 
@@ -78,7 +78,7 @@ class AttributeWidget(QtWidgets.QWidget):
 
     def __init__(self, config, to_find, alignment = False):
         self.config = config
-        with CorpusContext(self.config) as c:
+        with corpus_context(self.config) as c:
             self.hierarchy = c.hierarchy
         self.to_find = to_find
         self.alignment = alignment
@@ -193,7 +193,7 @@ class AttributeWidget(QtWidgets.QWidget):
 class ValueWidget(QtWidgets.QWidget):
     def __init__(self, config, to_find):
         self.config = config
-        with CorpusContext(self.config) as c:
+        with corpus_context(self.config) as c:
             self.hierarchy = c.hierarchy
         self.to_find = to_find
         self.levels = None
@@ -247,18 +247,18 @@ class ValueWidget(QtWidgets.QWidget):
         elif new_type == str:
 
             if self.hierarchy.has_type_property(annotation, label):
-                with CorpusContext(self.config) as c:
+                with corpus_context(self.config) as c:
                     if label == 'label':
                         self.levels = c.lexicon.list_labels(annotation)
                     else:
                         self.levels = c.lexicon.get_property_levels(label, annotation)
                 boolean = self.updateValueWidget()
             elif annotation == 'speaker':
-                with CorpusContext(self.config) as c:
+                with corpus_context(self.config) as c:
                     self.levels = c.speakers
                 boolean = self.updateValueWidget()
             elif annotation == 'discourse':
-                with CorpusContext(self.config) as c:
+                with corpus_context(self.config) as c:
                     self.levels = c.discourses
                 boolean = self.updateValueWidget()
             else:
@@ -375,7 +375,7 @@ class FilterWidget(QtWidgets.QWidget):
         #add in slot to tell which type to find
 
         self.config = config
-        with CorpusContext(self.config) as c:
+        with corpus_context(self.config) as c:
             self.hierarchy = c.hierarchy
         self.to_find = to_find
         super(FilterWidget, self).__init__()
@@ -1057,7 +1057,7 @@ class BasicQuery(QtWidgets.QWidget):
 
     def updateConfig(self, config):
         self.config = config
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             self.hierarchy = c.hierarchy
         self.filterWidget.setConfig(config)
         self.toFindWidget.clear()
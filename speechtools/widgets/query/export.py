@@ -4,7 +4,7 @@ import collections
 
 from PyQt5 import QtGui, QtCore, QtWidgets
 
-from polyglotdb import CorpusContext
+from ...pool import corpus_context
 
 from ...profiles import available_export_profiles, ExportProfile, Column
 
@@ -648,7 +648,7 @@ class ExportProfileDialog(QtWidgets.QDialog):
             index += 1
         self.nameWidget.setText(new_default_template.format(index))
 
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             hierarchy = c.hierarchy
 
         if to_find is not None:
@@ -13,6 +13,8 @@ from ...views import ResultsView
 
 from ...workers import (QueryWorker, ExportQueryWorker)
 
+from ..audio import ClipQueuePlayer
+
 from .graphical import GraphicalQuery
 
 from .basic import BasicQuery
@@ -254,6 +256,8 @@ class QueryForm(QtWidgets.QWidget):
         self.queryWidget.updateConfig(config)
 
 class QueryResults(QtWidgets.QWidget):
+    playAllRequested = QtCore.pyqtSignal(object, float)
+    stopRequested = QtCore.pyqtSignal()
     def __init__(self, results):
         super(QueryResults, self).__init__()
 
@@ -269,20 +273,53 @@ class QueryResults(QtWidgets.QWidget):
         self.proxyModel.setDynamicSortFilter(False)
         self.tableWidget.setModel(self.proxyModel)
 
+        self.playButton = QtWidgets.QPushButton('Play all')
+        self.playButton.clicked.connect(self.playAll)
+        self.stopButton = QtWidgets.QPushButton('Stop')
+        self.stopButton.clicked.connect(self.stopRequested.emit)
+        self.paddingEdit = QtWidgets.QDoubleSpinBox()
+        self.paddingEdit.setRange(0, 5)
+        self.paddingEdit.setSingleStep(0.05)
+        self.paddingEdit.setValue(0.1)
+        self.paddingEdit.setSuffix(' s')
+
+        playLayout = QtWidgets.QHBoxLayout()
+        playLayout.addWidget(self.playButton)
+        playLayout.addWidget(self.stopButton)
+        playLayout.addWidget(QtWidgets.QLabel('Padding'))
+        playLayout.addWidget(self.paddingEdit)
+        playLayout.addStretch()
+
         layout = QtWidgets.QVBoxLayout()
 
         layout.addWidget(self.tableWidget)
+        layout.addLayout(playLayout)
 
         self.setLayout(layout)
 
+    def addResults(self, results):
+        self.resultsModel.addRows(results)
+
+    def playAll(self):
+        selected = self.tableWidget.selectionModel().selectedRows()
+        start = selected[0].row() if len(selected) else 0
+        self.playAllRequested.emit(self.tableWidget.clips(start), self.paddingEdit.value())
+
 class QueryWidget(CollapsibleTabWidget):
     viewRequested = QtCore.pyqtSignal(str, float, float)
+    prefetchRequested = QtCore.pyqtSignal(object)
     needsHelp = QtCore.pyqtSignal(object)
     exportHelpBroadcast = QtCore.pyqtSignal(object)
     def __init__(self):
         super(QueryWidget, self).__init__()
         self.config = None
         self.currentIndex = 1
+        self.streamingResults = None
+        self.discardingResults = False
+        self.playingResults = None
+        self.resultsPlayer = ClipQueuePlayer(parent = self)
+        self.resultsPlayer.clipStarted.connect(self.showPlayingResult)
+        self.resultsPlayer.error.connect(self.showError)
         self.queryForm = QueryForm()
 
         self.queryForm.queryWidget.needsHelp.connect(self.needsHelp.emit)
@@ -296,6 +333,11 @@ class QueryWidget(CollapsibleTabWidget):
         if index == 0:
             return
         widget = self.widget(index)
+        if widget is self.streamingResults:
+            self.streamingResults = None
+            self.discardingResults = True
+        if widget is self.playingResults:
+            self.stopResults()
         self.removeTab(index)
         widget.setParent(None)
         widget.deleteLater()
@@ -306,11 +348,57 @@ class QueryWidget(CollapsibleTabWidget):
         self.queryForm.updateConfig(config)
 
     def updateResults(self, results):
+        query, rows = results
+        if rows is None:
+            if self.streamingResults is None and not self.discardingResults:
+                self.addResultsTab((query, []))
+            self.finishResults()
+            return
+        self.addResultsTab(results)
+
+    def addResultsTab(self, results):
         name = 'Query {}'.format(self.currentIndex)
         self.currentIndex += 1
         widget = QueryResults(results)
         widget.tableWidget.viewRequested.connect(self.viewRequested.emit)
+        widget.tableWidget.prefetchRequested.connect(self.prefetchRequested.emit)
+        widget.playAllRequested.connect(lambda clips, padding, widget = widget:
+                                        self.playResults(widget, clips, padding))
+        widget.stopRequested.connect(self.stopResults)
         self.addTab(widget, name)
+        return widget
+
+    def playResults(self, widget, clips, padding):
+        if self.config is None or not clips:
+            return
+        self.playingResults = widget
+        self.resultsPlayer.play(clips, self.config, padding)
+
+    def stopResults(self):
+        self.playingResults = None
+        self.resultsPlayer.stop()
+
+    def showPlayingResult(self, row):
+        if self.playingResults is not None:
+            self.playingResults.tableWidget.selectSourceRow(row)
+
+    def showError(self, e):
+        reply = DetailedMessageBox()
+        reply.setDetailedText(str(e))
+        ret = reply.exec_()
+
+    def addResultsPage(self, results):
+        if self.discardingResults:
+            return
+        if self.streamingResults is None:
+            query, rows = results
+            self.streamingResults = self.addResultsTab((query, list(rows)))
+        else:
+            self.streamingResults.addResults(results[1])
+
+    def finishResults(self):
+        self.streamingResults = None
+        self.discardingResults = False
 
     def markAnnotated(self, value):
         w = self.currentWidget()
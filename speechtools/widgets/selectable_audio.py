@@ -6,7 +6,7 @@ from PyQt5 import QtGui, QtCore, QtWidgets, QtMultimedia
 
 from .base import DetailedMessageBox
 
-from .audio import MediaPlayer
+from .audio import AudioPlayer
 
 from .annotation import SubannotationDialog, NoteDialog
 
@@ -14,7 +14,17 @@ from .structure import HierarchyWidget
 
 from ..plot import AnnotationWidget, SpectralWidget
 
-from ..workers import PrecedingCacheWorker, FollowingCacheWorker, AudioCacheWorker
+from ..workers import AudioCacheWorker, WaveformPyramidWorker, SpectrogramWorker, TrackWorker
+
+from ..prefetch import WindowPrefetcher
+
+from ..discourse import IndexedDiscourseModel
+
+from ..plot.helper import track_slice
+
+from ..spectrogram import SpectrogramTiles, SpectrogramView
+
+from ..redraw import RedrawScheduler, SIGNAL, SPECTROGRAM, ANNOTATIONS, TRACKS, CURSORS
 
 class SelectableAudioWidget(QtWidgets.QWidget):
     discourseHelpBroadcast = QtCore.pyqtSignal()
@@ -82,7 +92,7 @@ class SelectableAudioWidget(QtWidgets.QWidget):
 
         self.setLayout(mainlayout)
 
-        self.m_audioOutput = MediaPlayer()
+        self.m_audioOutput = AudioPlayer(parent = self)
         self.m_audioOutput.error.connect(self.showError)
         self.m_audioOutput.positionChanged.connect(self.notified)
         self.m_audioOutput.stateChanged.connect(self.handleAudioState)
@@ -92,75 +102,124 @@ class SelectableAudioWidget(QtWidgets.QWidget):
         self.audio = None
         self.cache_window = 5
 
-        self.precedingCacheWorker = PrecedingCacheWorker()
-        self.precedingCacheWorker.dataReady.connect(self.addPreceding)
-        self.precedingCacheWorker.errorEncountered.connect(self.showError)
-        self.followingCacheWorker = FollowingCacheWorker()
-        self.followingCacheWorker.dataReady.connect(self.addFollowing)
-        self.followingCacheWorker.errorEncountered.connect(self.showError)
+        self.prefetcher = WindowPrefetcher(self.cache_window)
+        self.prefetcher.precedingReady.connect(self.addPreceding)
+        self.prefetcher.followingReady.connect(self.addFollowing)
+        self.prefetcher.replaceReady.connect(self.replaceAnnotations)
+        self.prefetcher.detailReady.connect(self.addDetail)
+        self.prefetcher.errorEncountered.connect(self.showError)
 
         self.audioCacheWorker = AudioCacheWorker()
         self.audioCacheWorker.dataReady.connect(self.updateAudio)
         self.audioCacheWorker.errorEncountered.connect(self.showError)
 
+        self.waveform = None
+        self.waveformWorker = WaveformPyramidWorker()
+        self.waveformWorker.dataReady.connect(self.updateWaveform)
+        self.waveformWorker.errorEncountered.connect(self.showError)
+
+        self.spectrogramTiles = SpectrogramTiles()
+        self.spectrogram_view = None
+        self.spectrogram_hop = None
+        self.spectrogram_offset = 0
+        self.spectrogramWorker = SpectrogramWorker()
+        self.spectrogramWorker.dataReady.connect(self.updateSpectrogram)
+        self.spectrogramWorker.errorEncountered.connect(self.showError)
+
+        self.tracks = None
+        self.tracks_pending = None
+        self.tracks_version = 0
+        self.trackWorker = TrackWorker()
+        self.trackWorker.dataReady.connect(self.updateTracks)
+        self.trackWorker.errorEncountered.connect(self.tracksFailed)
+
+        self.play_time = None
+        self.signal_version = 0
+        self.annotations_version = 0
+        self.drawn_view = None
+        self.drawn_inputs = {}
+        self.redraw = RedrawScheduler(self.redrawLayers, parent = self)
+
     def showError(self, e):
         reply = DetailedMessageBox()
         reply.setDetailedText(str(e))
         ret = reply.exec_()
 
     def updateAudio(self, audio):
+        if audio is not None and audio is self.audio:
+            # A fill of the current sound file has landed
+            self.signal_version += 1
+            self.updateVisible()
+            return
         self.audio = audio
+        self.signal_version += 1
         if self.audio is not None:
-            p = QtCore.QUrl.fromLocalFile(self.audio.path)
-            self.m_audioOutput.setMedia(QtMultimedia.QMediaContent(p))
             self.spectrumWidget.update_sampling_rate(self.audio.sr)
             self.hierarchyWidget.setNumChannels(self.audio.num_channels)
+        self.updateVisible()
 
-    def cachePreceding(self):
-        if self.audio is not None:
-            if self.audio.cached_begin != 0 and self.view_begin < self.audio.cached_begin + self.cache_window:
-                self.audioCacheWorker.setParams({'sound_file':self.discourse_model.sound_file, 'begin': self.view_begin, 'end': self.view_end})
-                self.audioCacheWorker.start()
-        if not self.precedingCacheWorker.finished:
+    def updateWaveform(self, waveform):
+        if waveform is None or self.discourse_model is None or \
+                self.discourse_model.sound_file is None or \
+                waveform.sound_path != self.discourse_model.sound_file.filepath:
             return
-        if not self.discourse_model.cached_to_begin and self.view_begin < self.discourse_model.cached_begin + self.cache_window:
-            print('beginning!')
-            kwargs = {'config': self.config,
-                        'begin': self.discourse_model.cached_begin - 2 * self.cache_window,
-                        'end': self.discourse_model.cached_begin,
-                        'discourse': self.discourse_model.name}
-            self.precedingCacheWorker.setParams(kwargs)
-            self.precedingCacheWorker.start()
+        self.waveform = waveform
+        self.signal_version += 1
+        self.redraw.mark(SIGNAL)
 
+    def cacheAudio(self):
+        if self.audio is None or not self.audioCacheWorker.finished:
+            return
+        if (self.audio.cached_begin != 0 and self.view_begin < self.audio.cached_begin + self.cache_window) or \
+                (self.audio.cached_end != self.audio.duration and self.view_end > self.audio.cached_end - self.cache_window):
+            self.audioCacheWorker.setParams({'audio': self.audio, 'begin': self.view_begin,
+                                    'end': self.view_end, 'direction': self.prefetcher.velocity})
+            self.audioCacheWorker.start()
 
-    def cacheFollowing(self):
+    def evictFarWindows(self):
+        """
+        Release annotations and audio outside a guard band around the view,
+        as wide as the windows the prefetcher and the audio cache would fetch
+        for it (and no narrower than the view's duration), so that freshly
+        fetched windows are kept; they are fetched again if the view comes
+        back
+        """
+        span = self.view_end - self.view_begin
+        guard = max(span, self.prefetcher.reach())
+        if self.discourse_model.evict(self.view_begin - guard, self.view_end + guard):
+            self.annotations_version += 1
         if self.audio is not None:
-            if self.audio.cached_end != self.audio.duration and self.view_end > self.audio.cached_end - self.cache_window:
-                self.audioCacheWorker.setParams({'sound_file':self.discourse_model.sound_file, 'begin': self.view_begin, 'end': self.view_end})
-                self.audioCacheWorker.start()
-        if not self.followingCacheWorker.finished:
-            return
-        if not self.discourse_model.cached_to_end and self.view_end > self.discourse_model.cached_end - self.cache_window:
-            end = self.discourse_model.cached_end + 2 * self.cache_window
-            if self.view_end > end:
-                end = self.view_end + 2 * self.cache_window
-            kwargs = {'config': self.config,
-                        'begin': self.discourse_model.cached_end,
-                        'end': end,
-                        'discourse': self.discourse_model.name}
-            self.followingCacheWorker.setParams(kwargs)
-            self.followingCacheWorker.start()
+            self.audio.evict(*self.audio.reach(self.view_begin, self.view_end))
+
+    def cacheAnnotations(self):
+        self.prefetcher.update_view(self.view_begin, self.view_end)
 
     def addPreceding(self, results):
         if self.discourse_model is None:
             return
         self.discourse_model.add_preceding(results)
+        self.annotations_version += 1
         self.updateVisible()
 
     def addFollowing(self, results):
         if self.discourse_model is None:
             return
         self.discourse_model.add_following(results)
+        self.annotations_version += 1
+        self.updateVisible()
+
+    def replaceAnnotations(self, results):
+        if self.discourse_model is None:
+            return
+        self.discourse_model.replace_window(results)
+        self.annotations_version += 1
+        self.updateVisible()
+
+    def addDetail(self, results):
+        if self.discourse_model is None:
+            return
+        self.discourse_model.add_window(results)
+        self.annotations_version += 1
         self.updateVisible()
 
     def updateChannel(self, channel):
@@ -174,9 +233,13 @@ class SelectableAudioWidget(QtWidgets.QWidget):
             else:
                 min_time = self.min_selected_time
             self.updatePlayTime(min_time)
-            self.m_audioOutput.setPosition(0)
 
     def updatePlayTime(self, time):
+        self.play_time = time
+        self.redraw.mark(CURSORS)
+
+    def drawCursors(self):
+        time = self.play_time
         if time is None:
             pos = None
         else:
@@ -184,8 +247,7 @@ class SelectableAudioWidget(QtWidgets.QWidget):
         self.audioWidget.update_play_time(time)
         self.spectrumWidget.update_play_time(pos)
 
-    def notified(self, position):
-        time = position / 1000
+    def notified(self, time):
         self.updatePlayTime(time)
 
     def focusNextPrevChild(self, next_):
@@ -199,6 +261,7 @@ class SelectableAudioWidget(QtWidgets.QWidget):
             if self.selected_annotation is not None:
                 if self.selected_annotation._type not in self.hierarchy:
                     self.selected_annotation._annotation.delete_subannotation(self.selected_annotation)
+                    self.annotationsEdited()
 
                     self.selected_annotation = None
                     self.selectionChanged.emit(None)
@@ -217,22 +280,19 @@ class SelectableAudioWidget(QtWidgets.QWidget):
         elif event.key() == QtCore.Qt.Key_Tab:
             if self.audio is None:
                 return
-            if self.m_audioOutput.state() == QtMultimedia.QMediaPlayer.StoppedState or \
-                self.m_audioOutput.state() == QtMultimedia.QMediaPlayer.PausedState:
+            state = self.m_audioOutput.state()
+            if state == QtMultimedia.QAudio.StoppedState:
                 if self.min_selected_time is None:
                     min_time = self.view_begin
                     max_time = self.view_end
                 else:
                     min_time = self.min_selected_time
                     max_time = self.max_selected_time
-                self.m_audioOutput.setMinTime(min_time)
-                self.m_audioOutput.setMaxTime(max_time)
-                if self.m_audioOutput.state() == QtMultimedia.QMediaPlayer.StoppedState:
-                    self.m_audioOutput.play()
-            elif self.m_audioOutput.state() == QtMultimedia.QMediaPlayer.PlayingState:
+                self.m_audioOutput.play(self.audio, min_time, max_time)
+            elif state == QtMultimedia.QAudio.ActiveState:
                 self.m_audioOutput.pause()
-            elif self.m_audioOutput.state() == QtMultimedia.QMediaPlayer.PausedState:
-                self.m_audioOutput.play()
+            elif state == QtMultimedia.QAudio.SuspendedState:
+                self.m_audioOutput.resume()
         elif event.key() == QtCore.Qt.Key_Left:
             print(event.modifiers())
             if event.modifiers() & QtCore.Qt.ShiftModifier:
@@ -276,6 +336,7 @@ class SelectableAudioWidget(QtWidgets.QWidget):
 
             self.selected_annotation.update_properties(label = new)
             self.selected_annotation.save()
+            self.annotationsEdited()
             self.selectionChanged.emit(self.selected_annotation)
             self.updateVisible()
         elif self.selected_annotation is not None:
@@ -292,10 +353,15 @@ class SelectableAudioWidget(QtWidgets.QWidget):
                         begin = self.selected_annotation.begin,
                         end = self.selected_annotation.end)
                 self.selected_annotation.save()
+                self.annotationsEdited()
                 self.updateVisible()
         else:
             print(event.key())
 
+    def annotationsEdited(self):
+        self.annotations_version += 1
+        self.discourse_model.refresh()
+
     def find_annotation(self, key, time):
         return self.discourse_model.find_annotation(key, time, channel = self.channel)
 
@@ -402,7 +468,6 @@ class SelectableAudioWidget(QtWidgets.QWidget):
             if self.audio is not None:
                 if self.m_audioOutput.state() == QtMultimedia.QAudio.SuspendedState:
                     self.m_audioOutput.stop()
-                    self.m_audioOutput.reset()
             menu = QtWidgets.QMenu(self)
 
             subannotation_action = QtWidgets.QAction('Add subannotation...', self)
@@ -444,6 +509,7 @@ class SelectableAudioWidget(QtWidgets.QWidget):
                 update = True
             if update:
                 annotation.save()
+                self.annotationsEdited()
                 self.updateVisible()
                 self.selectionChanged.emit(annotation)
             menu.deleteLater()
@@ -552,96 +618,171 @@ class SelectableAudioWidget(QtWidgets.QWidget):
     def updateVisible(self):
         if self.discourse_model is None:
             return
-        self.cacheFollowing()
-        self.cachePreceding()
-        self.audioWidget.update_time_bounds(self.view_begin, self.view_end)
-        self.drawSignal()
-        self.drawAnnotations()
-        self.drawFormants()
-        self.drawPitch()
+        self.redraw.mark(SIGNAL, SPECTROGRAM, ANNOTATIONS, TRACKS)
+
+    def layerInputs(self, layer):
+        view = (self.view_begin, self.view_end, self.channel)
+        if layer == SIGNAL:
+            return view + (self.signal_version, tuple(self.audioWidget.size))
+        elif layer == SPECTROGRAM:
+            return view + (self.signal_version, tuple(self.spectrumWidget.physical_size),
+                            self.spectrumWidget.get_windowing())
+        elif layer == ANNOTATIONS:
+            return view + (self.annotations_version,)
+        elif layer == TRACKS:
+            return view + (self.spectrogram_hop, self.spectrogram_offset, self.tracks_version)
+        return None
+
+    def redrawLayers(self, layers):
+        """
+        Redraw the dirty layers whose inputs changed since they were last
+        drawn
+        """
+        if self.discourse_model is None:
+            return
+        view = (self.view_begin, self.view_end, self.channel)
+        if view != self.drawn_view:
+            self.drawn_view = view
+            self.evictFarWindows()
+            self.cacheAnnotations()
+            self.cacheAudio()
+            self.audioWidget.update_time_bounds(self.view_begin, self.view_end)
+        draws = ((SIGNAL, self.drawSignal), (SPECTROGRAM, self.drawSpectrogram),
+                (ANNOTATIONS, self.drawAnnotations), (TRACKS, self.drawTracks))
+        for layer, draw in draws:
+            if layer not in layers:
+                continue
+            inputs = self.layerInputs(layer)
+            if inputs == self.drawn_inputs.get(layer):
+                continue
+            draw()
+            self.drawn_inputs[layer] = self.layerInputs(layer)
+        if CURSORS in layers:
+            self.drawCursors()
 
     def save_selected_boundary(self):
         key, ind = self.selected_boundary
-        actual_index = int(ind / 6)
-        index = 0
-        selected_annotation = None
-        for a in self.annotations:
-            if a.end < self.view_begin:
-                continue
-            if isinstance(key, tuple):
-                elements = getattr(a, key[0])
-                for e in elements:
-                    if e.end < self.view_begin:
-                        continue
-                    subs = getattr(e, key[1])
-                    for s in subs:
-                        if index == actual_index:
-                            selected_annotation = s
-                            break
-                        index += 1
-                    if selected_annotation is not None:
-                        break
-            elif key != a._type:
-                elements = getattr(a, key)
-                for e in elements:
-                    if index == actual_index:
-                        selected_annotation = e
-                        break
-                    index += 1
-            elif index == actual_index:
-                selected_annotation = a
-            if selected_annotation is not None:
-                break
-        mod = ind % 6
+        selected_annotation, is_begin = self.audioWidget.get_boundary_annotation(key, ind)
+        if selected_annotation is None:
+            return
         if self.selected_time > self.view_end:
             self.selected_time = self.view_end
         elif self.selected_time < self.view_begin:
             self.selected_time = self.view_begin
-        if mod == 0:
+        if is_begin:
             selected_annotation.update_properties(begin = self.selected_time)
         else:
             selected_annotation.update_properties(end = self.selected_time)
         self.selectionChanged.emit(selected_annotation)
         selected_annotation.save()
+        if self.discourse_model.refresh():
+            # The edit reordered rows of the store, so the drawn vertices no
+            # longer map to the right annotations
+            self.annotations_version += 1
+            self.updateVisible()
+        else:
+            self.audioWidget.commit_boundary(key, ind)
 
     def updateHierachy(self, hierarchy):
         self.hierarchy = hierarchy
         self.hierarchyWidget.hierarchy = hierarchy
         self.audioWidget.update_hierarchy(self.hierarchy)
+        self.annotations_version += 1
+        self.updateVisible()
 
     def drawSignal(self):
         if self.audio is None:
             self.audioWidget.update_signal(None)
-            self.spectrumWidget.update_signal(None)
         else:
-            if self.view_end - self.view_begin < 15:
-                sig = self.audio.visible_signal(self.view_begin, self.view_end, self.channel)
-                sr = self.audio.sr
-            elif self.view_end - self.view_begin < 60:
-                sig = self.audio.visible_downsampled_1000(self.view_begin, self.view_end, self.channel)
-                sr = 1000
-            else:
-                sig = self.audio.visible_downsampled_100(self.view_begin, self.view_end, self.channel)
-                sr = 100
-            preemph_signal  = self.audio.visible_preemph_signal(self.view_begin, self.view_end, self.channel)
+            data = None
+            if self.waveform is not None:
+                data = self.waveform.envelope(self.view_begin, self.view_end,
+                                    self.channel, self.audioWidget.size[0])
+            if data is None:
+                if self.view_end - self.view_begin < 15:
+                    sig = self.audio.visible_signal(self.view_begin, self.view_end, self.channel)
+                    sr = self.audio.sr
+                elif self.view_end - self.view_begin < 60:
+                    sig = self.audio.visible_downsampled_1000(self.view_begin, self.view_end, self.channel)
+                    sr = self.audio.downsampled_rate(1000)
+                else:
+                    sig = self.audio.visible_downsampled_100(self.view_begin, self.view_end, self.channel)
+                    sr = self.audio.downsampled_rate(100)
 
-            t = np.arange(sig.shape[0]) / (sr) + self.view_begin
+                t = np.arange(sig.shape[0]) / (sr) + self.view_begin
 
-            data = np.array((t, sig)).T
-            begin = time.time()
+                data = np.array((t, sig)).T
             self.audioWidget.update_signal(data)
-            begin = time.time()
-            self.spectrumWidget.update_sampling_rate(self.audio.sr)
-            self.spectrumWidget.update_signal(preemph_signal)
             self.updatePlayTime(self.view_begin)
 
-    def updateDiscourseModel(self, discourse_model):
+    def drawSpectrogram(self):
+        if self.audio is None:
+            self.spectrumWidget.update_spectrogram(None)
+            return
+        path = self.discourse_model.sound_file.filepath
+        sr = self.audio.sr
+        window_length, window = self.spectrumWidget.get_windowing()
+        view = SpectrogramView.for_canvas(path, self.channel, self.view_begin, self.view_end, sr,
+                            self.spectrumWidget.physical_size,
+                            window_length = window_length, window = window)
+        self.spectrogram_view = view
+        image = self.spectrogramTiles.image(view, compute = False)
+        if image is not None:
+            self.showSpectrogram(view, image)
+            return
+        coarse = view.coarse()
+        image = self.spectrogramTiles.image(coarse, compute = False)
+        if image is not None:
+            self.showSpectrogram(coarse, image)
+        else:
+            self.showSpectrogram(view, None)
+        self.spectrogramWorker.setParams({'tiles': self.spectrogramTiles, 'view': view})
+        self.spectrogramWorker.start()
+
+    def showSpectrogram(self, view, image):
+        self.spectrogram_hop = view.hop
+        self.spectrogram_offset = view.frame_offset
+        self.spectrumWidget.update_spectrogram(image, view.sr, view.hop, view.n_fft,
+                                    view.last_frame - view.first_frame, view.frame_offset)
+
+    def updateSpectrogram(self, data):
+        if data is None:
+            return
+        view, image = data
+        if image is None or not view.same_range(self.spectrogram_view):
+            return
+        self.showSpectrogram(view, image)
+        self.redraw.mark(TRACKS)
+
+    def updateDiscourseModel(self, discourse_model, audio = None):
+        """
+        Show a discourse model loaded for a time range, along with its audio
+        window if that has been loaded already
+        """
         discourse_model, begin, end = discourse_model
+        if not isinstance(discourse_model, IndexedDiscourseModel):
+            discourse_model = IndexedDiscourseModel(discourse_model, self.hierarchy)
         self.discourse_model = discourse_model
+        self.drawn_view = None
+        self.drawn_inputs = {}
+        self.prefetcher.set_discourse(discourse_model, self.config)
         self.audio = None
+        self.waveform = None
+        self.waveformWorker.stop()
+        self.spectrogramWorker.stop()
+        self.spectrogram_view = None
+        self.trackWorker.stop()
+        self.tracks = None
+        self.tracks_pending = None
+        self.m_audioOutput.stop()
         if discourse_model.sound_file is not None:
-            self.audioCacheWorker.setParams({'sound_file':self.discourse_model.sound_file, 'begin': begin, 'end': end})
-            self.audioCacheWorker.start()
+            self.waveformWorker.setParams({'path': self.discourse_model.sound_file.filepath})
+            self.waveformWorker.start()
+            if audio is not None and audio.path == self.discourse_model.sound_file.filepath:
+                self.updateAudio(audio)
+            else:
+                self.audioCacheWorker.setParams({'sound_file':self.discourse_model.sound_file, 'begin': begin, 'end': end})
+                self.audioCacheWorker.start()
         if begin is None:
             begin = 0
         if end is None or end > self.discourse_model.max_time:
@@ -650,17 +791,86 @@ class SelectableAudioWidget(QtWidgets.QWidget):
         self.audioWidget.update_time_bounds(self.view_begin, self.view_end)
         self.updateVisible()
 
-    def drawAnnotations(self):
-        annotations = self.discourse_model.annotations(begin = self.view_begin, end = self.view_end, channel = self.channel)
-        self.audioWidget.update_annotations(annotations)
+    def moveView(self, begin, end):
+        """
+        Show another time range of the discourse being viewed, without
+        loading it again
+        """
+        if self.discourse_model is None:
+            return
+        self.m_audioOutput.stop()
+        self.selected_annotation = None
+        self.min_selected_time = None
+        self.max_selected_time = None
+        self.audioWidget.update_selection(self.min_selected_time, self.max_selected_time)
+        self.selectionChanged.emit(None)
+        if end > self.discourse_model.max_time:
+            end = self.discourse_model.max_time
+        self.view_begin, self.view_end = begin, end
+        self.audioWidget.update_time_bounds(self.view_begin, self.view_end)
+        self.updateVisible()
 
-    def drawPitch(self):
-        pitch = self.discourse_model.pitch_from_begin(begin = self.view_begin, end = self.view_end, channel = self.channel)
-        self.spectrumWidget.update_pitch(pitch)
+    def drawAnnotations(self):
+        self.audioWidget.update_annotations(self.discourse_model.store, self.channel)
 
-    def drawFormants(self):
-        formants = self.discourse_model.formants_from_begin(begin = self.view_begin, end = self.view_end, channel = self.channel)
+    def tracksCover(self, tracks, margin = 0):
+        """
+        Whether tracks were fetched for this discourse and channel over the
+        view and ``margin`` seconds on either side of it (short of the
+        begin of the discourse)
+        """
+        if tracks is None:
+            return False
+        discourse, begin, end, channel = tracks[0]
+        return discourse == self.discourse_model.name and channel == self.channel and \
+                begin <= max(self.view_begin - margin, 0) and self.view_end + margin <= end
+
+    def drawTracks(self):
+        if not self.tracksCover(self.tracks):
+            # Tracks of another range would be drawn out of place, so they
+            # are hidden until the window around this view is fetched
+            self.spectrumWidget.update_formants(None)
+            self.spectrumWidget.update_pitch(None)
+            self.cacheTracks()
+            return
+        if not self.tracksCover(self.tracks, (self.view_end - self.view_begin) / 2):
+            # Fetch the next window before panning reaches the edge
+            self.cacheTracks()
+        key, pitch, formants = self.tracks
+        if formants is not None:
+            formants = {k: track_slice(v, self.view_begin, self.view_end)
+                        for k, v in formants.items()}
         self.spectrumWidget.update_formants(formants)
+        self.spectrumWidget.update_pitch(track_slice(pitch, self.view_begin, self.view_end))
+
+    def cacheTracks(self):
+        """
+        Fetch the tracks of a window of a view's length on either side of
+        it, unless a fetch covering the view is already running
+        """
+        margin = (self.view_end - self.view_begin) / 2
+        if self.config is None or self.tracksCover(self.tracks_pending, margin):
+            return
+        span = self.view_end - self.view_begin
+        begin = max(self.view_begin - span, 0)
+        end = self.view_end + span
+        self.tracks_pending = ((self.discourse_model.name, begin, end, self.channel),)
+        self.trackWorker.setParams({'config': self.config, 'discourse': self.discourse_model.name,
+                            'begin': begin, 'end': end, 'channel': self.channel})
+        self.trackWorker.start()
+
+    def tracksFailed(self, e):
+        self.tracks_pending = None
+        self.showError(e)
+
+    def updateTracks(self, tracks):
+        self.tracks_pending = None
+        if tracks is None or self.discourse_model is None or \
+                tracks[0][0] != self.discourse_model.name:
+            return
+        self.tracks = tracks
+        self.tracks_version += 1
+        self.redraw.mark(TRACKS)
 
     def changeView(self, begin, end):
         if self.discourse_model is None:
@@ -670,6 +880,18 @@ class SelectableAudioWidget(QtWidgets.QWidget):
 
     def clearDiscourse(self):
         self.discourse_model = None
+        self.redraw.cancel()
+        self.drawn_view = None
+        self.drawn_inputs = {}
+        self.prefetcher.set_discourse(None, self.config)
+        self.waveform = None
+        self.waveformWorker.stop()
+        self.spectrogramWorker.stop()
+        self.spectrogram_view = None
+        self.trackWorker.stop()
+        self.tracks = None
+        self.tracks_pending = None
+        self.m_audioOutput.stop()
 
         self.min_selected_time = None
         self.max_selected_time = None
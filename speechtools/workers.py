@@ -9,7 +9,6 @@ from polyglotdb.exceptions import ConnectionError, NetworkAddressError, Temporar
 
 from polyglotdb.graph.func import Sum
 
-from polyglotdb import CorpusContext
 from polyglotdb.config import CorpusConfig
 
 from polyglotdb.io import (inspect_buckeye, inspect_textgrid, inspect_timit,
@@ -20,9 +19,18 @@ from polyglotdb.io.enrichment import enrich_lexicon_from_csv, enrich_features_fr
 from polyglotdb.utils import update_sound_files, gp_language_stops, gp_speakers
 
 from polyglotdb.acoustics.analysis import acoustic_analysis
-from polyglotdb.graph.discourse import LongSoundFile
 
-class FunctionWorker(QtCore.QThread):
+from .scheduler import get_scheduler, INTERACTIVE, NORMAL, BACKGROUND
+
+from .pool import corpus_context, get_context_pool
+
+from .waveform import WaveformPyramid, load_clip
+
+from .stream import StreamingSoundFile
+
+from .fetch import annotation_window, inspect_window, track_window
+
+class FunctionWorker(QtCore.QObject):
     updateProgress = QtCore.pyqtSignal(object)
     updateMaximum = QtCore.pyqtSignal(object)
     updateProgressText = QtCore.pyqtSignal(str)
@@ -31,24 +39,48 @@ class FunctionWorker(QtCore.QThread):
 
     dataReady = QtCore.pyqtSignal(object)
 
+    priority = NORMAL
+    supersede = False
+
     def __init__(self):
         super(FunctionWorker, self).__init__()
-        self.stopped = False
-        self.finished = True
+        self.params = None
+        self.kwargs = None
+        self.job = None
+        self.total = None
 
     def setParams(self, kwargs):
-        self.kwargs = kwargs
-        self.kwargs['call_back'] = self.emitProgress
-        self.kwargs['stop_check'] = self.stopCheck
-        self.stopped = False
+        self.params = kwargs
         self.total = None
 
+    def start(self):
+        kwargs = dict(self.params)
+        kwargs['call_back'] = self.emitProgress
+        kwargs['stop_check'] = self.stopCheck
+        return get_scheduler().submit(self, kwargs)
+
     def stop(self):
-        self.stopped = True
+        dropped = get_scheduler().cancel(self)
+        if dropped and not get_scheduler().is_running(self):
+            self.finishedCancelling.emit()
+
+    @property
+    def stopped(self):
+        return self.job is not None and self.job.stopped
+
+    @property
+    def finished(self):
+        return get_scheduler().is_idle(self)
+
+    def isRunning(self):
+        return not self.finished
 
     def stopCheck(self):
         return self.stopped
 
+    def run(self):
+        pass
+
     def emitProgress(self, *args):
         if isinstance(args[0],str):
             self.updateProgressText.emit(args[0])
@@ -62,8 +94,14 @@ class FunctionWorker(QtCore.QThread):
 
 class QueryWorker(FunctionWorker):
     connectionIssues = QtCore.pyqtSignal()
+    pageReady = QtCore.pyqtSignal(object)
+
+    page_size = 1000
+    # Workers that write to the corpus set this, so that pooled contexts
+    # are discarded once they are done
+    modifies_corpus = False
+
     def run(self):
-        finished = False
         time.sleep(0.1)
         print('beginning')
         try:
@@ -87,29 +125,38 @@ class QueryWorker(FunctionWorker):
                 exc_type, exc_value, exc_traceback = sys.exc_info()
                 e = ''.join(traceback.format_exception(exc_type, exc_value,
                                           exc_traceback))
-            self.finished = True
+            self.job.done = True
             self.errorEncountered.emit(e)
             return
+        finally:
+            if self.modifies_corpus:
+                get_context_pool().invalidate()
         if self.stopped:
             time.sleep(0.1)
-            self.finished = True
+            self.job.done = True
             self.finishedCancelling.emit()
             return
         print('finished')
+        self.job.done = True
         self.dataReady.emit(results)
-        self.finished = True
 
-    def run_query(self):
+    def build_query(self, c):
         profile = self.kwargs['profile']
+        a_type = getattr(c, profile.to_find)
+        query = c.query_graph(a_type)
+        query.call_back = self.kwargs['call_back']
+        query.stop_check = self.kwargs['stop_check']
+        query = query.filter(*profile.for_polyglot(c))
+        query = query.preload(getattr(a_type, 'speaker'), getattr(a_type,'discourse'))
+        return a_type, query
+
+    def run_query(self):
         config = self.kwargs['config']
 
-        with CorpusContext(config) as c:
-            a_type = getattr(c, profile.to_find)
-            query = c.query_graph(a_type)
-            query.call_back = self.kwargs['call_back']
-            query.stop_check = self.kwargs['stop_check']
-            query = query.filter(*profile.for_polyglot(c))
-            query = query.preload(getattr(a_type, 'speaker'), getattr(a_type,'discourse'))
+        with corpus_context(config) as c:
+            if self.kwargs.get('streaming', False):
+                return self.stream_query(c)
+            a_type, query = self.build_query(c)
             print(query.cypher())
 
             results = query.all()
@@ -117,15 +164,45 @@ class QueryWorker(FunctionWorker):
                 print(len(results))
         return query, results
 
+    def stream_query(self, c):
+        """
+        Fetch results in pages ordered by id, emitting each page through
+        pageReady.  The last id seen is kept in the job's parameters so
+        that a retry after a connection error resumes where it stopped.
+        """
+        page_size = self.kwargs.get('page_size', self.page_size)
+        num_fetched = self.kwargs.get('num_fetched', 0)
+        query = None
+        while not self.stopped:
+            a_type, query = self.build_query(c)
+            last_id = self.kwargs.get('last_id', None)
+            if last_id is not None:
+                query = query.filter(a_type.id > last_id)
+            query = query.order_by(a_type.id).limit(page_size)
+            page = [x for x in query.all()]
+            if not page:
+                break
+            num_fetched += len(page)
+            self.kwargs['last_id'] = page[-1].id
+            self.kwargs['num_fetched'] = num_fetched
+            self.kwargs['call_back']('Fetched {} results...'.format(num_fetched))
+            self.pageReady.emit((query, page))
+            if len(page) < page_size:
+                break
+        return query, None
+
 
 class ImportCorpusWorker(QueryWorker):
+    priority = BACKGROUND
+    modifies_corpus = True
+
     def run_query(self):
         time.sleep(0.1)
         name = self.kwargs['name']
         directory = self.kwargs['directory']
         reset = True
         config = CorpusConfig(name, graph_host = 'localhost', graph_port = 7474)
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             if name == 'buckeye':
                 parser = inspect_buckeye(directory)
             elif name == 'timit':
@@ -156,7 +233,7 @@ class ExportQueryWorker(QueryWorker):
         config = self.kwargs['config']
         export_path = self.kwargs['path']
 
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             a_type = getattr(c, profile.to_find)
             query = c.query_graph(a_type)
             query.call_back = self.kwargs['call_back']
@@ -174,20 +251,46 @@ class ExportQueryWorker(QueryWorker):
         return True
 
 class DiscourseQueryWorker(QueryWorker):
+    priority = INTERACTIVE
+    supersede = True
+
     def run_query(self):
         begin = self.kwargs['begin']
         end = self.kwargs['end']
         config = self.kwargs['config']
         discourse = self.kwargs['discourse']
-        with CorpusContext(config) as c:
-            discourse = c.inspect_discourse(discourse, begin, end)
+        with corpus_context(config) as c:
+            discourse = inspect_window(c, config, discourse, begin, end,
+                                        self.kwargs.get('columnar', True))
         return discourse, begin, end
 
+class ContextPrefetchWorker(QueryWorker):
+    """
+    Load the discourse model and audio window around a query result before
+    it is viewed.  This runs at normal priority rather than in the
+    background slot, which a long encoding job can hold for minutes.
+    """
+
+    def run_query(self):
+        begin = self.kwargs['begin']
+        end = self.kwargs['end']
+        config = self.kwargs['config']
+        discourse = self.kwargs['discourse']
+        with corpus_context(config) as c:
+            discourse_model = inspect_window(c, config, discourse, begin, end,
+                                        self.kwargs.get('columnar', True))
+        audio = None
+        if discourse_model.sound_file is not None:
+            audio = StreamingSoundFile(discourse_model.sound_file.filepath).fill(begin, end)
+        return discourse, begin, end, discourse_model, audio
+
 class AudioFinderWorker(QueryWorker):
+    modifies_corpus = True
+
     def run_query(self):
         config = self.kwargs['config']
         directory = self.kwargs['directory']
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             update_sound_files(c, directory)
             all_found = c.has_all_sound_files()
         return all_found
@@ -195,15 +298,18 @@ class AudioFinderWorker(QueryWorker):
 class AudioCheckerWorker(QueryWorker):
     def run_query(self):
         config = self.kwargs['config']
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             all_found = c.has_all_sound_files()
         return all_found
 
 class AcousticAnalysisWorker(QueryWorker):
+    priority = BACKGROUND
+    modifies_corpus = True
+
     def run_query(self):
         config = self.kwargs['config']
         acoustics = self.kwargs['acoustics']
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             acoustic_analysis(c,
                             stop_check = self.kwargs['stop_check'],
                             call_back = self.kwargs['call_back'],
@@ -211,12 +317,15 @@ class AcousticAnalysisWorker(QueryWorker):
         return True
 
 class PauseEncodingWorker(QueryWorker):
+    priority = BACKGROUND
+    modifies_corpus = True
+
     def run_query(self):
         config = self.kwargs['config']
         pause_words = self.kwargs['pause_words']
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             c.encode_pauses(pause_words,
                             stop_check = stop_check,
                             call_back = call_back)
@@ -228,13 +337,16 @@ class PauseEncodingWorker(QueryWorker):
         return True
 
 class UtteranceEncodingWorker(QueryWorker):
+    priority = BACKGROUND
+    modifies_corpus = True
+
     def run_query(self):
         config = self.kwargs['config']
         min_pause_length = self.kwargs['min_pause_length']
         min_utterance_length = self.kwargs['min_utterance_length']
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             c.encode_utterances(min_pause_length, min_utterance_length,
                             stop_check = stop_check,
                             call_back = call_back)
@@ -246,12 +358,15 @@ class UtteranceEncodingWorker(QueryWorker):
         return True
 
 class SpeechRateWorker(QueryWorker):
+    priority = BACKGROUND
+    modifies_corpus = True
+
     def run_query(self):
         config = self.kwargs['config']
         to_count = self.kwargs['to_count']
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             c.encode_speech_rate(to_count, stop_check = stop_check,
                             call_back = call_back)
             if stop_check():
@@ -262,11 +377,14 @@ class SpeechRateWorker(QueryWorker):
         return True
 
 class UtterancePositionWorker(QueryWorker):
+    priority = BACKGROUND
+    modifies_corpus = True
+
     def run_query(self):
         config = self.kwargs['config']
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             c.encode_utterance_position(stop_check = stop_check,
                             call_back = call_back)
             if stop_check():
@@ -277,6 +395,9 @@ class UtterancePositionWorker(QueryWorker):
         return True
 
 class SyllabicEncodingWorker(QueryWorker):
+    priority = BACKGROUND
+    modifies_corpus = True
+
     def run_query(self):
         config = self.kwargs['config']
         segments = self.kwargs['segments']
@@ -284,7 +405,7 @@ class SyllabicEncodingWorker(QueryWorker):
         call_back = self.kwargs['call_back']
         call_back('Encoding syllabics...')
         call_back(0, 0)
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             c.reset_class('syllabic')
             c.encode_class(segments, 'syllabic')
             if stop_check():
@@ -295,6 +416,9 @@ class SyllabicEncodingWorker(QueryWorker):
         return True
 
 class SyllableEncodingWorker(QueryWorker):
+    priority = BACKGROUND
+    modifies_corpus = True
+
     def run_query(self):
         config = self.kwargs['config']
         algorithm = self.kwargs['algorithm']
@@ -302,7 +426,7 @@ class SyllableEncodingWorker(QueryWorker):
         call_back = self.kwargs['call_back']
         call_back('Encoding syllables...')
         call_back(0, 0)
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             c.encode_syllables(algorithm = algorithm, call_back = call_back, stop_check = stop_check)
             if stop_check():
                 call_back('Resetting syllables...')
@@ -312,6 +436,9 @@ class SyllableEncodingWorker(QueryWorker):
         return True
 
 class PhoneSubsetEncodingWorker(QueryWorker):
+    priority = BACKGROUND
+    modifies_corpus = True
+
     def run_query(self):
         config = self.kwargs['config']
         segments = self.kwargs['segments']
@@ -320,7 +447,7 @@ class PhoneSubsetEncodingWorker(QueryWorker):
         call_back = self.kwargs['call_back']
         call_back('Resetting {}s...'.format(label))
         call_back(0, 0)
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             c.reset_class(label)
             c.encode_class(segments, label)
             if stop_check():
@@ -331,6 +458,9 @@ class PhoneSubsetEncodingWorker(QueryWorker):
         return True
 
 class LexiconEnrichmentWorker(QueryWorker):
+    priority = BACKGROUND
+    modifies_corpus = True
+
     def run_query(self):
         config = self.kwargs['config']
         case_sensitive = self.kwargs['case_sensitive']
@@ -339,7 +469,7 @@ class LexiconEnrichmentWorker(QueryWorker):
         call_back = self.kwargs['call_back']
         call_back('Enriching lexicon...')
         call_back(0, 0)
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             enrich_lexicon_from_csv(c, path)
             if stop_check():
                 call_back('Resetting lexicon...')
@@ -349,6 +479,9 @@ class LexiconEnrichmentWorker(QueryWorker):
         return True
 
 class FeatureEnrichmentWorker(QueryWorker):
+    priority = BACKGROUND
+    modifies_corpus = True
+
     def run_query(self):
         config = self.kwargs['config']
         path = self.kwargs['path']
@@ -356,7 +489,7 @@ class FeatureEnrichmentWorker(QueryWorker):
         call_back = self.kwargs['call_back']
         call_back('Enriching phonological inventory...')
         call_back(0, 0)
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             enrich_features_from_csv(c, path)
             if stop_check():
                 call_back('Resetting phonological inventory...')
@@ -366,13 +499,16 @@ class FeatureEnrichmentWorker(QueryWorker):
         return True
 
 class HierarchicalPropertiesWorker(QueryWorker):
+    priority = BACKGROUND
+    modifies_corpus = True
+
     def run_query(self):
         config = self.kwargs['config']
         stop_check = self.kwargs['stop_check']
         call_back = self.kwargs['call_back']
         call_back('Encoding {}...'.format(self.kwargs['name']))
         call_back(0, 0)
-        with CorpusContext(config) as c:
+        with corpus_context(config) as c:
             if self.kwargs['type'] == 'count':
                 c.encode_count(self.kwargs['higher'], self.kwargs['lower'],
                             self.kwargs['name'], subset = self.kwargs['subset'])
@@ -386,69 +522,114 @@ class HierarchicalPropertiesWorker(QueryWorker):
                 return False
         return True
 
-class PrecedingCacheWorker(QueryWorker):
+class AnnotationCacheWorker(QueryWorker):
+    priority = INTERACTIVE
+    supersede = True
+
     def run_query(self):
-        print('starting to cache preceding')
         config = self.kwargs['config']
         discourse = self.kwargs['discourse']
         begin = self.kwargs['begin']
         end = self.kwargs['end']
-        with CorpusContext(config) as c:
-            h_type = c.hierarchy.highest
-            highest = getattr(c, h_type)
-            q = c.query_graph(highest)
-            q = q.filter(highest.discourse.name == discourse)
-            q = q.filter(highest.begin < end)
-            q = q.filter(highest.end > begin)
-            preloads = []
-            if h_type in c.hierarchy.subannotations:
-                for s in c.hierarchy.subannotations[h_type]:
-                    preloads.append(getattr(highest, s))
-            for t in c.hierarchy.get_lower_types(h_type):
-                preloads.append(getattr(highest, t))
-            preloads.append(highest.speaker)
-            preloads.append(highest.discourse)
-            q = q.preload(*preloads)
-            q = q.order_by(highest.begin)
-            results = [x for x in q.all()]
-        print('finished query')
-        return results
-
-class FollowingCacheWorker(QueryWorker):
+        with corpus_context(config) as c:
+            if self.kwargs.get('columnar', True):
+                results = annotation_window(c, discourse, begin, end, self.kwargs.get('keys'),
+                                            self.kwargs.get('counted', ()))
+            else:
+                h_type = c.hierarchy.highest
+                highest = getattr(c, h_type)
+                q = c.query_graph(highest)
+                q = q.filter(highest.discourse.name == discourse)
+                q = q.filter(highest.begin < end)
+                q = q.filter(highest.end > begin)
+                preloads = []
+                if h_type in c.hierarchy.subannotations:
+                    for s in c.hierarchy.subannotations[h_type]:
+                        preloads.append(getattr(highest, s))
+                for t in c.hierarchy.get_lower_types(h_type):
+                    preloads.append(getattr(highest, t))
+                preloads.append(highest.speaker)
+                preloads.append(highest.discourse)
+                q = q.preload(*preloads)
+                q = q.order_by(highest.begin)
+                results = [x for x in q.all()]
+        return results, discourse, begin, end
+
+class TrackWorker(QueryWorker):
+    priority = INTERACTIVE
+    supersede = True
+
     def run_query(self):
-        print('starting to cache following')
         config = self.kwargs['config']
-        discourse = self.kwargs['discourse']
         begin = self.kwargs['begin']
         end = self.kwargs['end']
-        with CorpusContext(config) as c:
-            h_type = c.hierarchy.highest
-            highest = getattr(c, h_type)
-            q = c.query_graph(highest)
-            q = q.filter(highest.discourse.name == discourse)
-            q = q.filter(highest.begin < end)
-            q = q.filter(highest.end > begin)
-            preloads = []
-            if h_type in c.hierarchy.subannotations:
-                for s in c.hierarchy.subannotations[h_type]:
-                    preloads.append(getattr(highest, s))
-            for t in c.hierarchy.get_lower_types(h_type):
-                preloads.append(getattr(highest, t))
-            preloads.append(highest.speaker)
-            preloads.append(highest.discourse)
-            q = q.preload(*preloads)
-            q = q.order_by(highest.begin)
-            print('getting results')
-            results = [x for x in q.all()]
-        print('finished query')
-        return results
+        channel = self.kwargs['channel']
+        with corpus_context(config) as c:
+            pitch, formants = track_window(c, self.kwargs['discourse'], begin, end, channel)
+        return (self.kwargs['discourse'], begin, end, channel), pitch, formants
 
 class AudioCacheWorker(QueryWorker):
+    priority = INTERACTIVE
+    supersede = True
+
     def run_query(self):
-        print('beginning audio caching')
-        sound_file = self.kwargs['sound_file']
         begin = self.kwargs['begin']
         end = self.kwargs['end']
-        f = LongSoundFile(sound_file, begin, end)
-        print('finished audio caching')
-        return f
+        audio = self.kwargs.get('audio')
+        if audio is None:
+            audio = StreamingSoundFile(self.kwargs['sound_file'].filepath)
+        return audio.fill(begin, end, self.kwargs.get('direction', 0))
+
+class ClipWorker(QueryWorker):
+    """
+    Load the audio of a batch of query results, padded on either side, for
+    the results player.  Sound files are looked up once per discourse and
+    remembered in the ``sound_files`` dictionary passed in.
+    """
+    supersede = True
+
+    def run_query(self):
+        config = self.kwargs['config']
+        padding = self.kwargs['padding']
+        sr = self.kwargs['sr']
+        sound_files = self.kwargs['sound_files']
+        stop_check = self.kwargs['stop_check']
+        clips = []
+        with corpus_context(config) as c:
+            for key, discourse, begin, end in self.kwargs['clips']:
+                if stop_check():
+                    break
+                if discourse not in sound_files:
+                    sound_file = c.discourse_sound_file(discourse)
+                    sound_files[discourse] = None if sound_file is None else sound_file.filepath
+                path = sound_files[discourse]
+                if path is None:
+                    continue
+                clip_sr, samples = load_clip(path, begin - padding, end + padding, sr)
+                sr = clip_sr
+                clips.append((key, sr, samples))
+        return clips
+
+class WaveformPyramidWorker(QueryWorker):
+    priority = BACKGROUND
+    supersede = True
+
+    def run_query(self):
+        path = self.kwargs['path']
+        return WaveformPyramid.load_or_build(path, stop_check = self.kwargs['stop_check'])
+
+class SpectrogramWorker(QueryWorker):
+    priority = INTERACTIVE
+    supersede = True
+
+    def run_query(self):
+        tiles = self.kwargs['tiles']
+        view = self.kwargs['view']
+        stop_check = self.kwargs['stop_check']
+        if not tiles.is_cached(view):
+            coarse = view.coarse()
+            image = tiles.image(coarse, stop_check = stop_check)
+            if image is None:
+                return None
+            self.dataReady.emit((coarse, image))
+        return view, tiles.image(view, stop_check = stop_check)
@@ -0,0 +1,259 @@
+import pytest
+
+from speechtools.discourse import (TierColumns, AnnotationStore, AnnotationWindow,
+                                    IndexedDiscourseModel, DiscourseCache, covers, zoom_keys)
+
+class Interval(object):
+    def __init__(self, begin, end):
+        self.begin = begin
+        self.end = end
+
+def rows(*intervals):
+    return [(b, e, 0, 0, -1, 0, 1, str(b)) for b, e in intervals]
+
+def test_tier_columns():
+    tier = TierColumns()
+    tier.update(rows((2, 3), (3, 4)))
+    tier.update(rows((0, 1), (1, 2)))
+    tier.update(rows((4, 6)))
+    row_map = tier.update(rows((0.5, 5)))
+    assert list(tier.begins) == [0, 0.5, 1, 2, 3, 4]
+    assert row_map.tolist() == [0, 2, 3, 4, 5]
+    assert tier.index['0.5'] == 1
+    assert tier.begins[tier.overlapping(2.5, 3.5)].tolist() == [0.5, 2, 3]
+    assert tier.begins[tier.overlapping(5.5, 7)].tolist() == [4]
+    assert tier.begins[tier.at(3.5)] == 0.5
+    assert tier.at(7) is None
+    assert not len(tier.overlapping(2.5, 3.5, channel = 1))
+
+    row_map = tier.update(keep = tier.begins >= 2)
+    assert row_map.tolist() == [-1, -1, -1, 0, 1, 2]
+    assert tier.ids.tolist() == ['2', '3', '4']
+
+class Inspector(object):
+    def __init__(self, name, begin, end, duration = 100):
+        self.name = name
+        self.cached_begin = begin
+        self.cached_end = end
+        self.cached_to_begin = begin == 0
+        self.cached_to_end = end == duration
+
+class Context(object):
+    closed = False
+
+    def __exit__(self, exc_type, exc, exc_tb):
+        self.closed = True
+
+def cached_model(name, begin, end):
+    return IndexedDiscourseModel(Inspector(name, begin, end), Hierarchy(), context = Context())
+
+def test_discourse_cache():
+    cache = DiscourseCache(max_discourses = 2)
+    first = cached_model('first', 10, 40)
+    cache.put('corpus', first, 'audio')
+    assert cache.get('corpus', 'first', 12, 20) == (first, 'audio')
+    assert cache.get('corpus', 'first', 5, 20) is None
+    assert cache.get('other', 'first', 12, 20) is None
+    assert covers(Inspector('x', 0, 100), -1, 200)
+
+    second = cached_model('second', 0, 30)
+    cache.put('corpus', second)
+    cache.get('corpus', 'first', 12, 20)
+    cache.put('corpus', cached_model('third', 0, 30))
+    assert cache.get('corpus', 'second', 0, 10) is None
+    assert cache.get('corpus', 'first', 12, 20) is not None
+    # Evicted models close their contexts
+    assert second.context is None
+    assert not first.context.closed
+    context = first.context
+    cache.clear()
+    assert context.closed
+
+class Annotation(Interval):
+    def __init__(self, begin, end):
+        super(Annotation, self).__init__(begin, end)
+        self.id = begin
+        self.channel = 0
+
+class Hierarchy(object):
+    highest = 'word'
+    highest_to_lowest = ['word']
+    subannotations = {}
+
+    @property
+    def lowest(self):
+        return self.highest_to_lowest[-1]
+
+    def get_lower_types(self, a_type):
+        return self.highest_to_lowest[self.highest_to_lowest.index(a_type) + 1:]
+
+class Element(Interval):
+    def __init__(self, begin, end, label = None, **children):
+        super(Element, self).__init__(begin, end)
+        self.label = label
+        self.id = (label, begin)
+        self.channel = 0
+        for k, v in children.items():
+            setattr(self, k, v)
+
+def make_word(begin, channel = 0):
+    phones = [Element(begin, begin + 0.5, 'p', burst = [Element(begin, begin + 0.1)]),
+                Element(begin + 0.5, begin + 1, 'a', burst = [])]
+    syllables = [Element(begin, begin + 1, 'pa')]
+    word = Element(begin, begin + 1, 'pa', syllable = syllables, phone = phones)
+    word.channel = channel
+    return word
+
+def test_annotation_store():
+    hierarchy = Hierarchy()
+    hierarchy.highest_to_lowest = ['word', 'syllable', 'phone']
+    hierarchy.subannotations = {'phone': ['burst']}
+    store = AnnotationStore(hierarchy)
+    words = [make_word(2), make_word(3, channel = 1)]
+    store.add(words)
+    store.add([make_word(0), make_word(1), words[0]])
+    assert len(store) == 4
+    assert len(store.labels) == 4
+    phones = store.tiers['phone']
+    assert phones.begins.tolist() == [0, 0.5, 1, 1.5, 2, 2.5, 3, 3.5]
+    assert store.tiers['syllable'].begins[phones.parents].tolist() == [0, 0, 1, 1, 2, 2, 3, 3]
+    assert store.annotation('phone', 5) is words[0].phone[1]
+    assert store.annotation(('phone', 'burst'), 2) is words[0].phone[0].burst[0]
+    assert store.root(('phone', 'burst'), 3) == 3
+    begins, ends, labels, positions, counts, found = store.window('phone', 2.2, 4)
+    assert labels.tolist() == ['p', 'a']
+    assert found.tolist() == [4, 5]
+    assert store.window('phone', 2.2, 4, channel = 1)[2].tolist() == ['p', 'a']
+
+def test_evict():
+    inspector = Inspector('first', 0, 100)
+    inspector.cache = [Annotation(i, i + 1) for i in range(100)]
+    inspector.annotations = lambda begin, end, channel: [x for x in inspector.cache
+                                                        if x.end > begin and x.begin < end]
+    model = IndexedDiscourseModel(inspector, Hierarchy(), max_rows = 50)
+    assert len(model.annotations(10, 20)) == 10
+    assert model.find_annotation('word', 10.5) is inspector.cache[10]
+    assert not model.evict(0, 100)
+    assert model.evict(39.5, 60)
+    assert [x.begin for x in inspector.cache] == list(range(39, 60))
+    assert (model.cached_begin, model.cached_end) == (39, 60)
+    assert model.annotations(10, 20) == []
+    assert not model.evict(39.5, 60)
+
+    # Lower tiers count towards the budget, so a few long annotations with
+    # many annotations under them are evicted too
+    hierarchy = Hierarchy()
+    hierarchy.highest_to_lowest = ['word', 'phone']
+    inspector = Inspector('second', 0, 40)
+    inspector.cache = [Element(i * 10, i * 10 + 10, 'w', phone = [Element(i * 10 + j * 0.1,
+                        i * 10 + j * 0.1 + 0.1, 'p') for j in range(100)]) for i in range(4)]
+    model = IndexedDiscourseModel(inspector, hierarchy, max_rows = 300)
+    assert model.store.num_rows == 404
+    assert model.evict(10.5, 19.5)
+    assert model.store.num_rows == 101
+    assert (model.cached_begin, model.cached_end) == (10, 20)
+
+def test_annotation_window():
+    hierarchy = Hierarchy()
+    hierarchy.highest_to_lowest = ['word', 'phone']
+    hierarchy.subannotations = {'phone': ['burst']}
+    phones = {'p0': Element(0, 0.5, 'p', burst = [Element(0, 0.1)]), 'p1': Element(0.5, 1, 'a', burst = []),
+                'p2': Element(1, 1.5, 'p', burst = []), 'p3': Element(1.5, 2, 'a', burst = [])}
+    for k, v in phones.items():
+        v.id = k
+    phones['p0'].burst[0].id = 'b0'
+    loaded = []
+    def loader(key, annotation_id):
+        loaded.append(annotation_id)
+        return phones[annotation_id]
+
+    tiers = {'word': {'begin': [0, 1], 'end': [1, 2], 'label': ['pa', 'pa'], 'id': ['w0', 'w1'],
+                        'parent_id': [None, None], 'channel': [0, 0]},
+            'phone': {'begin': [0, 0.5, 1, 1.5], 'end': [0.5, 1, 1.5, 2], 'label': ['p', 'a', 'p', 'a'],
+                        'id': ['p0', 'p1', 'p2', 'p3'], 'parent_id': ['w0', 'w0', 'w1', 'w1'],
+                        'channel': [0, 0, 0, 0]},
+            ('phone', 'burst'): {'begin': [0], 'end': [0.1], 'label': [None], 'id': ['b0'],
+                        'parent_id': ['p0'], 'channel': [0], 'position': [0], 'count': [1]}}
+    store = AnnotationStore(hierarchy, loader)
+    store.add_window(AnnotationWindow(0, 2, tiers))
+    store.add_window(AnnotationWindow(0, 2, tiers))
+    assert len(store) == 2
+    assert store.tiers['phone'].parents.tolist() == [0, 0, 1, 1]
+    assert store.window('phone', 0.7, 1.2)[2].tolist() == ['a', 'p']
+    assert store.annotation(('phone', 'burst'), 0) is phones['p0'].burst[0]
+    assert store.annotation('phone', 0) is phones['p0']
+    assert loaded == ['p0']
+
+    phones['p0'].end = 0.4
+    phones['p0'].burst = []
+    # Rows drawn before are stale once a subannotation is dropped
+    assert store.sync()
+    assert store.tiers['phone'].ends[0] == 0.4
+    assert len(store.tiers['phone', 'burst']) == 0
+
+    # Edits that keep the order of the rows leave them valid
+    phones['p0'].end = 0.45
+    assert not store.sync()
+
+    # Moving a boundary past a neighbour reorders the rows
+    assert store.annotation('phone', 1) is phones['p1']
+    phones['p1'].begin = 1.2
+    assert store.sync()
+    assert store.tiers['phone'].ids.tolist() == ['p0', 'p2', 'p1', 'p3']
+    phones['p1'].begin = 0.5
+    assert store.sync()
+
+    store.keep(1.2, 2)
+    assert store.tiers['word'].ids.tolist() == ['w1']
+    assert store.tiers['phone'].ids.tolist() == ['p2', 'p3']
+    assert store.tiers['phone'].parents.tolist() == [0, 0]
+    assert store.materialized == {}
+
+    inspector = Inspector('first', 0, 0, duration = 100)
+    inspector.max_time = 100
+    inspector.cache = []
+    model = IndexedDiscourseModel(inspector, hierarchy, loader = loader)
+    model.add_following(AnnotationWindow(0, 2, tiers))
+    assert (model.cached_begin, model.cached_end) == (0, 2)
+    assert model.find_annotation('phone', 1.7) is phones['p3']
+    assert model.uncovered_detail(1, 2) is None
+
+def test_zoom_keys():
+    hierarchy = Hierarchy()
+    hierarchy.highest_to_lowest = ['word', 'phone']
+    hierarchy.subannotations = {'phone': ['burst']}
+    assert zoom_keys(hierarchy, 5) == (['word', 'phone', ('phone', 'burst')], [])
+    assert zoom_keys(hierarchy, 30) == (['word'], ['phone'])
+
+    words = {'begin': [0, 1, 5], 'end': [1, 2, 6], 'label': ['a', 'b', 'c'], 'id': ['w0', 'w1', 'w5'],
+                'parent_id': [None] * 3, 'channel': [0] * 3}
+    counts = {'begin': [0, 1, 5], 'end': [1, 2, 6], 'id': ['w0', 'w1', 'w5'], 'channel': [0] * 3,
+                'count': [3, 4, 2]}
+    phones = {'begin': [5, 5.5], 'end': [5.5, 6], 'label': ['p', 'a'], 'id': ['p0', 'p1'],
+                'parent_id': ['w5', 'w5'], 'channel': [0, 0]}
+    inspector = Inspector('first', 0, 0, duration = 100)
+    inspector.max_time = 100
+    inspector.cache = []
+    model = IndexedDiscourseModel(inspector, hierarchy)
+    model.add_window(AnnotationWindow(0, 10, {'word': words}, {'phone': counts}))
+    assert model.cached_end == 10
+    assert model.detail_keys() == ['phone', ('phone', 'burst')]
+    assert model.uncovered_detail(0, 10) == (0, 10)
+    assert model.store.summary('phone', 0.5, 1.5)[2].tolist() == [3, 4]
+
+    bursts = {k: [] for k in phones}
+    model.add_window(AnnotationWindow(4, 7, {'phone': phones, ('phone', 'burst'): bursts}))
+    assert model.cached_end == 10
+    assert model.detail_ranges == [(4, 7)]
+    assert model.uncovered_detail(3, 6) == (3, 4)
+    assert model.uncovered_detail(5, 8) == (7, 8)
+    assert model.store.tiers['phone'].parents.tolist() == [2, 2]
+
+    # A window far from the cached range replaces it
+    far = {'begin': [50, 51], 'end': [51, 52], 'label': ['d', 'e'], 'id': ['w50', 'w51'],
+                'parent_id': [None] * 2, 'channel': [0] * 2}
+    model.replace_window(AnnotationWindow(50, 60, {'word': far}))
+    assert (model.cached_begin, model.cached_end) == (50, 60)
+    assert model.store.tiers['word'].ids.tolist() == ['w50', 'w51']
+    assert model.store.tiers['phone'].ids.tolist() == []
+    assert model.detail_ranges == []
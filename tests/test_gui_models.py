@@ -1,7 +1,35 @@
 
 import pytest
 
+from PyQt5 import QtCore
+
 from speechtools.models import ProxyModel, QueryResultsModel, make_safe
 
 def test_models(qtbot):
     pass
+
+class Result(object):
+    properties = ['id', 'label', 'begin', 'end']
+
+    def __init__(self, index):
+        self.id = index
+        self.label = 'w{}'.format(index)
+        self.begin = index
+        self.end = index + 1
+
+def test_add_rows(qtbot):
+    model = QueryResultsModel([])
+    assert model.columns == ['label', 'begin', 'end', 'discourse', 'speaker']
+    inserted = []
+    model.rowsInserted.connect(lambda parent, first, last: inserted.append((first, last)))
+
+    model.addRows([])
+    assert model.rowCount() == 0
+
+    # The first page sets the columns, later ones are inserted after it
+    model.addRows([Result(i) for i in range(3)])
+    assert model.rowCount() == 3
+    assert model.columns == ['label', 'begin', 'end', 'discourse', 'speaker']
+    model.addRows([Result(i) for i in range(3, 5)])
+    assert inserted == [(3, 4)]
+    assert model.data(model.index(4, 0), QtCore.Qt.DisplayRole) == 'w4'
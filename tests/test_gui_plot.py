@@ -1,4 +1,97 @@
-
 import pytest
 
+import numpy as np
+
+from vispy import scene
+from vispy.visuals.text.text import FontManager
+
+from speechtools.plot.helper import VertexMap
+from speechtools.plot.visuals import ScalingText, SCTLinePlot
+
+@pytest.fixture
+def canvas():
+    canvas = scene.SceneCanvas(size = (400, 100), show = False)
+    view = canvas.central_widget.add_view()
+    view.camera = scene.PanZoomCamera(rect = (0, 0, 10, 1))
+    yield canvas, view
+    canvas.close()
+
+def test_scaling_text_draws(canvas):
+    canvas, view = canvas
+    text = ScalingText(face = 'OpenSans', parent = view.scene)
+    text.set_data(['ab', 'cd', 'ef'], pos = np.array([[1, 0.5], [5, 0.5], [9, 0.5]]),
+                widths = np.array([2, 2, 0.01]))
+    assert not text.update_level_of_detail(40)
+    assert text.text == ['ab', 'cd']
+    image = canvas.render()
+    assert image.shape[:2] == (100, 400)
+    assert (image[:, :200] != image[0, 0]).any()
+    assert (image[:, 300:] == image[0, 0]).all()
+
+    # Zooming only changes the font size, and labels are not laid out again
+    text.update_level_of_detail(41)
+    assert text.text == ['ab', 'cd']
+    canvas.render()
+
+def test_scaling_text_pan(canvas):
+    canvas, view = canvas
+    fonts = FontManager()
+    text = ScalingText(face = 'OpenSans', font_manager = fonts, parent = view.scene)
+    labels = ['ab', 'cd', 'ef']
+    widths = np.array([2, 2, 0.01])
+    text.set_data(list(labels), pos = np.array([[1, 0.5], [5, 0.5], [9, 0.5]]), widths = widths)
+    text.update_level_of_detail(40)
+    canvas.render()
+    laid_out = text.text
+    vertices = text._vertices
+
+    # Panning within the same window keeps the text and only moves it
+    text.set_data(list(labels), pos = np.array([[0, 0.5], [4, 0.5], [8, 0.5]]), widths = widths)
+    text.update_level_of_detail(40)
+    assert text.text is laid_out
+    assert text._vertices is vertices
+    assert np.allclose(text.pos[:, 0], [0, 4])
+    text.move_label(1, 3)
+    assert text.text is laid_out
+    assert np.allclose(text.pos[:, 0], [0, 3])
+    canvas.render()
+    assert text._vertices is vertices
+
+    # Glyph runs of label strings already laid out are reused
+    other = ScalingText(face = 'OpenSans', font_manager = fonts, parent = view.scene)
+    other.set_data(['cd', 'ab'], pos = np.array([[2, 0.2], [6, 0.2]]))
+    canvas.render()
+    assert other._glyph_key('cd') in ScalingText.glyph_runs
+    assert np.array_equal(other._vertices_data[:8], text._vertices_data[8:16])
+
+def test_line_range_update(canvas):
+    canvas, view = canvas
+    lines = SCTLinePlot(color = 'b', parent = view.scene)
+    pos = np.array([[1, 0], [1, 1], [2, 0], [2, 1],
+                    [2, 0], [2, 1], [3, 0], [3, 1]], dtype = np.float32)
+    lines.set_data(pos, VertexMap(np.arange(2), 4))
+    canvas.render()
+    uploads = []
+    set_subdata = lines._pos_vbo.set_subdata
+
+    def record(data, offset = 0):
+        uploads.append((data.copy(), offset))
+        set_subdata(data, offset = offset)
+    lines._pos_vbo.set_subdata = record
+
+    lines.update_boundary(2, 2.5)
+    assert len(uploads) == 1
+    data, offset = uploads[0]
+    assert offset == 2
+    assert np.allclose(data, [[2.5, 0], [2.5, 1]])
+    assert np.allclose(lines.pos[[0, 1, 4, 5, 6, 7]], pos[[0, 1, 4, 5, 6, 7]])
+    canvas.render()
 
+    # Highlighting only uploads the colors of the highlighted boundary
+    lines.update_markers(2)
+    assert np.allclose(lines._color[2:4], (1, 1, 0, 1))
+    assert np.allclose(lines._color[[0, 1, 4, 5, 6, 7]], lines.non_selected_color)
+    image = canvas.render()
+    assert image.shape[:2] == (100, 400)
+    assert (image[:, :160] != image[0, 399]).any()
+    assert (image[:, 160:] == image[0, 399]).all()
@@ -2,7 +2,7 @@
 import pytest
 
 from speechtools.widgets.annotation import SubannotationDialog, NoteDialog
-from speechtools.widgets.audio import MediaPlayer
+from speechtools.widgets.audio import AudioPlayer, ClipDevice, QueueDevice
 from speechtools.widgets.base import CollapsibleWidgetPair, DataListWidget, DetailedMessageBox
 from speechtools.widgets.connection import ConnectWidget, CorporaList
 from speechtools.widgets.details import DetailsWidget
@@ -21,9 +21,38 @@ def test_notes_dialog(qtbot):
     qtbot.addWidget(w)
 
 def test_audio(qtbot):
-    w = MediaPlayer()
+    w = AudioPlayer()
     qtbot.addWidget(w)
 
+def test_clip_device():
+    device = ClipDevice(b'abcdef')
+    assert device.size() == 6
+    assert device.read(4) == b'abcd'
+    assert device.offset == 4
+    assert device.bytesAvailable() == 2
+    assert device.read(4) == b'ef'
+    assert device.atEnd()
+    assert device.read(4) == b''
+    assert device.offset == 6
+
+    assert device.seek(2)
+    assert device.pos() == 2
+    assert device.read(3) == b'cde'
+    assert device.offset == 5
+    assert not device.seek(7)
+    assert device.offset == 5
+
+def test_queue_device():
+    device = QueueDevice()
+    device.append(1, b'aaaa')
+    device.append(2, b'bb')
+    assert device.read(3) == b'aaa'
+    assert device.read(10) == b'abb'
+    assert device.read(10) == b''
+    device.append(3, b'ccc')
+    assert device.read(10) == b'ccc'
+    assert list(device.starts) == [(0, 1), (4, 2), (6, 3)]
+
 def test_connection(qtbot):
     w = ConnectWidget()
     qtbot.addWidget(w)
@@ -9,6 +9,47 @@ def test_query_widget(qtbot):
     w = QueryWidget()
     qtbot.addWidget(w)
 
+class Result(object):
+    properties = ['id', 'label', 'begin', 'end']
+
+    def __init__(self, index):
+        self.id = index
+        self.label = 'w{}'.format(index)
+        self.begin = index
+        self.end = index + 1
+
+def test_query_widget_streaming(qtbot):
+    w = QueryWidget()
+    qtbot.addWidget(w)
+    num_tabs = w.count()
+
+    # The first page opens a results tab, later pages are added to it
+    w.addResultsPage((None, [Result(0), Result(1)]))
+    results = w.streamingResults
+    w.addResultsPage((None, [Result(2)]))
+    assert w.count() == num_tabs + 1
+    assert results.resultsModel.rowCount() == 3
+
+    # An empty final page finishes the stream without another tab
+    w.updateResults((None, None))
+    assert w.streamingResults is None
+    assert w.count() == num_tabs + 1
+
+    # A query with no results at all still gets its (empty) tab
+    w.updateResults((None, None))
+    assert w.count() == num_tabs + 2
+
+    # Pages that arrive after the streaming tab was closed (the query being
+    # cancelled) are dropped until the query finishes
+    w.addResultsPage((None, [Result(0)]))
+    w.closeTab(w.indexOf(w.streamingResults))
+    w.addResultsPage((None, [Result(1)]))
+    assert w.streamingResults is None
+    assert w.count() == num_tabs + 2
+    w.finishResults()
+    w.addResultsPage((None, [Result(0)]))
+    assert w.count() == num_tabs + 3
+
 def test_query_form(qtbot):
     w = QueryForm()
     qtbot.addWidget(w)
@@ -0,0 +1,95 @@
+import numpy as np
+
+from speechtools.discourse import AnnotationStore
+from speechtools.plot.helper import (generate_boundaries, BoundaryIndex, track_array, track_slice,
+                                    voiced_segments, voiced_points)
+
+class Hierarchy(object):
+    highest = 'word'
+    lowest = 'phone'
+    highest_to_lowest = ['word', 'phone']
+    subannotations = {'phone': ['burst']}
+
+    def keys(self):
+        return self.highest_to_lowest
+
+    def get_lower_types(self, a_type):
+        return self.highest_to_lowest[self.highest_to_lowest.index(a_type) + 1:]
+
+class Annotation(object):
+    def __init__(self, a_type, begin, end, label, **children):
+        self._type = a_type
+        self.id = '{}-{}'.format(a_type, begin)
+        self.begin = begin
+        self.end = end
+        self.label = label
+        for k, v in children.items():
+            setattr(self, k, v)
+
+def make_word(begin):
+    bursts = [Annotation('burst', begin, begin + 0.05, None)]
+    phones = [Annotation('phone', begin, begin + 0.5, 'p', burst = bursts),
+                Annotation('phone', begin + 0.5, begin + 1, 'a', burst = [])]
+    return Annotation('word', begin, begin + 1, 'pa', phone = phones)
+
+def test_generate_boundaries():
+    hierarchy = Hierarchy()
+    words = [make_word(0), make_word(1), make_word(2)]
+    store = AnnotationStore(hierarchy)
+    store.add(words)
+    lines, text, owners = generate_boundaries(store, hierarchy, 1.2, 2.8)
+    assert lines['word'].dtype == np.float32
+    assert lines['word'].shape == (8, 2)
+    assert text['word'][0] == ['pa', 'pa']
+    assert text['phone'][0] == ['p', 'a', 'p', 'a']
+    assert text['phone'][2].tolist() == [0.5, 0.5, 0.5, 0.5]
+    assert lines['phone'].shape == (16, 2)
+    assert lines['phone'][0].tolist() == [1, 0]
+    assert lines['phone', 'burst'].shape == (6, 2)
+    assert text['phone', 'burst'][0] == ['']
+    assert text['phone', 'burst'][1][0, 0] == np.float32(2.025)
+    assert owners['phone'].annotation(8) is words[2].phone[0]
+    assert owners['phone'].row(8) == 4
+    assert owners['phone', 'burst'].annotation(4) is words[2].phone[0].burst[0]
+    assert owners['phone', 'burst'].boundary_vertices(4) == (3, 6)
+    assert owners['phone'].boundary_vertices(9) == (8, 10)
+    assert owners['phone'].is_begin(1)
+    assert not owners['phone'].is_begin(2)
+
+    lines, text, owners = generate_boundaries(store, hierarchy, 1.5, 3, channel = 1)
+    assert lines['word'].shape == (0, 2)
+
+def test_voiced_tracks():
+    pitch = [(0, 0), (0.01, 100), (0.02, 110), (0.03, 0), (0.04, 120), (0.05, 130)]
+    track = track_array(pitch)
+    segments = voiced_segments(track, 100, 0.5)
+    assert segments.tolist() == [[1, 50], [2, 55], [4, 60], [5, 65]]
+    points = voiced_points(track, 100, 1)
+    assert points[:, 0].tolist() == [2, 5]
+    assert track_array(np.zeros((1000, 2)), 300).shape[0] == 250
+    assert voiced_segments(track_array(None), 1, 1).shape == (0, 2)
+    shifted = voiced_points(track_array(np.array(pitch)), 100, 1, xoffset = 0.5)
+    assert shifted[:, 0].tolist() == [2.5, 5.5]
+
+def test_track_slice():
+    track = np.array([[1.0, 100], [1.5, 110], [2.0, 0], [2.5, 120]])
+    view = track_slice(track, 1.4, 2.5)
+    assert np.allclose(view, [[0.1, 110], [0.6, 0]])
+    # The window fetched for the tracks is left as it was
+    assert track[1, 0] == 1.5
+    assert track_slice(track, 3, 4).shape == (0, 2)
+    assert track_slice(None, 0, 1) is None
+
+def test_boundary_index():
+    hierarchy = Hierarchy()
+    words = [make_word(0), make_word(1)]
+    store = AnnotationStore(hierarchy)
+    store.add(words)
+    lines, text, owners = generate_boundaries(store, hierarchy, 0, 2)
+    index = BoundaryIndex(lines['phone'], owners['phone'])
+    assert index.nearest(0.52, 0.05) == (2, words[0].phone[0])
+    assert index.nearest(1.01, 0.05) == (6, words[0].phone[1])
+    assert index.nearest(0.75, 0.05) == (-1, None)
+    sub_index = BoundaryIndex(lines['phone', 'burst'], owners['phone', 'burst'])
+    assert sub_index.nearest(1.06, 0.05) == (10, words[1].phone[0].burst[0])
+    assert BoundaryIndex(np.zeros((0, 2))).nearest(1, 1) == (-1, None)
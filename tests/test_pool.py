@@ -0,0 +1,153 @@
+import threading
+import time
+
+import pytest
+
+from speechtools import pool
+from speechtools.pool import ContextPool
+from speechtools.discourse import DiscourseCache
+from speechtools.fetch import inspect_window
+
+class Config(object):
+    def __init__(self, corpus_name = 'test'):
+        self.corpus_name = corpus_name
+        self.graph_host = 'localhost'
+        self.graph_port = 7474
+
+class FakeContext(object):
+    """Stands in for a CorpusContext, recording when it is closed"""
+    opened = []
+
+    def __init__(self, config):
+        self.config = config
+        self.closed = False
+        FakeContext.opened.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, exc_tb):
+        self.closed = True
+
+    def execute_cypher(self, statement):
+        if self.closed:
+            raise ValueError('closed')
+
+    hierarchy = None
+
+    def inspect_discourse(self, discourse, begin, end):
+        inspector = type('Inspector', (object,), {})()
+        inspector.name = discourse
+        return inspector
+
+@pytest.fixture
+def contexts(monkeypatch):
+    FakeContext.opened = []
+    monkeypatch.setattr(pool, 'CorpusContext', FakeContext)
+    return FakeContext.opened
+
+def test_reuse(contexts):
+    p = ContextPool()
+    config = Config()
+    with p.context(config) as c:
+        pass
+    with p.context(config) as c2:
+        assert c2 is c
+    assert len(contexts) == 1
+    assert not c.closed
+
+    # Contexts are pooled per config
+    with p.context(Config('other')) as c3:
+        assert c3 is not c
+
+    # Contexts that raised are closed rather than reused
+    with pytest.raises(ValueError):
+        with p.context(config) as c4:
+            raise ValueError()
+    assert c4.closed
+    with p.context(config) as c5:
+        assert c5 is not c4
+
+def test_max_size(contexts):
+    p = ContextPool(max_size = 2)
+    config = Config()
+    first = p.acquire(config)
+    second = p.acquire(config)
+    acquired = []
+    thread = threading.Thread(target = lambda: acquired.append(p.acquire(config)))
+    thread.start()
+    thread.join(0.1)
+    assert not acquired
+    p.release(config, first)
+    thread.join(1)
+    assert acquired == [first]
+    assert len(contexts) == 2
+
+def test_keep_alive(contexts):
+    p = ContextPool(keep_alive = 0.05)
+    config = Config()
+    c = p.acquire(config)
+    p.release(config, c)
+    time.sleep(0.1)
+    c2 = p.acquire(config)
+    assert c.closed
+    assert c2 is not c
+    assert p.num_open[pool.config_key(config)] == 1
+
+def test_health_check(contexts):
+    p = ContextPool(check_interval = 0)
+    config = Config()
+    c = p.acquire(config)
+    p.release(config, c)
+    c.closed = True
+    c2 = p.acquire(config)
+    assert c2 is not c
+    assert p.num_open[pool.config_key(config)] == 1
+
+def test_invalidate(contexts):
+    p = ContextPool()
+    config = Config()
+    idle = p.acquire(config)
+    in_use = p.acquire(config)
+    p.release(config, idle)
+    p.invalidate(config)
+    assert idle.closed
+
+    # Contexts in use when the corpus changed are closed on release
+    assert not in_use.closed
+    p.release(config, in_use)
+    assert in_use.closed
+    c = p.acquire(config)
+    assert c not in (idle, in_use)
+    p.release(config, c)
+    assert p.acquire(config) is c
+    assert p.num_open[pool.config_key(config)] == 1
+
+def test_detach(contexts):
+    p = ContextPool(max_size = 1)
+    config = Config()
+    with p.context(config) as c:
+        p.detach(config, c)
+    assert not c.closed
+
+    # A detached context is not handed out again, nor counted
+    with p.context(config) as c2:
+        assert c2 is not c
+    p.invalidate()
+    assert not c.closed
+
+def test_inspected_contexts_closed(contexts, monkeypatch):
+    p = ContextPool(max_size = 2)
+    monkeypatch.setattr(pool, '_pool', p)
+    config = Config()
+    cache = DiscourseCache(max_discourses = 3)
+    for i in range(20):
+        with pool.corpus_context(config) as c:
+            model = inspect_window(c, config, 'discourse{}'.format(i), 0, 10, columnar = False)
+        assert model.context is c
+        cache.put(config.corpus_name, model)
+    # Only the contexts of the models still cached are left open
+    assert len([c for c in contexts if not c.closed]) == 3
+    assert p.num_open[pool.config_key(config)] == 0
+    cache.clear()
+    assert all(c.closed for c in contexts)
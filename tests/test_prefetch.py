@@ -0,0 +1,317 @@
+import pytest
+
+from speechtools import prefetch
+from speechtools.prefetch import ContextPrefetcher, WindowPrefetcher
+
+class FakeWorker(object):
+    """Records the jobs a prefetcher starts instead of running them"""
+    def __init__(self):
+        self.started = []
+        self.params = None
+        self.stopped = 0
+
+    def setParams(self, kwargs):
+        self.params = kwargs
+
+    def start(self):
+        self.started.append(self.params)
+
+    def stop(self):
+        self.stopped += 1
+
+class DiscourseModel(object):
+    """Records whether a prefetched model has been closed"""
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def __eq__(self, other):
+        return other == 'model ' + self.name
+
+    def close(self):
+        self.closed = True
+
+def context_prefetcher(max_contexts = 2):
+    prefetcher = ContextPrefetcher(max_contexts = max_contexts)
+    prefetcher.set_config('config')
+    prefetcher.worker = FakeWorker()
+    return prefetcher
+
+def fetched(prefetcher):
+    kwargs = prefetcher.worker.started[-1]
+    key = (kwargs['discourse'], kwargs['begin'], kwargs['end'])
+    model = DiscourseModel(kwargs['discourse'])
+    prefetcher.contextFetched(key + (model, 'audio'))
+    return key
+
+def test_context_prefetcher_request(qtbot):
+    prefetcher = context_prefetcher()
+    prefetcher.request([('a', 0, 1), ('b', 0, 1)])
+    assert len(prefetcher.worker.started) == 1
+    assert prefetcher.in_flight == ('a', 0, 1)
+
+    # Requests while a context is in flight only replace the wanted list
+    prefetcher.request([('b', 0, 1), ('a', 0, 1)])
+    assert len(prefetcher.worker.started) == 1
+
+    assert fetched(prefetcher) == ('a', 0, 1)
+    assert prefetcher.worker.started[-1]['discourse'] == 'b'
+    assert fetched(prefetcher) == ('b', 0, 1)
+    assert prefetcher.in_flight is None
+    assert len(prefetcher.worker.started) == 2
+
+    assert prefetcher.take('a', 0, 1) == ('model a', 'audio')
+    assert prefetcher.take('a', 0, 1) is None
+    assert prefetcher.take('c', 0, 1) is None
+
+def test_context_prefetcher_stale(qtbot):
+    prefetcher = context_prefetcher()
+    prefetcher.request([('a', 0, 1)])
+    stale = DiscourseModel('z')
+    prefetcher.contextFetched(('z', 0, 1, stale, 'audio'))
+    assert prefetcher.in_flight == ('a', 0, 1)
+    assert prefetcher.take('z', 0, 1) is None
+    assert stale.closed
+
+def test_context_prefetcher_eviction(qtbot):
+    prefetcher = context_prefetcher(max_contexts = 2)
+    prefetcher.request([('a', 0, 1), ('b', 0, 1)])
+    fetched(prefetcher)
+    fetched(prefetcher)
+
+    # Wanted contexts that are cached count as used
+    a, b = [prefetcher.contexts[(x, 0, 1)][0] for x in 'ab']
+    prefetcher.request([('a', 0, 1), ('c', 0, 1)])
+    fetched(prefetcher)
+    assert list(prefetcher.contexts) == [('a', 0, 1), ('c', 0, 1)]
+    assert prefetcher.take('b', 0, 1) is None
+    # Evicted models are closed, while taken ones belong to the caller
+    assert b.closed
+    assert prefetcher.take('a', 0, 1)[0] is a
+    prefetcher.set_config('other')
+    assert not a.closed
+
+def test_context_prefetcher_failure(qtbot):
+    prefetcher = context_prefetcher()
+    errors = []
+    prefetcher.errorEncountered.connect(errors.append)
+    prefetcher.request([('a', 0, 1), ('b', 0, 1)])
+    prefetcher.fetchFailed('error')
+    assert errors == ['error']
+    assert prefetcher.wanted == [('b', 0, 1)]
+    assert prefetcher.in_flight == ('b', 0, 1)
+    assert prefetcher.worker.started[-1]['discourse'] == 'b'
+
+def test_context_prefetcher_set_config(qtbot):
+    prefetcher = context_prefetcher()
+    prefetcher.request([('a', 0, 1)])
+    fetched(prefetcher)
+    worker = prefetcher.worker
+    model = prefetcher.contexts[('a', 0, 1)][0]
+    prefetcher.set_config('other')
+    assert model.closed
+    assert worker.stopped == 1
+    assert prefetcher.take('a', 0, 1) is None
+    assert prefetcher.in_flight is None
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def time(self):
+        return self.now
+
+class Hierarchy(object):
+    highest_to_lowest = ['word', 'phone']
+    subannotations = {}
+    lowest = 'phone'
+
+class Model(object):
+    """Cached range of a discourse, as a prefetcher sees it"""
+    name = 'discourse'
+    hierarchy = Hierarchy()
+
+    def __init__(self, begin, end, duration = 1000):
+        self.cached_begin = begin
+        self.cached_end = end
+        self.duration = duration
+        self.detail = []
+
+    @property
+    def cached_to_begin(self):
+        return self.cached_begin <= 0
+
+    @property
+    def cached_to_end(self):
+        return self.cached_end >= self.duration
+
+    def detail_keys(self):
+        return ['phone']
+
+    def uncovered_detail(self, begin, end):
+        for b, e in self.detail:
+            if b <= begin < e:
+                begin = e
+        if end <= begin:
+            return None
+        return begin, end
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(prefetch, 'time', clock)
+    return clock
+
+def window_prefetcher(model, cache_window = 5, max_window = 120):
+    prefetcher = WindowPrefetcher(cache_window = cache_window, max_window = max_window)
+    prefetcher.set_discourse(model, 'config')
+    prefetcher.worker = FakeWorker()
+    prefetcher.detail_worker = FakeWorker()
+    ready = []
+    def extend(direction):
+        def add(results):
+            ready.append((direction, results))
+            begin, end = results
+            model.cached_begin = min(model.cached_begin, begin)
+            model.cached_end = max(model.cached_end, end)
+        return add
+    def replace(results):
+        ready.append(('replace', results))
+        model.cached_begin, model.cached_end = results
+    prefetcher.precedingReady.connect(extend('preceding'))
+    prefetcher.followingReady.connect(extend('following'))
+    prefetcher.replaceReady.connect(replace)
+    return prefetcher, ready
+
+def window_fetched(prefetcher):
+    kwargs = prefetcher.worker.started[-1]
+    data = ((kwargs['begin'], kwargs['end']), kwargs['discourse'], kwargs['begin'], kwargs['end'])
+    prefetcher.windowFetched(data)
+
+def test_window_prefetcher_plan(qtbot, clock):
+    model = Model(0, 60)
+    prefetcher, ready = window_prefetcher(model)
+
+    # Nothing is fetched while the view is well inside the cached range
+    prefetcher.update_view(20, 30)
+    assert prefetcher.worker.started == []
+
+    # Near the end of the cached range, the following window is fetched,
+    # with only the tiers drawn at the zoom of the view
+    clock.now += 1
+    prefetcher.update_view(50, 58)
+    kwargs = prefetcher.worker.started[-1]
+    assert prefetcher.velocity == pytest.approx(0.3 * 29)
+    assert kwargs['begin'] == 60
+    assert kwargs['end'] == pytest.approx(60 + 8 + 0.3 * 29 * 0.5 * 4)
+    assert kwargs['keys'] == ['word', 'phone']
+    assert prefetcher.in_flight[3] == 'following'
+
+    # Only one window is in flight at a time
+    clock.now += 1
+    prefetcher.update_view(52, 60)
+    assert len(prefetcher.worker.started) == 1
+
+    clock.now += 0.5
+    window_fetched(prefetcher)
+    assert ready == [('following', (60, kwargs['end']))]
+    assert prefetcher.latency == pytest.approx(0.3 * 1.5 + 0.7 * 0.5)
+
+def test_window_prefetcher_direction(qtbot, clock):
+    model = Model(100, 200)
+    prefetcher, ready = window_prefetcher(model)
+    prefetcher.update_view(150, 160)
+    # Panning backwards across a view that needs both sides fetches the
+    # preceding window first
+    for center in (140, 130, 120):
+        clock.now += 0.1
+        prefetcher.update_view(center - 5, center + 5)
+    assert prefetcher.velocity < 0
+    model.cached_end = 126
+    assert prefetcher.plan()[2] == 'preceding'
+    begin, end, _ = prefetcher.plan()
+    assert end == 100
+    assert begin == max(100 - prefetcher.window_size(), 0)
+
+def test_window_prefetcher_jump(qtbot, clock):
+    model = Model(0, 60)
+    prefetcher, ready = window_prefetcher(model)
+    prefetcher.update_view(50, 58)
+    window_fetched(prefetcher)
+    following = prefetcher.worker.started[-1]['end']
+    assert following - 60 < 2 * prefetcher.window_size()
+
+    # A jump far past the cached range fetches a fresh window around the
+    # view, not the whole gap
+    clock.now += 10
+    prefetcher.update_view(500, 510)
+    window = prefetcher.window_size()
+    kwargs = prefetcher.worker.started[-1]
+    assert (kwargs['begin'], kwargs['end']) == (500 - window, 510 + window)
+    window_fetched(prefetcher)
+    assert ready[-1] == ('replace', (500 - window, 510 + window))
+    assert model.cached_begin == 500 - window
+
+def test_window_size(qtbot, clock):
+    model = Model(0, 60)
+    prefetcher, ready = window_prefetcher(model, cache_window = 5, max_window = 120)
+    prefetcher.update_view(20, 22)
+    assert prefetcher.window_size() == 10
+    assert prefetcher.margin() == 5
+    # Fast panning with slow fetches widens the window, up to max_window
+    prefetcher.velocity = 10
+    prefetcher.latency = 1
+    assert prefetcher.window_size() == 42
+    assert prefetcher.margin() == 20
+    prefetcher.velocity = -100
+    assert prefetcher.window_size() == 120
+
+def test_window_prefetcher_stale(qtbot, clock):
+    model = Model(0, 60)
+    prefetcher, ready = window_prefetcher(model)
+    prefetcher.update_view(50, 58)
+    first = prefetcher.worker.started[-1]
+
+    # Windows fetched for a discourse or range that is no longer wanted are
+    # ignored
+    prefetcher.windowFetched(((0, 1), 'other', first['begin'], first['end']))
+    assert ready == []
+    assert prefetcher.in_flight is not None
+
+    # A window that no longer adjoins the cached range (after an eviction)
+    # is dropped and planned again from the new range
+    model.cached_end = 55
+    window_fetched(prefetcher)
+    assert ready == []
+    assert len(prefetcher.worker.started) == 2
+    assert prefetcher.worker.started[-1]['begin'] == 55
+
+    prefetcher.fetchFailed('error')
+    assert prefetcher.in_flight is None
+
+def test_window_prefetcher_detail(qtbot, clock):
+    model = Model(0, 60)
+    prefetcher, ready = window_prefetcher(model)
+    details = []
+    prefetcher.detailReady.connect(details.append)
+
+    # Detail tiers are only filled in for views zoomed in far enough to
+    # draw them
+    prefetcher.update_view(10, 40)
+    assert prefetcher.detail_worker.started == []
+    prefetcher.update_view(20, 25)
+    kwargs = prefetcher.detail_worker.started[-1]
+    assert (kwargs['begin'], kwargs['end'], kwargs['keys']) == (15, 30, ['phone'])
+
+    model.detail = [(15, 30)]
+    prefetcher.detailFetched(('window', 'discourse', 15, 30))
+    assert details == ['window']
+    assert prefetcher.detail_in_flight is None
+
+    # Detail for a range that has since been evicted is dropped
+    prefetcher.update_view(30, 35)
+    kwargs = prefetcher.detail_worker.started[-1]
+    assert (kwargs['begin'], kwargs['end']) == (30, 40)
+    model.cached_begin = 35
+    prefetcher.detailFetched(('late', 'discourse', 30, 40))
+    assert details == ['window']
@@ -0,0 +1,17 @@
+from speechtools.redraw import RedrawScheduler, SIGNAL, ANNOTATIONS, CURSORS
+
+def test_redraw_scheduler(qtbot):
+    flushed = []
+    redraw = RedrawScheduler(flushed.append, interval = 50)
+    redraw.flush()
+    for i in range(10):
+        redraw.mark(SIGNAL)
+    redraw.mark(ANNOTATIONS)
+    redraw.mark(CURSORS)
+    assert flushed == []
+    qtbot.waitUntil(lambda: len(flushed) == 1)
+    assert flushed[0] == {SIGNAL, ANNOTATIONS, CURSORS}
+    redraw.mark(CURSORS)
+    redraw.cancel()
+    qtbot.wait(100)
+    assert len(flushed) == 1
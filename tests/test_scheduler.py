@@ -0,0 +1,31 @@
+import pytest
+import time
+
+from speechtools.scheduler import JobScheduler, INTERACTIVE, BACKGROUND
+
+class DummyWorker(object):
+    def __init__(self, priority, supersede = False):
+        self.priority = priority
+        self.supersede = supersede
+        self.job = None
+        self.kwargs = None
+        self.ran = []
+
+    def run(self):
+        time.sleep(0.05)
+        self.ran.append(self.kwargs['index'])
+        self.job.done = True
+
+def test_scheduler(qtbot):
+    s = JobScheduler(max_threads = 2)
+    encoding = DummyWorker(BACKGROUND)
+    viewport = DummyWorker(INTERACTIVE, supersede = True)
+    s.submit(encoding, {'index': 0})
+    s.submit(encoding, {'index': 1})
+    for i in range(4):
+        s.submit(viewport, {'index': i})
+    s.wait()
+    assert encoding.ran == [0, 1]
+    assert viewport.ran[-1] == 3
+    assert len(viewport.ran) < 4
+    assert s.is_idle(encoding)
@@ -0,0 +1,75 @@
+import numpy as np
+from scipy.io import wavfile
+
+from speechtools.spectrogram import SpectrogramTiles, SpectrogramView
+
+def test_spectrogram_tiles(tmpdir):
+    sr = 16000
+    t = np.arange(2 * sr) / sr
+    signal = (np.sin(2 * np.pi * 1000 * t) * 16000).astype(np.int16)
+    path = str(tmpdir.join('test.wav'))
+    wavfile.write(path, sr, signal)
+
+    view = SpectrogramView(path, 0, 0.3, 1.7, sr, num_steps = 500)
+    assert view.hop == 32
+    tiles = SpectrogramTiles(frames_per_tile = 64)
+    assert tiles.image(view, compute = False) is None
+    image = tiles.image(view)
+    assert image.shape == (129, view.last_frame - view.first_frame)
+    assert tiles.is_cached(view)
+    assert np.argmax(image[:, 100]) == 16
+
+    whole = SpectrogramTiles(frames_per_tile = 2048).image(view)
+    assert np.allclose(image, whole, atol = 1e-3)
+
+    small = SpectrogramTiles(max_bytes = image.nbytes, frames_per_tile = 64)
+    small.image(view)
+    assert small.num_bytes <= image.nbytes
+    assert not small.is_cached(view)
+
+def test_spectrogram_view_for_canvas():
+    view = SpectrogramView.for_canvas('test.wav', 0, 0, 10, 16000, (1000, 300))
+    assert view.n_fft == 512
+    assert view.hop == 128
+    assert 500 < view.last_frame - view.first_frame < 2000
+    resized = SpectrogramView.for_canvas('test.wav', 0, 0, 10, 16000, (1100, 320))
+    assert resized.tile_key(0) == view.tile_key(0)
+    small = SpectrogramView.for_canvas('test.wav', 0, 0, 10, 16000, (300, 20))
+    assert small.n_fft == 128
+
+def test_spectrogram_track_alignment(tmpdir):
+    sr = 16000
+    signal = np.zeros(sr, dtype = np.int16)
+    click = 6410
+    signal[click] = 16000
+    path = str(tmpdir.join('test.wav'))
+    wavfile.write(path, sr, signal)
+
+    # The view begins partway into a frame
+    view = SpectrogramView(path, 0, 0.3013, 0.5, sr, num_steps = 100)
+    assert view.hop == 32
+    assert view.begin * sr / view.hop % 1 > 0.5
+    image = SpectrogramTiles(frames_per_tile = 64).image(view)
+    loudest = np.argmax(image.max(axis = 0))
+
+    # A track point at the time of the click is drawn over the frame that
+    # holds it
+    time = click / sr - view.begin
+    x = time * sr / view.hop + view.frame_offset
+    assert int(x) == loudest
+    assert int(time * sr / view.hop) != loudest
+
+def test_spectrogram_source_loads_unlocked(tmpdir, monkeypatch):
+    from speechtools import spectrogram
+    sr = 16000
+    path = str(tmpdir.join('test.wav'))
+    wavfile.write(path, sr, np.zeros(sr, dtype = np.int16))
+    tiles = SpectrogramTiles()
+    load_samples = spectrogram.load_samples
+    def check_unlocked(path):
+        assert not tiles._lock.locked()
+        return load_samples(path)
+    monkeypatch.setattr(spectrogram, 'load_samples', check_unlocked)
+    source = tiles.source(path)
+    assert source[0] == sr
+    assert tiles.source(path) is source
@@ -0,0 +1,78 @@
+
+import numpy as np
+from scipy.io import wavfile
+
+from speechtools.stream import StreamingSoundFile
+
+def test_streaming_sound_file(tmpdir):
+    sr = 1000
+    signal = np.zeros((60 * sr, 2), dtype = np.int16)
+    signal[:, 0] = np.arange(60 * sr) % 1000
+    path = str(tmpdir.join('test.wav'))
+    wavfile.write(path, sr, signal)
+
+    audio = StreamingSoundFile(path, block_size = 1024, cache_window = 1)
+    assert audio.duration == 60
+    audio.fill(10, 12, direction = 1)
+    assert audio.cached_begin <= 9
+    assert audio.cached_end >= 17
+    blocks = set(audio.blocks)
+
+    sig = audio.visible_signal(10, 11, 0)
+    assert sig.shape == (1000,)
+    assert np.allclose(sig * 32767, np.arange(1000))
+    assert np.shares_memory(sig, audio._window[1])
+    assert np.allclose(audio.visible_signal(10, 11, 1), 0)
+
+    audio.fill(12, 14, direction = 1)
+    assert blocks & set(audio.blocks) == blocks
+
+    # Ranges outside the window are silent, and not read in while drawing
+    cached = audio.cached_begin, audio.cached_end
+    sig = audio.visible_signal(40, 41, 0)
+    assert sig.shape == (1000,)
+    assert not sig.any()
+    assert (audio.cached_begin, audio.cached_end) == cached
+    sig = audio.visible_signal(audio.cached_end - 0.5, audio.cached_end + 0.5, 0)
+    assert sig.shape == (1000,)
+    assert sig[:500].any() and not sig[500:].any()
+    assert audio.visible_downsampled_100(40, 41, 0).shape == (100,)
+
+    # Clips are read in full
+    clip = audio.clip(40, 41)
+    assert np.allclose(clip[0] * 32767, np.arange(1000))
+
+    audio.fill(40, 41)
+    sig = audio.visible_signal(40, 41, 0)
+    assert audio.covers(40, 41)
+    assert sig.shape == (1000,)
+
+    preemph = audio.visible_preemph_signal(40, 41, 0)
+    assert np.allclose(preemph[1:], sig[1:] - 0.97 * sig[:-1])
+    assert audio.visible_downsampled_100(40, 41, 0).shape == (100,)
+    assert audio.downsampled_rate(100) == 100
+
+def test_evict(tmpdir):
+    sr = 1000
+    path = str(tmpdir.join('test.wav'))
+    wavfile.write(path, sr, np.zeros((60 * sr, 1), dtype = np.int16))
+
+    audio = StreamingSoundFile(path, block_size = 1000, cache_window = 1)
+    audio.fill(10, 40)
+    assert len(audio.blocks) == 32
+    assert audio.evict(20, 30)
+    assert sorted(audio.blocks) == list(range(20, 30))
+    assert (audio.cached_begin, audio.cached_end) == (20, 30)
+    assert audio.visible_signal(20, 30).shape == (10000,)
+    assert not audio.evict(20, 30)
+
+    # A trimmed window is a view of the old one
+    window = audio._window[1]
+    assert audio.evict(22, 30)
+    assert np.shares_memory(audio._window[1], window)
+
+    # Nothing that fill reads for a view is evicted for the same view
+    audio.fill(30, 32, direction = 1)
+    cached = audio.cached_begin, audio.cached_end
+    assert not audio.evict(*audio.reach(30, 32))
+    assert (audio.cached_begin, audio.cached_end) == cached
@@ -0,0 +1,94 @@
+import pytest
+import numpy as np
+from scipy.io import wavfile
+
+from speechtools import waveform
+from speechtools.waveform import (WaveformPyramid, DecodedAudioCache, load_samples, load_clip,
+                                    configure_decoded_cache, get_decoded_cache, AUDIO_CACHE_BYTES)
+
+def test_waveform_pyramid(tmpdir):
+    sr = 1000
+    signal = np.zeros((10 * sr, 2), dtype = np.int16)
+    signal[5000, 0] = 16000
+    signal[5001, 0] = -16000
+    path = str(tmpdir.join('test.wav'))
+    wavfile.write(path, sr, signal)
+    cache_dir = str(tmpdir.join('cache'))
+
+    pyramid = WaveformPyramid.build(path, cache_dir, base_size = 4, block_size = 1000)
+    assert pyramid.sizes[0] == 2500
+    assert pyramid.sizes[-1] == 1
+    top = pyramid.data[pyramid.offsets[-1], 0]
+    assert np.allclose(top, [-16000 / 32767, 16000 / 32767])
+
+    assert pyramid.level_for(4.9, 5.1, 1000) is None
+    level = pyramid.level_for(0, 10, 100)
+    assert pyramid.base_size * 2 ** level <= 100
+    envelope = pyramid.envelope(0, 10, 0, 100)
+    assert envelope.shape[0] >= 200
+    assert envelope[:, 1].max() > 0.48
+    assert envelope[:, 1].min() < -0.48
+    assert np.allclose(pyramid.envelope(0, 10, 1, 100)[:, 1], 0)
+
+    loaded = WaveformPyramid.load(path, cache_dir)
+    assert loaded.sizes == pyramid.sizes
+
+def test_decoded_audio_cache(tmpdir):
+    soundfile = pytest.importorskip('soundfile')
+    sr = 1000
+    signal = np.zeros((2 * sr, 2), dtype = np.float32)
+    signal[:, 0] = 0.5
+    paths = []
+    for i in range(3):
+        path = str(tmpdir.join('test{}.flac'.format(i)))
+        soundfile.write(path, signal, sr)
+        paths.append(path)
+    cache = DecodedAudioCache(str(tmpdir.join('cache')), max_bytes = int(2.5 * signal.nbytes))
+
+    loaded_sr, data = load_samples(paths[0], cache)
+    assert loaded_sr == sr
+    assert data.shape == (2 * sr, 2)
+    assert data.dtype == np.float32
+    assert np.allclose(data[:, 0], 0.5, atol = 1e-3)
+    assert cache.get(paths[0]) is not None
+
+    cache.load(paths[1])
+    cache.load(paths[2])
+    assert len(cache.entries()) == 2
+    assert cache.get(paths[0]) is None
+    assert cache.get(paths[2]) is not None
+
+    # Clips of compressed files are cut from the decoded copy
+    clip_sr, clip = load_clip(paths[2], 0.5, 1.5, cache = cache)
+    assert clip.shape == (1000,)
+    assert np.allclose(clip, 0.25, atol = 1e-3)
+    assert len(cache.entries()) == 2
+
+    cache.set_max_bytes(int(1.5 * signal.nbytes))
+    assert len(cache.entries()) == 1
+    assert cache.get(paths[2]) is not None
+
+def test_configure_decoded_cache(tmpdir, monkeypatch):
+    class Config(object):
+        audio_cache_bytes = 1024
+    monkeypatch.setattr(waveform, '_decoded_cache', DecodedAudioCache(str(tmpdir)))
+    configure_decoded_cache(Config())
+    assert get_decoded_cache().max_bytes == 1024
+    configure_decoded_cache(object())
+    assert get_decoded_cache().max_bytes == AUDIO_CACHE_BYTES
+
+def test_load_clip(tmpdir):
+    sr = 1000
+    signal = np.zeros((2 * sr, 2), dtype = np.int16)
+    signal[:, 0] = 16000
+    path = str(tmpdir.join('test.wav'))
+    wavfile.write(path, sr, signal)
+
+    clip_sr, clip = load_clip(path, 0.5, 1.5)
+    assert clip_sr == sr
+    assert clip.shape == (1000,)
+    assert np.allclose(clip, 8000 / 32767)
+
+    clip_sr, clip = load_clip(path, -0.5, 0.5, sr = 500)
+    assert clip_sr == 500
+    assert clip.shape == (250,)
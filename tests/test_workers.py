@@ -0,0 +1,88 @@
+import pytest
+
+from speechtools.workers import QueryWorker
+
+class Row(object):
+    def __init__(self, id):
+        self.id = id
+
+class Field(object):
+    def __gt__(self, value):
+        return lambda x: x.id > value
+
+class AnnotationType(object):
+    id = Field()
+
+class Query(object):
+    """Just enough of a graph query to be paged by id"""
+    def __init__(self, rows, log):
+        self.rows = rows
+        self.log = log
+
+    def filter(self, condition):
+        return Query([x for x in self.rows if condition(x)], self.log)
+
+    def order_by(self, field):
+        return Query(sorted(self.rows, key = lambda x: x.id), self.log)
+
+    def limit(self, limit):
+        self.log.append(len(self.rows))
+        return Query(self.rows[:limit], self.log)
+
+    def all(self):
+        return self.rows
+
+class Job(object):
+    stopped = False
+    done = False
+
+def streaming_worker(num_rows, page_size, call_back = None):
+    worker = QueryWorker()
+    worker.job = Job()
+    log = []
+    rows = [Row(i) for i in reversed(range(num_rows))]
+    worker.build_query = lambda c: (AnnotationType(), Query(rows, log))
+    worker.kwargs = {'page_size': page_size, 'streaming': True,
+                    'call_back': call_back or (lambda *args: None)}
+    pages = []
+    worker.pageReady.connect(lambda x: pages.append([r.id for r in x[1]]))
+    return worker, pages, log
+
+def test_stream_pages(qtbot):
+    worker, pages, log = streaming_worker(7, 3)
+    query, results = worker.stream_query(None)
+    assert results is None
+    assert pages == [[0, 1, 2], [3, 4, 5], [6]]
+    # Each page only queries past the last id of the one before
+    assert log == [7, 4, 1]
+    assert worker.kwargs['num_fetched'] == 7
+
+def test_stream_page_boundary(qtbot):
+    # A result count that is a multiple of the page size ends on an empty
+    # page, which is not emitted
+    worker, pages, log = streaming_worker(6, 3)
+    worker.stream_query(None)
+    assert pages == [[0, 1, 2], [3, 4, 5]]
+    assert log == [6, 3, 0]
+
+    worker, pages, log = streaming_worker(0, 3)
+    query, results = worker.stream_query(None)
+    assert pages == []
+    assert query is not None and results is None
+
+def test_stream_resume(qtbot):
+    # A retry after a connection error resumes after the last id emitted
+    worker, pages, log = streaming_worker(7, 3)
+    worker.kwargs['last_id'] = 2
+    worker.kwargs['num_fetched'] = 3
+    worker.stream_query(None)
+    assert pages == [[3, 4, 5], [6]]
+    assert worker.kwargs['num_fetched'] == 7
+
+def test_stream_cancel(qtbot):
+    def call_back(*args):
+        worker.job.stopped = True
+    worker, pages, log = streaming_worker(10, 3, call_back)
+    worker.stream_query(None)
+    assert pages == [[0, 1, 2]]
+    assert log == [10]